@@ -2,32 +2,71 @@
 认证依赖
 """
 
-from fastapi import Depends, HTTPException, status
+import os
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Session, make_transient_to_detached
 from ..models import User
+from ..utils.coherence import CoherentCache
 from ..utils.database import get_db
+from ..utils.sharding import route_to_user
 from ..utils.auth import decode_access_token
+from ..utils.statements import hot_statement
 
 security = HTTPBearer()
 
+# 认证用户缓存（按用户名，按用户缓存版本号校验）
+user_cache = CoherentCache("users")
+
+USER_BY_USERNAME = hot_statement(select(User).where(User.username == bindparam("username")).limit(1), username="")
+
+# 管理员用户名（逗号分隔），用于运维类接口
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+# 认证通过后，用户的列值快照记在请求 scope 的这个键下；批量请求的子请求带着它，不再重复解码令牌
+PRINCIPAL_SCOPE_KEY = "oblivionis.principal"
+
 async def get_current_user(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> User:
     """获取当前认证用户"""
-    token = credentials.credentials
-    username = decode_access_token(token)
+    snapshot = request.scope.get(PRINCIPAL_SCOPE_KEY)
+    if snapshot is None:
+        username = decode_access_token(credentials.credentials)
+        
+        def load():
+            user = db.execute(USER_BY_USERNAME, {"username": username}).scalar()
+            if user is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="用户不存在",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            return user.id, {column.key: getattr(user, column.key) for column in User.__table__.columns}
+        
+        snapshot = user_cache.get_or_load(username, load)
+        request.scope[PRINCIPAL_SCOPE_KEY] = snapshot
     
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    # 缓存的是列值快照，这里还原为当前会话中的持久化对象，不需要再查询
+    cached_user = User(**snapshot)
+    make_transient_to_detached(cached_user)
+    user = db.merge(cached_user, load=False)
+    # 分片模式下，之后对卡片等用户数据的访问路由到该用户所在分片
+    route_to_user(db, user.id)
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     """获取当前活跃用户（预留用于用户状态检查）"""
     return current_user
+
+async def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    """获取当前管理员用户"""
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限",
+        )
+    return current_user
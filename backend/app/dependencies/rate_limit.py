@@ -0,0 +1,257 @@
+"""
+限流与准入控制依赖
+
+- 按 用户 × 路由类别（draw / stats / bulk）的令牌桶限流
+- 重型接口的全局并发上限：超出时排队等待，等待超时或队列已满时返回 429；
+  排队超过请求的截止时间时返回 503
+- 被拒绝的请求带 Retry-After 响应头，计数写入 /metrics
+
+令牌桶限流默认关闭（RATE_LIMIT_ENABLED），并发上限默认开启（HEAVY_CONCURRENCY_LIMIT 为 0 时关闭）。
+
+请求被取消（客户端断开等）时，线程池中的同步代码不会停止。同步的重型接口用 @track_threadpool
+包装后在本模块的线程池中执行，名额等同步代码真正结束后才归还，并发上限因此限制的是实际在执行的计算。
+
+用法：
+    @router.get("/overview/{user_id}", dependencies=[Depends(admission("stats"))])
+    @track_threadpool
+    def get_user_overview(...): ...
+"""
+
+import asyncio
+import contextvars
+import functools
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+from fastapi import HTTPException, Request, status
+from ..utils.deadline import current_deadline
+from ..utils.metrics import registry
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+# 限流配置：每秒补充的令牌数和桶容量（突发量）
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "draw": (_env_float("RATE_LIMIT_DRAW_RATE", 1.0), _env_float("RATE_LIMIT_DRAW_BURST", 5)),
+    "stats": (_env_float("RATE_LIMIT_STATS_RATE", 5.0), _env_float("RATE_LIMIT_STATS_BURST", 20)),
+    "bulk": (_env_float("RATE_LIMIT_BULK_RATE", 0.5), _env_float("RATE_LIMIT_BULK_BURST", 5)),
+}
+
+# 重型接口并发配置
+HEAVY_CONCURRENCY_LIMIT = int(os.getenv("HEAVY_CONCURRENCY_LIMIT", "4"))
+HEAVY_QUEUE_MAX = int(os.getenv("HEAVY_QUEUE_MAX", "16"))
+HEAVY_QUEUE_TIMEOUT = _env_float("HEAVY_QUEUE_TIMEOUT", 2.0)
+
+# 令牌桶数量上限，超出时清理已回满的桶
+MAX_BUCKETS = 100_000
+
+# 同步重型接口的线程池
+_executor: Optional[ThreadPoolExecutor] = None
+
+registry.describe("rate_limit_allowed_total", "counter", "通过限流的请求数")
+registry.describe("rate_limit_rejected_total", "counter", "被限流拒绝的请求数")
+registry.describe("admission_shed_total", "counter", "因并发上限被拒绝的请求数")
+registry.describe("admission_in_flight", "gauge", "正在执行的重型请求数")
+registry.describe("admission_queued", "gauge", "排队等待的重型请求数")
+registry.describe("admission_wait_seconds", "histogram", "重型请求排队等待时间")
+
+class RateLimiter:
+    """令牌桶限流器（在事件循环中使用，无需加锁）"""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        self.limits = limits
+        self._buckets: Dict[Tuple[str, str], list] = {}
+
+    def acquire(self, route_class: str, principal: str) -> float:
+        """取一个令牌；成功返回 0，否则返回需要等待的秒数"""
+        rate, burst = self.limits[route_class]
+        now = time.monotonic()
+        key = (route_class, principal)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_BUCKETS:
+                self._prune(now)
+            bucket = self._buckets[key] = [burst, now]
+
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / rate if rate > 0 else 60.0
+
+    def _prune(self, now: float):
+        for key, (tokens, updated_at) in list(self._buckets.items()):
+            rate, burst = self.limits[key[0]]
+            if tokens + (now - updated_at) * rate >= burst:
+                del self._buckets[key]
+
+    def reset(self):
+        self._buckets.clear()
+
+class AdmissionController:
+    """重型接口的全局并发上限，带有限长度的等待队列"""
+
+    def __init__(self, limit: int, queue_max: int, queue_timeout: float):
+        self.limit = limit
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._loop = None
+        self._condition = None
+
+    @property
+    def _released(self) -> asyncio.Condition:
+        # Condition 绑定在创建它的事件循环上，按当前循环懒加载
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _report(self):
+        registry.set_gauge("admission_in_flight", self.in_flight)
+        registry.set_gauge("admission_queued", self.queued)
+
+    async def enter(self, route_class: str):
+        if self.in_flight < self.limit:
+            self.in_flight += 1
+            self._report()
+            return
+
+        if self.queued >= self.queue_max:
+            self._shed(route_class)
+
+        # 排队时间不超过请求剩余的截止时间
+        deadline = current_deadline()
+        remaining = deadline.remaining() if deadline is not None else None
+        timeout = self.queue_timeout if remaining is None else min(self.queue_timeout, remaining)
+
+        start = time.monotonic()
+        self.queued += 1
+        self._report()
+        try:
+            async with self._released:
+                await asyncio.wait_for(
+                    self._released.wait_for(lambda: self.in_flight < self.limit),
+                    timeout=timeout,
+                )
+                self.in_flight += 1
+        except asyncio.TimeoutError:
+            if timeout < self.queue_timeout:
+                registry.inc("admission_shed_total", {"route_class": route_class})
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="服务器繁忙，请求未能在截止时间内开始处理",
+                )
+            self._shed(route_class)
+        finally:
+            self.queued -= 1
+            self._report()
+            registry.observe("admission_wait_seconds", time.monotonic() - start, {"route_class": route_class})
+
+    async def leave(self):
+        async with self._released:
+            self.in_flight -= 1
+            self._released.notify()
+        self._report()
+
+    def _shed(self, route_class: str):
+        registry.inc("admission_shed_total", {"route_class": route_class})
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="服务器繁忙，请稍后再试",
+            headers={"Retry-After": str(max(1, math.ceil(self.queue_timeout)))},
+        )
+
+class _Slot:
+    """一个请求占用的并发名额：请求结束且线程池中的同步代码都已结束后才归还（在事件循环中使用）"""
+
+    def __init__(self):
+        self.pending = 0
+        self.closed = False
+
+    def start(self):
+        self.pending += 1
+
+    def finish(self):
+        self.pending -= 1
+        if self.closed and not self.pending:
+            asyncio.ensure_future(admission_controller.leave())
+
+    async def close(self):
+        self.closed = True
+        if not self.pending:
+            await admission_controller.leave()
+
+_current_slot: contextvars.ContextVar[Optional[_Slot]] = contextvars.ContextVar("admission_slot", default=None)
+
+def track_threadpool(func: Callable) -> Callable:
+    """
+    同步接口改为在线程池中执行，并让当前请求的并发名额保留到同步代码结束
+
+    名额在线程池任务的完成回调中归还：请求被取消时任务仍在执行（或排队中被取消），名额不会提前释放。
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        global _executor
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix="heavy")
+        loop = asyncio.get_running_loop()
+        slot = _current_slot.get()
+        context = contextvars.copy_context()
+        future = _executor.submit(context.run, functools.partial(func, *args, **kwargs))
+        if slot is not None:
+            slot.start()
+            future.add_done_callback(lambda _: loop.call_soon_threadsafe(slot.finish))
+        return await asyncio.wrap_future(future)
+    return wrapper
+
+rate_limiter = RateLimiter(RATE_LIMITS)
+admission_controller = AdmissionController(HEAVY_CONCURRENCY_LIMIT, HEAVY_QUEUE_MAX, HEAVY_QUEUE_TIMEOUT)
+
+def _principal(request: Request) -> str:
+    """限流主体：优先使用 user_id 参数，其次是认证令牌，最后是客户端地址"""
+    user_id = request.path_params.get("user_id") or request.query_params.get("user_id")
+    if user_id:
+        return f"user:{user_id}"
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return f"token:{authorization}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def admission(route_class: str):
+    """构造指定路由类别的限流 + 准入依赖"""
+    if route_class not in RATE_LIMITS:
+        raise ValueError(f"未知的路由类别: {route_class}")
+
+    async def dependency(request: Request):
+        if RATE_LIMIT_ENABLED:
+            retry_after = rate_limiter.acquire(route_class, _principal(request))
+            if retry_after:
+                registry.inc("rate_limit_rejected_total", {"route_class": route_class})
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="请求过于频繁，请稍后再试",
+                    headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+                )
+            registry.inc("rate_limit_allowed_total", {"route_class": route_class})
+
+        if HEAVY_CONCURRENCY_LIMIT <= 0:
+            yield
+            return
+
+        await admission_controller.enter(route_class)
+        slot = _Slot()
+        _current_slot.set(slot)
+        try:
+            yield
+        finally:
+            await slot.close()
+
+    return dependency
@@ -4,8 +4,18 @@ Oblivionis Backend - FastAPI Application Entry Point
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import cards, settings, users, draw, stats
+from .routers import cards, settings, users, draw, stats, metrics, admin, jobs, events, batch, leaderboards
 from .utils.database import create_tables
+from .services.job_service import job_runner
+from .utils.events import event_broker
+from .utils.group_commit import group_commit
+from .utils.statements import warm_statement_cache
+from .utils.snapshot import ANALYTICS_SNAPSHOT_ENABLED, snapshot_manager
+from .services import sync_service  # noqa: F401  注册卡片变更序号的 flush 钩子
+from .middleware.compression import CompressionMiddleware
+from .middleware.metrics import MetricsMiddleware
+from .middleware.deadline import DeadlineMiddleware
+from .middleware.idempotency import IdempotencyMiddleware
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -14,6 +24,15 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# 幂等键（放在压缩之内，保存和重放的都是未压缩的响应）
+app.add_middleware(IdempotencyMiddleware)
+
+# 响应压缩（按 Accept-Encoding 协商，小响应不压缩）
+app.add_middleware(CompressionMiddleware)
+
+# 请求截止时间（在 CORS 之内，超时返回的 504 也带跨域响应头）
+app.add_middleware(DeadlineMiddleware)
+
 # CORS 配置
 app.add_middleware(
     CORSMiddleware,
@@ -23,11 +42,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求指标（最外层，记录实际发送的响应大小）
+app.add_middleware(MetricsMiddleware)
+
 # 创建数据库表
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时创建数据库表"""
+    """应用启动时创建数据库表、预热热点语句的编译缓存，并启动后台任务执行器、事件分发和分析快照线程"""
     create_tables()
+    warm_statement_cache()
+    job_runner.start()
+    event_broker.start()
+    if ANALYTICS_SNAPSHOT_ENABLED:
+        snapshot_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止后台任务执行器、组提交写线程、事件分发和分析快照线程"""
+    job_runner.shutdown()
+    event_broker.shutdown()
+    group_commit.shutdown()
+    snapshot_manager.shutdown()
 
 # 注册路由
 app.include_router(users.router)
@@ -35,6 +70,12 @@ app.include_router(cards.router)
 app.include_router(settings.router)
 app.include_router(draw.router)
 app.include_router(stats.router)
+app.include_router(jobs.router)
+app.include_router(events.router)
+app.include_router(batch.router)
+app.include_router(leaderboards.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 # 根路径
 @app.get("/")
@@ -0,0 +1,164 @@
+"""
+响应压缩中间件
+
+- 根据 Accept-Encoding 协商 gzip / deflate
+- 小于阈值的响应体不压缩
+- 流式响应逐块压缩并 flush，不会缓冲整个响应
+- 路由可通过 compress_route 装饰器单独设置压缩级别（0 表示不压缩）
+"""
+
+import os
+import zlib
+from typing import Callable, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 压缩配置
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # 字节
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))  # 1-9
+
+# 支持的编码，按同等权重时的优先顺序排列
+SUPPORTED_ENCODINGS = ("gzip", "deflate")
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "text/",
+)
+
+def compress_route(level: int) -> Callable:
+    """
+    设置单个路由的压缩级别
+
+    用法：放在 @router.get(...) 之下
+        @router.get("/")
+        @compress_route(9)
+        async def endpoint(...): ...
+    """
+    def decorator(func: Callable) -> Callable:
+        func.compression_level = level
+        return func
+    return decorator
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """解析 Accept-Encoding，返回客户端可接受且权重最高的编码"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        parts = [part.strip() for part in item.split(";")]
+        coding = parts[0].lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        weights[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in SUPPORTED_ENCODINGS:
+        quality = weights.get(coding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+def _compressor(encoding: str, level: int):
+    """gzip 使用 gzip 封装，deflate 按 HTTP 规范使用 zlib 封装"""
+    wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+class CompressionMiddleware:
+    """按 Accept-Encoding 压缩 HTTP 响应的 ASGI 中间件"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE, level: int = COMPRESSION_LEVEL):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(scope, send, encoding, self.minimum_size, self.level)
+        await self.app(scope, receive, responder.send)
+
+class _CompressionResponder:
+    """包装 send，在第一个响应体分片到达时决定是否压缩"""
+
+    def __init__(self, scope: Scope, send: Send, encoding: str, minimum_size: int, level: int):
+        self.scope = scope
+        self.downstream = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.default_level = level
+        self.start_message: Optional[Message] = None
+        self.compressor = None
+        self.passthrough = False
+
+    def route_level(self) -> int:
+        """路由匹配后 scope 中会带有 endpoint，读取其压缩级别"""
+        endpoint = self.scope.get("endpoint")
+        return getattr(endpoint, "compression_level", self.default_level)
+
+    def should_compress(self, headers: MutableHeaders, level: int) -> bool:
+        if level <= 0 or "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # 等待第一个响应体分片，才能判断大小和是否流式
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self.downstream(message)
+            return
+
+        if self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            level = self.route_level()
+            small = not more_body and len(body) < self.minimum_size
+            if small or not self.should_compress(headers, level):
+                self.passthrough = True
+                await self.downstream(self.start_message)
+                await self.downstream(message)
+                return
+
+            self.compressor = _compressor(self.encoding, level)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+
+            if not more_body:
+                compressed = self.compressor.compress(body) + self.compressor.flush()
+                headers["Content-Length"] = str(len(compressed))
+                await self.downstream(self.start_message)
+                await self.downstream({"type": "http.response.body", "body": compressed})
+                return
+
+            # 流式响应：长度未知，逐块压缩并立即发送
+            del headers["Content-Length"]
+            await self.downstream(self.start_message)
+
+        if more_body:
+            chunk = self.compressor.compress(body) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            chunk = self.compressor.compress(body) + self.compressor.flush()
+        await self.downstream({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -0,0 +1,144 @@
+"""
+请求截止时间中间件
+
+按路径前缀为请求设置截止时间（见 utils/deadline.py），并在截止时间内执行路由：
+- 超时时还没开始响应：返回 504，取消路由的执行；线程池或组提交写线程中正在执行的 SQL
+  语句由 SQLite 进度回调中止，连接随即释放
+- 执行中有语句因超时被中止：路由自己的错误响应（如 except Exception 转成的 400）替换为 504
+- 客户端在响应前断开：取消路由的执行并中止其 SQL 语句，不再发送响应
+
+断开检测：请求体读完后（没有请求体的请求从一开始）由后台任务接管 receive，收到
+http.disconnect 时取消。直接在事件循环中执行同步 SQL 的 async 路由会阻塞检测，这时只能
+依靠进度回调在截止时间到达时中止语句。
+"""
+
+import asyncio
+import json
+import logging
+from typing import List, Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..utils.deadline import Deadline, bind_deadline, deadline_for_path, unbind_deadline
+from ..utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+_TIMEOUT_BODY = json.dumps({"detail": "请求处理超时"}, ensure_ascii=False).encode("utf-8")
+
+def _has_body(scope: Scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"transfer-encoding" or (name == b"content-length" and value.strip() not in (b"", b"0")):
+            return True
+    return False
+
+class DeadlineMiddleware:
+    """为请求设置截止时间的 ASGI 中间件"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        prefix, seconds = deadline_for_path(scope["path"])
+        if seconds is None:
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(seconds)
+        token = bind_deadline(deadline)
+        try:
+            await self._run(scope, receive, send, deadline, seconds, prefix)
+        finally:
+            unbind_deadline(token)
+
+    async def _run(self, scope: Scope, receive: Receive, send: Send, deadline: Deadline, seconds: float, prefix: str):
+        response_started = False
+        response_finished = False
+        replaced = False
+        pending: List[Message] = []
+        disconnected = asyncio.Event()
+        watcher: Optional[asyncio.Task] = None
+        app_task: Optional[asyncio.Task] = None
+
+        async def watch():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    break
+                pending.append(message)
+            disconnected.set()
+            if not response_finished:
+                deadline.cancelled = True
+                registry.inc("request_disconnects_total", {"prefix": prefix})
+                if app_task is not None:
+                    app_task.cancel()
+
+        def start_watching():
+            nonlocal watcher
+            if watcher is None:
+                watcher = asyncio.get_running_loop().create_task(watch())
+
+        async def app_receive() -> Message:
+            if watcher is not None:
+                if pending:
+                    return pending.pop(0)
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                start_watching()
+            return message
+
+        async def send_timeout():
+            nonlocal response_started, response_finished, replaced
+            replaced = response_started = response_finished = True
+            await send({
+                "type": "http.response.start",
+                "status": 504,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(_TIMEOUT_BODY)).encode())],
+            })
+            await send({"type": "http.response.body", "body": _TIMEOUT_BODY})
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started, response_finished
+            if replaced or deadline.cancelled:
+                return
+            if message["type"] == "http.response.start":
+                if deadline.interrupted:
+                    # 路由把被中止的语句当作普通错误处理了，统一返回 504
+                    registry.inc("request_deadline_exceeded_total", {"prefix": prefix})
+                    await send_timeout()
+                    return
+                response_started = True
+                deadline.expires_at = None
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_finished = True
+            await send(message)
+
+        if not _has_body(scope):
+            start_watching()
+        app_task = asyncio.get_running_loop().create_task(self.app(scope, app_receive, send_wrapper))
+        try:
+            done, _ = await asyncio.wait({app_task}, timeout=seconds)
+            if not done and not response_started:
+                registry.inc("request_deadline_exceeded_total", {"prefix": prefix})
+                logger.warning("请求超过截止时间 %.1fs: %s %s", seconds, scope["method"], scope["path"])
+                await send_timeout()
+                app_task.cancel()
+            try:
+                await app_task
+            except asyncio.CancelledError:
+                if not (replaced or deadline.cancelled):
+                    raise
+            except Exception:
+                if not (deadline.interrupted or deadline.cancelled):
+                    raise
+                if not response_started:
+                    registry.inc("request_deadline_exceeded_total", {"prefix": prefix})
+                    await send_timeout()
+        finally:
+            if not app_task.done():
+                app_task.cancel()
+            if watcher is not None and not watcher.done():
+                watcher.cancel()
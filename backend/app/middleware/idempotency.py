@@ -0,0 +1,205 @@
+"""
+幂等键中间件
+
+客户端为可能重试的写请求附带 Idempotency-Key 请求头：
+- 第一次请求正常执行，成功（2xx）的响应保存在有容量上限、按 TTL 过期的存储中
+- 之后带相同键的重试直接返回保存的响应，不再重复执行抽题或插入
+- 并发的重复请求等待正在执行的那一个完成后再返回其结果
+- 相同的键配上不同的请求体会返回 422
+
+只有用 idempotent 装饰器标记的路由才会启用，未携带请求头的请求不受影响。
+存储位于进程内，多个 worker 之间不共享。
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 幂等键配置
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+def idempotent(func: Callable) -> Callable:
+    """
+    标记路由支持 Idempotency-Key
+
+    用法：放在 @router.post(...) 之下
+    """
+    func.idempotent = True
+    return func
+
+@dataclass
+class _Record:
+    fingerprint: str
+    expires_at: float
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    status: Optional[int] = None
+    headers: List[Tuple[bytes, bytes]] = field(default_factory=list)
+    body: bytes = b""
+
+class IdempotencyStore:
+    """按插入顺序淘汰、按 TTL 过期的幂等响应存储"""
+
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._records: "OrderedDict[str, _Record]" = OrderedDict()
+
+    def _purge(self, now: float):
+        # TTL 固定，最早插入的记录总是最先过期
+        while self._records:
+            record = next(iter(self._records.values()))
+            if record.expires_at > now and len(self._records) <= self.max_entries:
+                break
+            self._records.popitem(last=False)
+
+    def get(self, key: str) -> Optional[_Record]:
+        self._purge(time.monotonic())
+        return self._records.get(key)
+
+    def begin(self, key: str, fingerprint: str) -> _Record:
+        record = _Record(fingerprint=fingerprint, expires_at=time.monotonic() + self.ttl)
+        self._records[key] = record
+        self._purge(time.monotonic())
+        return record
+
+    def discard(self, key: str, record: _Record):
+        if self._records.get(key) is record:
+            del self._records[key]
+
+    def clear(self):
+        self._records.clear()
+
+idempotency_store = IdempotencyStore()
+
+class IdempotencyMiddleware:
+    """为标记了 idempotent 的路由处理 Idempotency-Key"""
+
+    def __init__(self, app: ASGIApp, store: IdempotencyStore = idempotency_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None or not self._is_idempotent_route(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await JSONResponse({"detail": "无效的 Idempotency-Key"}, status_code=400)(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        # 键的作用域：同一路径、同一调用者（认证头和查询参数）
+        store_key = hashlib.sha256("\0".join([
+            scope["path"],
+            scope.get("query_string", b"").decode("latin-1"),
+            headers.get("authorization", ""),
+            idempotency_key,
+        ]).encode("utf-8")).hexdigest()
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            record = self.store.get(store_key)
+            if record is None:
+                break
+            if record.fingerprint != fingerprint:
+                await JSONResponse(
+                    {"detail": "Idempotency-Key 已用于内容不同的请求"}, status_code=422
+                )(scope, receive, send)
+                return
+            if record.status is not None:
+                await self._replay(record, send)
+                return
+            # 相同请求正在执行，等待其完成
+            try:
+                await asyncio.wait_for(record.done.wait(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                await JSONResponse(
+                    {"detail": "相同 Idempotency-Key 的请求仍在处理中"}, status_code=409
+                )(scope, receive, send)
+                return
+
+        record = self.store.begin(store_key, fingerprint)
+        try:
+            await self._execute(scope, body, receive, send, record)
+        finally:
+            if record.status is None:
+                # 执行失败或响应不可保存：移除记录，让重试重新执行
+                self.store.discard(store_key, record)
+            record.done.set()
+
+    def _is_idempotent_route(self, scope: Scope) -> bool:
+        router = scope["app"].router
+        for route in router.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(child_scope.get("endpoint"), "idempotent", False)
+        return False
+
+    async def _read_body(self, receive: Receive) -> bytes:
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        return b"".join(chunks)
+
+    async def _execute(self, scope: Scope, body: bytes, receive: Receive, send: Send, record: _Record):
+        body_sent = False
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # 请求体已读完，之后只可能是断开连接
+            return await receive()
+
+        status = None
+        response_headers: List[Tuple[bytes, bytes]] = []
+        chunks: List[bytes] = []
+
+        async def capture_send(message: Message) -> None:
+            nonlocal status, response_headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False) and status is not None and 200 <= status < 300:
+                    record.headers = response_headers
+                    record.body = b"".join(chunks)
+                    record.status = status
+            await send(message)
+
+        await self.app(scope, replay_receive, capture_send)
+
+    async def _replay(self, record: _Record, send: Send):
+        await send({
+            "type": "http.response.start",
+            "status": record.status,
+            "headers": record.headers + [(b"idempotent-replayed", b"true")],
+        })
+        await send({"type": "http.response.body", "body": record.body})
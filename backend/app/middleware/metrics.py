@@ -0,0 +1,84 @@
+"""
+请求指标中间件
+
+为每个 HTTP 请求绑定 RequestStats，记录耗时、状态码、响应大小，
+以及由数据库钩子累计的 SQL 语句数和数据库耗时。
+
+管理员请求带 X-Profile: 1 请求头（或按 PROFILE_SAMPLE_RATE 抽中）时同时剖析该请求，
+响应头 X-Profile-Id 给出剖析记录的ID（见 utils/profiling.py）。
+"""
+
+import random
+import time
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..utils.auth import decode_access_token
+from ..utils.metrics import RequestStats, bind_request, unbind_request, record_request
+from ..utils.profiling import PROFILE_SAMPLE_RATE, finish_profile, start_profile
+from ..dependencies.auth import ADMIN_USERNAMES
+
+PROFILE_HEADER = b"x-profile"
+
+def _is_admin(headers) -> bool:
+    for name, value in headers:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return False
+            try:
+                return decode_access_token(token) in ADMIN_USERNAMES
+            except HTTPException:
+                return False
+    return False
+
+def profile_trigger(scope: Scope):
+    """是否剖析该请求：请求头触发（仅管理员）/ 抽样 / None"""
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            if value not in (b"", b"0") and _is_admin(scope["headers"]):
+                return "header"
+            break
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+class MetricsMiddleware:
+    """记录请求级指标的 ASGI 中间件"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(method=scope["method"], path=scope["path"], scope=scope)
+        token = bind_request(stats)
+        trigger = profile_trigger(scope)
+        if trigger is not None:
+            start_profile(stats, trigger)
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                stats.status_code = message["status"]
+                if stats.profile is not None:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-profile-id", stats.profile.id.encode("ascii"))
+                    ]
+            elif message["type"] == "http.response.body":
+                stats.response_size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            stats.status_code = 500
+            raise
+        finally:
+            unbind_request(token)
+            duration = time.perf_counter() - start
+            record_request(stats, duration)
+            if stats.profile is not None:
+                finish_profile(stats, duration)
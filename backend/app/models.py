@@ -2,10 +2,11 @@
 数据库模型
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, Text, ForeignKey, JSON, Index, LargeBinary, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
+from .utils.column_types import CompressedText
 
 Base = declarative_base()
 
@@ -54,13 +55,149 @@ class MemoryCard(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text, nullable=False)
+    content_preview = Column(String(60), nullable=True)  # 列表和统计使用的内容摘要，写入时生成
     card_type = Column(String(50), nullable=False)
-    notes = Column(Text, nullable=True)
+    notes = Column(CompressedText, nullable=True)  # 较长的备注压缩存储
     owner = Column(Integer, ForeignKey('users.id'), nullable=False)
     appear_count = Column(Integer, default=0)
     last_appeared_session = Column(Integer, nullable=True)
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0")  # 单调递增的变更序号，用于增量同步
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
     # 关系定义
     owner_user = relationship("User", back_populates="memory_cards")
+    
+    __table_args__ = (
+        Index("ix_memory_cards_owner_change_seq", "owner", "change_seq"),
+    )
+
+# 内容摘要长度
+PREVIEW_LENGTH = 50
+
+def make_content_preview(content):
+    """生成内容摘要（超出长度时截断并加省略号）"""
+    if content is None:
+        return None
+    return content[:PREVIEW_LENGTH] + "..." if len(content) > PREVIEW_LENGTH else content
+
+@event.listens_for(MemoryCard.content, "set")
+def _update_content_preview(target, value, oldvalue, initiator):
+    target.content_preview = make_content_preview(value)
+
+class CardTombstone(Base):
+    """已删除卡片的墓碑记录，供增量同步通知客户端删除"""
+    __tablename__ = "card_tombstones"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    card_id = Column(Integer, nullable=False)
+    owner = Column(Integer, ForeignKey('users.id'), nullable=False)
+    change_seq = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (
+        Index("ix_card_tombstones_owner_change_seq", "owner", "change_seq"),
+    )
+
+class CardTag(Base):
+    """卡片标签（多对多），冗余存储所属用户便于按用户查询和分片"""
+    __tablename__ = "card_tags"
+    
+    card_id = Column(Integer, ForeignKey('memory_cards.id'), primary_key=True)
+    tag = Column(String(50), primary_key=True)
+    owner = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_card_tags_owner_tag", "owner", "tag"),
+    )
+
+class TagBitmap(Base):
+    """每个用户每个标签的卡片ID位图（zlib 压缩），由 card_tags 派生，在同一事务中维护"""
+    __tablename__ = "tag_bitmaps"
+    
+    owner = Column(Integer, primary_key=True)
+    tag = Column(String(50), primary_key=True)
+    bitmap = Column(LargeBinary, nullable=False)
+    card_count = Column(Integer, nullable=False, default=0)
+    revision = Column(Integer, nullable=False, default=0)  # 变更序号，用于增量刷新内存中的位图
+    
+    __table_args__ = (
+        Index("ix_tag_bitmaps_owner_revision", "owner", "revision"),
+    )
+
+class CardSignature(Base):
+    """卡片内容的 MinHash 签名（见 utils/minhash.py），在修改内容的同一事务中维护"""
+    __tablename__ = "card_signatures"
+    
+    card_id = Column(Integer, ForeignKey('memory_cards.id'), primary_key=True)
+    owner = Column(Integer, nullable=False, index=True)
+    signature = Column(LargeBinary, nullable=False)
+
+class CardLshBucket(Base):
+    """LSH 分带索引：(用户, 带, 该带签名的哈希) -> 卡片，同一桶中的卡片是近似重复的候选"""
+    __tablename__ = "card_lsh_buckets"
+    
+    owner = Column(Integer, primary_key=True)
+    band = Column(Integer, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    card_id = Column(Integer, primary_key=True)
+    
+    __table_args__ = (
+        Index("ix_card_lsh_buckets_card", "card_id"),
+    )
+
+class SyncCounter(Base):
+    """命名的单调计数器（如卡片变更序号）"""
+    __tablename__ = "sync_counters"
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class CacheVersion(Base):
+    """按用户的缓存版本号，用户相关数据每次写入时递增，供各工作进程校验进程内缓存"""
+    __tablename__ = "cache_versions"
+    
+    user_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    seq = Column(Integer, nullable=False, default=0, index=True)  # 全局递增，用于增量读取变化
+
+class EventLogEntry(Base):
+    """实时事件日志：开启多进程事件分发时，各工作进程写入并轮询该表，把其他进程发布的事件推送给本进程的订阅者"""
+    __tablename__ = "event_log"
+    __table_args__ = {"sqlite_autoincrement": True}  # 清理旧事件后ID也不会重复使用
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    event_type = Column(String(50), nullable=False)
+    data = Column(Text, nullable=False)  # JSON
+    created_at = Column(Float, nullable=False, index=True)  # Unix 时间戳
+
+class LeaderboardEntry(Base):
+    """排行榜计数：(计数器, 时间桶, 用户) -> 分数，由抽题路径在同一事务中更新"""
+    __tablename__ = "leaderboard_entries"
+
+    counter = Column(String(20), primary_key=True)  # sessions/cards/streak
+    period = Column(String(20), primary_key=True)  # 周（2026-W42）或日（2026-10-19）
+    user_id = Column(Integer, primary_key=True)
+    score = Column(Integer, nullable=False, default=0)
+    seq = Column(Integer, nullable=False, default=0, index=True)  # 全局递增，各进程据此增量刷新排名结构
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    job_type = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending/running/succeeded/failed/cancelled
+    progress = Column(Integer, default=0)  # 0-100
+    progress_message = Column(String(255), nullable=True)
+    params = Column(JSON)
+    result = Column(JSON, nullable=True)
+    result_location = Column(String(255), nullable=True)  # 结果文件路径（如导出文件）
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    worker_id = Column(String(100), nullable=True)  # 领取任务的工作进程
+    heartbeat_at = Column(DateTime, nullable=True)  # 执行中由领取的工作进程定期更新
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
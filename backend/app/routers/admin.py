@@ -0,0 +1,62 @@
+"""
+管理相关API路由（需要管理员权限）
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from ..models import User
+from ..utils.profiling import profile_store
+from ..utils.slow_query import slow_query_log
+from ..dependencies.auth import get_current_admin_user
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    full_scan_only: bool = Query(False, description="只返回存在全表扫描的记录"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """获取最近的慢查询记录（含执行计划）"""
+    entries = slow_query_log.entries(limit=limit, full_scan_only=full_scan_only)
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "total": len(entries),
+        "entries": entries
+    }
+
+@router.delete("/slow-queries")
+async def clear_slow_queries(current_user: User = Depends(get_current_admin_user)):
+    """清空慢查询记录"""
+    slow_query_log.clear()
+    return {"message": "慢查询记录已清空"}
+
+@router.get("/profiles")
+async def list_profiles(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """最近的请求剖析记录摘要（请求带 X-Profile: 1 头，或按 PROFILE_SAMPLE_RATE 抽样）"""
+    entries = profile_store.summaries(limit)
+    return {"total": len(entries), "entries": entries}
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, current_user: User = Depends(get_current_admin_user)):
+    """剖析记录详情：SQL 语句及耗时、折叠格式的调用栈"""
+    record = profile_store.load(profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="剖析记录不存在")
+    return record
+
+@router.get("/profiles/{profile_id}/folded", response_class=PlainTextResponse)
+async def get_profile_folded(profile_id: str, current_user: User = Depends(get_current_admin_user)):
+    """折叠格式的调用栈，可直接用 flamegraph.pl 或 speedscope 生成火焰图"""
+    record = profile_store.load(profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="剖析记录不存在")
+    return PlainTextResponse(record["folded"])
+
+@router.delete("/profiles")
+async def clear_profiles(current_user: User = Depends(get_current_admin_user)):
+    """删除全部剖析记录"""
+    return {"message": "剖析记录已删除", "deleted": profile_store.clear()}
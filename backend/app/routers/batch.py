@@ -0,0 +1,185 @@
+"""
+批量请求API路由
+
+页面加载时需要的多个接口可以合并为一次请求：
+
+    POST /api/batch
+    {"requests": [{"id": "settings", "path": "/api/settings/1"},
+                  {"id": "overview", "path": "/api/stats/overview/1"}],
+     "parallel": true}
+
+子请求在进程内直接交给路由分发（不再经过压缩、幂等等中间件），参数校验、限流和
+异常处理与单独请求时相同。所有子请求共用批量请求认证得到的用户（不再重复解码令牌），
+按顺序在同一个数据库会话中执行；parallel 为 true 时，相邻的 GET 子请求并发执行，
+各自使用独立的会话（Session 不能跨线程共用），写请求仍按顺序在共用会话中执行。
+
+响应按请求顺序返回 {"responses": [{"id", "status", "headers", "body"}]}，
+某个子请求失败不影响其他子请求。
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+from starlette.middleware.exceptions import ExceptionMiddleware
+from ..models import User
+from ..schemas import BatchRequest, BatchSubRequest
+from ..utils.database import SHARED_SESSION_SCOPE_KEY, SessionLocal, get_db
+from ..utils.metrics import registry
+from ..utils.sharding import route_to_user
+from ..dependencies.auth import PRINCIPAL_SCOPE_KEY, get_current_active_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/batch", tags=["batch"])
+
+# 一次批量请求最多的子请求数
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+
+ALLOWED_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE"}
+# 不能放进批量请求的路径：批量请求本身和长连接的事件流
+EXCLUDED_PREFIXES = ("/api/batch", "/api/events")
+# 不转发给子请求的请求头（请求体和压缩由批量请求自己处理）
+_DROPPED_HEADERS = {b"content-length", b"content-type", b"accept-encoding", b"idempotency-key"}
+# 不返回给调用方的子响应头
+_OMITTED_RESPONSE_HEADERS = {"content-length", "content-type"}
+# 从批量请求复制到子请求的 scope 字段
+_INHERITED_SCOPE_KEYS = ("type", "asgi", "http_version", "scheme", "server", "client", "root_path", "app")
+
+registry.describe("batch_requests_total", "counter", "批量请求数")
+registry.describe("batch_subrequests_total", "counter", "批量请求中执行的子请求数")
+
+def _dispatcher(request: Request):
+    """路由外面只套上应用的异常处理（HTTPException、参数校验错误等），跳过其余中间件"""
+    app = request.app
+    dispatcher = getattr(app.state, "batch_dispatcher", None)
+    if dispatcher is None:
+        handlers = {key: value for key, value in app.exception_handlers.items() if key not in (500, Exception)}
+        dispatcher = app.state.batch_dispatcher = ExceptionMiddleware(app.router, handlers=handlers)
+    return dispatcher
+
+def _validate(sub: BatchSubRequest):
+    path = sub.path.split("?", 1)[0]
+    if sub.method.upper() not in ALLOWED_METHODS:
+        raise HTTPException(status_code=400, detail=f"不支持的请求方法: {sub.method}")
+    if not path.startswith("/api/") or path.startswith(EXCLUDED_PREFIXES):
+        raise HTTPException(status_code=400, detail=f"不能批量执行的路径: {sub.path}")
+
+async def _dispatch(request: Request, sub: BatchSubRequest, db: Session, user_id: int) -> Dict[str, Any]:
+    """在进程内执行一个子请求，返回状态码、响应头和原始响应体"""
+    method = sub.method.upper()
+    path, _, query = sub.path.partition("?")
+    body = b"" if sub.body is None else json.dumps(sub.body, ensure_ascii=False).encode("utf-8")
+    headers = [(name, value) for name, value in request.scope["headers"] if name not in _DROPPED_HEADERS]
+    if sub.body is not None:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+
+    scope = {key: request.scope[key] for key in _INHERITED_SCOPE_KEYS if key in request.scope}
+    scope.update({
+        "method": method,
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": query.encode("utf-8"),
+        "headers": headers,
+        SHARED_SESSION_SCOPE_KEY: db,
+        PRINCIPAL_SCOPE_KEY: request.scope[PRINCIPAL_SCOPE_KEY],
+    })
+    # 上一个子请求可能按路径中的 user_id 改变了分片路由，先恢复为当前用户
+    route_to_user(db, user_id)
+
+    received = False
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    result = {"status": 500, "headers": {}, "body": b""}
+    chunks: List[bytes] = []
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            result["headers"] = {
+                name.decode("latin-1"): value.decode("latin-1") for name, value in message.get("headers", [])
+            }
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await _dispatcher(request)(scope, receive, send)
+        result["body"] = b"".join(chunks)
+    except Exception:
+        logger.exception("批量请求中的子请求失败: %s %s", method, sub.path)
+        result.update(status=500, headers={"content-type": "application/json"},
+                      body=json.dumps({"detail": "服务器内部错误"}, ensure_ascii=False).encode("utf-8"))
+    if result["status"] >= 400:
+        # 失败的子请求可能留下未提交的修改，不能被之后的子请求一并提交
+        db.rollback()
+    registry.inc("batch_subrequests_total", {"method": method, "status": str(result["status"] // 100) + "xx"})
+    return result
+
+async def _dispatch_isolated(request: Request, sub: BatchSubRequest, user_id: int) -> Dict[str, Any]:
+    """并发执行的读请求使用独立的会话"""
+    db = SessionLocal()
+    try:
+        return await _dispatch(request, sub, db, user_id)
+    finally:
+        db.close()
+
+def _encode_item(sub: BatchSubRequest, result: Dict[str, Any]) -> bytes:
+    """子响应的 JSON 响应体原样嵌入，不再解析一遍"""
+    content_type = result["headers"].get("content-type", "")
+    body = result["body"]
+    if not body:
+        body = b"null"
+    elif not content_type.startswith("application/json"):
+        body = json.dumps(body.decode("utf-8", "replace"), ensure_ascii=False).encode("utf-8")
+    headers = {name: value for name, value in result["headers"].items() if name not in _OMITTED_RESPONSE_HEADERS}
+    prefix = json.dumps({"id": sub.id, "status": result["status"], "headers": headers}, ensure_ascii=False)
+    return prefix[:-1].encode("utf-8") + b',"body":' + body + b"}"
+
+@router.post("")
+async def run_batch(
+    batch: BatchRequest,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """批量执行子请求，一次返回全部结果"""
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="子请求列表不能为空")
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"一次批量请求最多 {BATCH_MAX_REQUESTS} 个子请求")
+    for sub in batch.requests:
+        _validate(sub)
+    registry.inc("batch_requests_total", {"parallel": str(batch.parallel).lower()})
+
+    user_id = current_user.id
+    results: List[Dict[str, Any]] = []
+    index = 0
+    while index < len(batch.requests):
+        sub = batch.requests[index]
+        if batch.parallel and sub.method.upper() == "GET":
+            # 连续的 GET 子请求为一组并发执行
+            end = index
+            while end < len(batch.requests) and batch.requests[end].method.upper() == "GET":
+                end += 1
+            group = batch.requests[index:end]
+            if len(group) > 1:
+                results.extend(await asyncio.gather(*(_dispatch_isolated(request, item, user_id) for item in group)))
+            else:
+                results.append(await _dispatch(request, sub, db, user_id))
+            index = end
+        else:
+            results.append(await _dispatch(request, sub, db, user_id))
+            index += 1
+
+    content = b'{"responses":[' + b",".join(
+        _encode_item(sub, result) for sub, result in zip(batch.requests, results)
+    ) + b"]}"
+    return Response(content=content, media_type="application/json")
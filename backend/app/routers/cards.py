@@ -2,16 +2,59 @@
 记忆卡片相关API路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import os
+import uuid
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from starlette.requests import ClientDisconnect
+from typing import List, Literal, Optional
 from ..models import MemoryCard, User
-from ..schemas import MemoryCardCreate, MemoryCardBatchCreate, MemoryCardUpdate, MemoryCardResponse
+from ..schemas import (
+    MemoryCardCreate, MemoryCardBatchCreate, MemoryCardUpdate, MemoryCardResponse, MemoryCardImportResponse,
+    CardTagsUpdate, CardTagsResponse, JobResponse
+)
 from ..utils.database import get_db
+from ..utils.events import publish
+from ..services.sync_service import get_changes
+from ..services.job_service import JOB_UPLOAD_DIR, job_runner
+from ..services.duplicate_service import (
+    DUPLICATE_THRESHOLD, duplicate_clusters, find_duplicates, index_cards, index_signatures, unindex_cards,
+    without_duplicates,
+)
+from ..services.tag_service import (
+    forget_cards, get_card_tags, matching_card_ids, normalize_tags, set_card_tags, tag_counts, tag_index
+)
+from ..utils.tag_expression import TagExpressionError
+from ..utils.minhash import signature
+from ..utils.anki import AnkiPackageError, check_package
+from ..utils.serialization import (
+    CARD_COLUMNS, CARD_PREVIEW_COLUMNS, FastJSONResponse, card_list_response, card_preview_row_to_dict, card_to_dict
+)
+from ..utils.group_commit import commit_or_flush, group_commit, publish_after_commit
 from ..dependencies.auth import get_current_active_user
+from ..middleware.idempotency import idempotent
+from ..dependencies.rate_limit import admission
 
 router = APIRouter(prefix="/api/cards", tags=["cards"])
 
+# Anki 牌组包的上传大小上限
+APKG_MAX_UPLOAD_MB = int(os.getenv("APKG_MAX_UPLOAD_MB", "512"))
+
+def _validate_tags(tags: Optional[List[str]]) -> List[str]:
+    """规范化请求中的标签列表，不合法时返回 400"""
+    try:
+        return normalize_tags(tags or [])
+    except TagExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _get_own_card_id(db: Session, card_id: int, user_id: int) -> int:
+    """确认卡片存在且属于当前用户"""
+    found = db.query(MemoryCard.id).filter(MemoryCard.id == card_id, MemoryCard.owner == user_id).first()
+    if not found:
+        raise HTTPException(status_code=404, detail="记忆卡片不存在")
+    return card_id
+
 @router.post("/", response_model=MemoryCardResponse)
 async def create_card(
     card: MemoryCardCreate, 
@@ -19,73 +62,264 @@ async def create_card(
     db: Session = Depends(get_db)
 ):
     """创建新的记忆卡片"""
-    db_card = MemoryCard(
-        content=card.content,
-        card_type=card.card_type,
-        notes=card.notes,
-        owner=current_user.id
-    )
-    
-    db.add(db_card)
-    db.commit()
-    db.refresh(db_card)
+    user_id = current_user.id
+    tags = _validate_tags(card.tags)
     
-    return db_card
+    def operation(session: Session):
+        db_card = MemoryCard(
+            content=card.content,
+            card_type=card.card_type,
+            notes=card.notes,
+            owner=user_id
+        )
+        
+        session.add(db_card)
+        session.flush()
+        if tags:
+            set_card_tags(session, user_id, {db_card.id: tags}, is_new=True)
+        index_cards(session, user_id, {db_card.id: db_card.content}, is_new=True)
+        commit_or_flush(session)
+        
+        publish_after_commit(session, user_id, "cards_changed", {
+            "created": [db_card.id],
+            "type_counts_delta": {db_card.card_type: 1}
+        })
+        
+        return card_to_dict(db_card)
+    
+    return await group_commit.execute(db, operation, user_id=user_id)
 
-@router.post("/batch", response_model=List[MemoryCardResponse])
+@router.post("/batch", response_model=List[MemoryCardImportResponse], dependencies=[Depends(admission("bulk"))])
+@idempotent
 async def create_cards_batch(
     cards_batch: MemoryCardBatchCreate, 
+    response: Response,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """批量创建记忆卡片"""
+    """
+    批量创建记忆卡片
+    
+    duplicates 为 flag 时，与已有卡片或本批中更早的卡片近似重复的卡片带 duplicate_of；
+    为 skip 时不创建这些卡片，跳过的数量见响应头 X-Duplicates-Skipped。
+    """
     if not cards_batch.cards:
         raise HTTPException(status_code=400, detail="卡片列表不能为空")
     
     if len(cards_batch.cards) > 100:  # 限制批量数量
         raise HTTPException(status_code=400, detail="批量创建数量不能超过100张")
     
-    created_cards = []
+    user_id = current_user.id
+    tags_list = [_validate_tags(card_data.tags) for card_data in cards_batch.cards]
+    signatures = [signature(card_data.content) for card_data in cards_batch.cards]
     
-    try:
-        for card_data in cards_batch.cards:
+    mode = cards_batch.duplicates
+    skipped = 0
+    
+    def operation(session: Session):
+        nonlocal skipped
+        # 在写事务中查重：同一次组提交中先执行的操作刚创建的卡片也能查到
+        matches = find_duplicates(session, user_id, signatures) if mode != "allow" else None
+        kept = without_duplicates(matches) if mode == "skip" else list(range(len(cards_batch.cards)))
+        skipped = len(cards_batch.cards) - len(kept)
+        
+        created_cards = []
+        for index in kept:
+            card_data = cards_batch.cards[index]
             db_card = MemoryCard(
                 content=card_data.content,
                 card_type=card_data.card_type,
                 notes=card_data.notes,
-                owner=current_user.id
+                owner=user_id
             )
-            db.add(db_card)
+            session.add(db_card)
             created_cards.append(db_card)
         
-        db.commit()
+        session.flush()
+        if any(tags_list):
+            set_card_tags(session, user_id, {
+                db_card.id: tags_list[index] for db_card, index in zip(created_cards, kept) if tags_list[index]
+            }, is_new=True)
+        index_signatures(session, user_id, {
+            db_card.id: signatures[index] for db_card, index in zip(created_cards, kept)
+        }, is_new=True)
+        commit_or_flush(session)
+        
+        # 直接提交时实体已过期，这里的访问会刷新获取ID等信息
+        created = [card_to_dict(card) for card in created_cards]
+        if mode == "flag":
+            id_by_index = {index: card["id"] for index, card in zip(kept, created)}
+            for index, card in zip(kept, created):
+                existing, earlier = matches[index]
+                if existing or earlier:
+                    card["duplicate_of"] = existing + [id_by_index[other] for other in earlier]
+        if not created:
+            return created
         
-        # 刷新所有创建的卡片以获取ID等信息
-        for card in created_cards:
-            db.refresh(card)
+        type_counts_delta = {}
+        for card in created:
+            type_counts_delta[card["card_type"]] = type_counts_delta.get(card["card_type"], 0) + 1
+        publish_after_commit(session, user_id, "cards_changed", {
+            "created": [card["id"] for card in created],
+            "type_counts_delta": type_counts_delta
+        })
         
-        return created_cards
+        return created
+    
+    try:
+        created = await group_commit.execute(db, operation, user_id=user_id)
         
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=f"批量创建失败: {str(e)}")
+    
+    if mode == "skip":
+        response.headers["X-Duplicates-Skipped"] = str(skipped)
+    return created
+
+def _parse_type_map(text: Optional[str]) -> dict:
+    """解析 "笔记类型名=卡片类型,..." """
+    result = {}
+    for item in (text or "").split(","):
+        note_type, _, card_type = item.partition("=")
+        if note_type.strip() and card_type.strip():
+            result[note_type.strip()] = card_type.strip()[:50]
+    return result
+
+@router.post("/import/apkg", response_model=JobResponse, status_code=202, dependencies=[Depends(admission("bulk"))])
+async def import_apkg(
+    request: Request,
+    duplicates: Literal["allow", "flag", "skip"] = Query("allow"),
+    card_type: Optional[str] = Query(None, min_length=1, max_length=50),
+    type_map: Optional[str] = Query(None),
+    tags: bool = Query(True),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    导入 Anki 牌组包（.apkg），请求体为文件内容本身（Content-Type: application/octet-stream）
+
+    上传内容逐块写入磁盘，校验后提交 import_apkg 后台任务并立即返回任务记录，进度通过 /api/jobs/{id} 查询。
+    卡片类型默认为笔记类型名；type_map 为 "笔记类型名=卡片类型,..."，card_type 把所有笔记导入为同一类型。
+    """
+    max_bytes = APKG_MAX_UPLOAD_MB * 1024 * 1024
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"牌组包不能超过 {APKG_MAX_UPLOAD_MB}MB")
+
+    JOB_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    file_name = f"apkg_{current_user.id}_{uuid.uuid4().hex}.apkg"
+    path = JOB_UPLOAD_DIR / file_name
+    submitted = False
+    try:
+        size = 0
+        with open(path, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"牌组包不能超过 {APKG_MAX_UPLOAD_MB}MB")
+                f.write(chunk)
+        if not size:
+            raise HTTPException(status_code=400, detail="请求体为空，请上传 .apkg 文件")
+        try:
+            await run_in_threadpool(check_package, path)
+        except AnkiPackageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        params = {"upload": file_name, "duplicates": duplicates, "type_map": _parse_type_map(type_map), "tags": tags}
+        if card_type:
+            params["card_type"] = card_type
+        try:
+            job = job_runner.submit(db, current_user.id, "import_apkg", params)
+        except RuntimeError as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        submitted = True
+        return job
+    except ClientDisconnect:
+        raise HTTPException(status_code=400, detail="上传未完成")
+    finally:
+        if not submitted:
+            path.unlink(missing_ok=True)
 
-@router.get("/", response_model=List[MemoryCardResponse])
+@router.get("/", response_model=List[MemoryCardResponse], response_class=FastJSONResponse)
 async def list_cards(
     current_user: User = Depends(get_current_active_user),
     card_type: Optional[str] = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    preview: bool = Query(False, description="只返回内容摘要，不返回备注"),
+    tags: Optional[str] = Query(None, description="标签表达式，如 grammar AND NOT retired"),
     db: Session = Depends(get_db)
 ):
-    """获取记忆卡片列表"""
-    query = db.query(MemoryCard).filter(MemoryCard.owner == current_user.id)
+    """获取记忆卡片列表（精简路径：只查询所需列并直接序列化）"""
+    columns = CARD_PREVIEW_COLUMNS if preview else CARD_COLUMNS
+    query = db.query(*columns).filter(MemoryCard.owner == current_user.id)
+    
+    if tags:
+        # 先用标签位图求出符合条件的卡片ID并分页，再只读取这一页的列
+        try:
+            selection = tag_index.select(db, current_user.id, tags)
+        except TagExpressionError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        criteria = [MemoryCard.card_type == card_type] if card_type else []
+        page_ids = matching_card_ids(db, current_user.id, selection, *criteria)[skip:skip + limit]
+        rows = query.filter(MemoryCard.id.in_(page_ids)).order_by(MemoryCard.id).all() if page_ids else []
+        return card_list_response(rows, preview=preview)
     
     if card_type:
         query = query.filter(MemoryCard.card_type == card_type)
     
-    cards = query.offset(skip).limit(limit).all()
-    return cards
+    rows = query.offset(skip).limit(limit).all()
+    return card_list_response(rows, preview=preview)
+
+@router.get("/tags")
+async def list_tags(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """获取用户使用的标签及各标签的卡片数"""
+    return tag_counts(db, current_user.id)
+
+@router.get("/duplicates")
+async def list_duplicates(
+    threshold: float = Query(DUPLICATE_THRESHOLD, gt=0, le=1, description="最小相似度（内容 3-gram 的 Jaccard 相似度估计）"),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """查找近似重复的卡片簇（按簇大小降序），每张卡片只返回内容摘要"""
+    clusters = duplicate_clusters(db, current_user.id, threshold)
+    page = clusters[:limit]
+    ids = [card_id for cluster in page for card_id in cluster]
+    cards = {}
+    for start in range(0, len(ids), 500):
+        rows = db.query(*CARD_PREVIEW_COLUMNS).filter(MemoryCard.id.in_(ids[start:start + 500]))
+        cards.update((row[0], card_preview_row_to_dict(row)) for row in rows)
+    return FastJSONResponse({
+        "total_clusters": len(clusters),
+        "clusters": [[cards[card_id] for card_id in cluster if card_id in cards] for cluster in page],
+    })
+
+@router.get("/sync", response_class=FastJSONResponse)
+async def sync_cards(
+    token: Optional[str] = Query(None, description="上次同步返回的令牌，首次同步不传"),
+    limit: int = Query(500, ge=1, le=5000),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    增量同步卡片
+    
+    返回令牌之后新增或修改的卡片（cards）和已删除的卡片ID（deleted），以及新的令牌。
+    has_more 为 true 时应继续用新令牌请求。
+    """
+    since = None
+    if token:
+        if not token.isdigit():
+            raise HTTPException(status_code=400, detail="无效的同步令牌")
+        since = int(token)
+    
+    return FastJSONResponse(get_changes(db, current_user.id, since, limit))
 
 @router.get("/{card_id}", response_model=MemoryCardResponse)
 async def get_card(
@@ -102,6 +336,33 @@ async def get_card(
         raise HTTPException(status_code=404, detail="记忆卡片不存在")
     return card
 
+@router.get("/{card_id}/tags", response_model=CardTagsResponse)
+async def get_tags_of_card(
+    card_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """获取卡片的标签"""
+    _get_own_card_id(db, card_id, current_user.id)
+    return {"card_id": card_id, "tags": get_card_tags(db, [card_id])[card_id]}
+
+@router.put("/{card_id}/tags", response_model=CardTagsResponse)
+async def update_tags_of_card(
+    card_id: int,
+    tags_update: CardTagsUpdate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """替换卡片的标签"""
+    tags = _validate_tags(tags_update.tags)
+    user_id = current_user.id
+    _get_own_card_id(db, card_id, user_id)
+    set_card_tags(db, user_id, {card_id: tags})
+    db.commit()
+    
+    publish(user_id, "cards_changed", {"updated": [card_id], "tags": True})
+    return {"card_id": card_id, "tags": sorted(tags)}
+
 @router.put("/{card_id}", response_model=MemoryCardResponse)
 async def update_card(
     card_id: int, 
@@ -117,9 +378,12 @@ async def update_card(
     if not db_card:
         raise HTTPException(status_code=404, detail="记忆卡片不存在")
     
+    old_card_type = db_card.card_type
+    
     # 更新字段
-    if card_update.content is not None:
+    if card_update.content is not None and card_update.content != db_card.content:
         db_card.content = card_update.content
+        index_cards(db, current_user.id, {db_card.id: card_update.content})
     if card_update.card_type is not None:
         db_card.card_type = card_update.card_type
     if card_update.notes is not None:
@@ -131,6 +395,15 @@ async def update_card(
     db.commit()
     db.refresh(db_card)
     
+    type_counts_delta = {}
+    if db_card.card_type != old_card_type:
+        type_counts_delta = {old_card_type: -1, db_card.card_type: 1}
+    # 用刷新后的卡片取所属用户，current_user 在提交后已过期
+    publish(db_card.owner, "cards_changed", {
+        "updated": [db_card.id],
+        "type_counts_delta": type_counts_delta
+    })
+    
     return db_card
 
 @router.delete("/{card_id}")
@@ -147,7 +420,17 @@ async def delete_card(
     if not db_card:
         raise HTTPException(status_code=404, detail="记忆卡片不存在")
     
+    # 提交后实体会过期，先记下需要的字段，避免再查询一次
+    user_id, card_type, was_drawn = current_user.id, db_card.card_type, bool(db_card.appear_count)
+    forget_cards(db, user_id, [card_id])
+    unindex_cards(db, [card_id])
     db.delete(db_card)
     db.commit()
     
+    publish(user_id, "cards_changed", {
+        "deleted": [card_id],
+        "type_counts_delta": {card_type: -1},
+        "drawn_delta": -1 if was_drawn else 0
+    })
+    
     return {"message": "记忆卡片已删除"}
@@ -10,10 +10,17 @@ from ..models import Session as DrawSession
 from ..schemas import DrawRequest, DrawResponse, DrawStatisticsResponse, SessionResponse
 from ..services.draw_service import DrawService
 from ..utils.database import get_db
+from ..middleware.compression import compress_route
+from ..middleware.idempotency import idempotent
+from ..dependencies.rate_limit import admission
+from ..utils.serialization import FastJSONResponse, draw_result_to_dict
+from ..utils.group_commit import group_commit
 
 router = APIRouter(prefix="/api/draw", tags=["draw"])
 
-@router.post("/", response_model=DrawResponse)
+@router.post("/", response_model=DrawResponse, response_class=FastJSONResponse, dependencies=[Depends(admission("draw"))])
+@compress_route(1)  # 抽题对延迟敏感，使用最快的压缩级别
+@idempotent
 async def draw_cards(draw_request: DrawRequest, user_id: int, db: Session = Depends(get_db)):
     """
     抽题接口
@@ -25,21 +32,23 @@ async def draw_cards(draw_request: DrawRequest, user_id: int, db: Session = Depe
     Returns:
         抽题结果，包含抽中的卡片和会话信息
     """
-    draw_service = DrawService(db)
-    
-    try:
-        result = draw_service.draw_cards(
+    def operation(session: Session):
+        result = DrawService(session).draw_cards(
             user_id=user_id,
             type_counts=draw_request.type_counts,
             interval_count=draw_request.interval_count
         )
-        
-        return result
+        return draw_result_to_dict(result)
+    
+    try:
+        # 并发的抽题请求经组提交合并到同一个事务
+        result = await group_commit.execute(db, operation, user_id=user_id)
+        return FastJSONResponse(result)
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"抽题失败: {str(e)}")
 
-@router.get("/statistics/{user_id}", response_model=DrawStatisticsResponse)
+@router.get("/statistics/{user_id}", response_model=DrawStatisticsResponse, dependencies=[Depends(admission("stats"))])
 async def get_draw_statistics(user_id: int, db: Session = Depends(get_db)):
     """获取用户的抽题统计信息"""
     draw_service = DrawService(db)
@@ -68,18 +77,18 @@ async def get_user_sessions(
     return sessions
 
 @router.get("/sessions/detail/{session_id}", response_model=SessionResponse)
-async def get_session_detail(session_id: int, db: Session = Depends(get_db)):
-    """获取特定会话的详细信息"""
-    session = db.query(DrawSession).filter(DrawSession.id == session_id).first()
+async def get_session_detail(session_id: int, user_id: int, db: Session = Depends(get_db)):
+    """获取特定会话的详细信息（user_id 为会话所属用户，分片模式下据此路由）"""
+    session = db.query(DrawSession).filter(DrawSession.id == session_id, DrawSession.user_id == user_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
     return session
 
 @router.delete("/sessions/{session_id}")
-async def delete_session(session_id: int, db: Session = Depends(get_db)):
-    """删除特定会话记录（注意：这会影响统计数据）"""
-    session = db.query(DrawSession).filter(DrawSession.id == session_id).first()
+async def delete_session(session_id: int, user_id: int, db: Session = Depends(get_db)):
+    """删除特定会话记录（注意：这会影响统计数据；user_id 为会话所属用户，分片模式下据此路由）"""
+    session = db.query(DrawSession).filter(DrawSession.id == session_id, DrawSession.user_id == user_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
     
@@ -88,7 +97,8 @@ async def delete_session(session_id: int, db: Session = Depends(get_db)):
     
     return {"message": "会话记录已删除"}
 
-@router.get("/sessions/{user_id}/export")
+@router.get("/sessions/{user_id}/export", dependencies=[Depends(admission("stats"))])
+@compress_route(9)  # 导出数据量大且不频繁，使用最高压缩率
 async def export_sessions(user_id: int, db: Session = Depends(get_db)):
     """导出用户的所有会话数据（用于备份或分析）"""
     sessions = db.query(DrawSession).filter(
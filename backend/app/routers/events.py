@@ -0,0 +1,71 @@
+"""
+实时事件相关API路由（Server-Sent Events）
+"""
+
+import asyncio
+import json
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from ..utils.events import event_broker
+from ..middleware.compression import compress_route
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+# 心跳间隔（秒），防止代理关闭空闲连接，同时用于检测客户端断开
+HEARTBEAT_SECONDS = 15
+
+def format_event(event: dict) -> str:
+    data = json.dumps(
+        {"type": event["type"], "data": event["data"], "timestamp": event["timestamp"]},
+        ensure_ascii=False, separators=(",", ":"),
+    )
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+@router.get("/{user_id}")
+@compress_route(0)  # 事件流逐条推送，不压缩
+async def stream_events(user_id: int, request: Request):
+    """
+    订阅用户的数据变更事件
+
+    事件类型：cards_changed（卡片增删改）、session_created（新抽题会话）、
+    progress_changed（练习进度变化）、resync（需要重新全量加载）
+    """
+    subscriber = event_broker.subscribe(user_id)
+    last_event_id = request.headers.get("last-event-id")
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            if last_event_id and last_event_id.isdigit():
+                missed = event_broker.history_since(user_id, int(last_event_id))
+                if missed is None:
+                    yield format_event({"id": 0, "type": "resync", "data": {}, "timestamp": 0})
+                else:
+                    for event in missed:
+                        yield format_event(event)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+
+                if subscriber.overflowed:
+                    # 客户端消费太慢，丢弃积压事件并要求重新加载
+                    subscriber.overflowed = False
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    yield format_event({**event, "type": "resync", "data": {}})
+                    continue
+                yield format_event(event)
+        finally:
+            event_broker.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,85 @@
+"""
+后台任务相关API路由
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from ..models import Job, User
+from ..schemas import JobCreate, JobResponse
+from ..services.job_service import job_runner, JOB_RESULT_DIR, UPLOAD_JOB_TYPES
+from ..utils.database import get_db
+from ..dependencies.auth import get_current_active_user
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+def get_user_job(job_id: int, current_user: User, db: Session) -> Job:
+    job = db.query(Job).filter(Job.id == job_id, Job.user_id == current_user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@router.post("/", response_model=JobResponse, status_code=202)
+def submit_job(
+    job: JobCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """提交后台任务，立即返回任务记录"""
+    if job.job_type in UPLOAD_JOB_TYPES:
+        raise HTTPException(status_code=400, detail=f"{job.job_type} 任务需要通过上传接口提交")
+    try:
+        return job_runner.submit(db, current_user.id, job.job_type, job.params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@router.get("/", response_model=List[JobResponse])
+def list_jobs(
+    status: Optional[str] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """获取当前用户的任务列表"""
+    query = db.query(Job).filter(Job.user_id == current_user.id)
+    if status:
+        query = query.filter(Job.status == status)
+    return query.order_by(Job.id.desc()).offset(skip).limit(limit).all()
+
+@router.get("/{job_id}", response_model=JobResponse)
+def get_job(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """查询任务状态和进度"""
+    return get_user_job(job_id, current_user, db)
+
+@router.post("/{job_id}/cancel", response_model=JobResponse)
+def cancel_job(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """取消任务"""
+    job = get_user_job(job_id, current_user, db)
+    return job_runner.cancel(db, job)
+
+@router.get("/{job_id}/result")
+def download_job_result(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """下载任务结果文件（如导出文件）"""
+    job = get_user_job(job_id, current_user, db)
+    if not job.result_location:
+        raise HTTPException(status_code=404, detail="该任务没有结果文件")
+    path = JOB_RESULT_DIR / job.result_location
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="结果文件已不存在")
+    return FileResponse(path, media_type="application/json", filename=job.result_location)
@@ -0,0 +1,68 @@
+"""
+排行榜相关API路由
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from ..models import User
+from ..services.leaderboard_service import (
+    BOARDS, LEADERBOARD_MAX_LIMIT, PERIODS, board_periods, leaderboard_index
+)
+from ..utils.database import get_db
+from ..dependencies.auth import get_current_active_user
+
+router = APIRouter(prefix="/api/leaderboards", tags=["leaderboards"])
+
+def check_board(board: str, period: str):
+    if board not in BOARDS:
+        raise HTTPException(status_code=404, detail="排行榜不存在")
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period 只能是 {' / '.join(PERIODS)}")
+    try:
+        board_periods(board, period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/")
+async def list_boards(current_user: User = Depends(get_current_active_user)):
+    """可用的排行榜及当前时间桶"""
+    return [
+        {"board": board, "description": description, "unit": unit, "periods": board_periods(board)}
+        for board, (_, unit, description) in BOARDS.items()
+    ]
+
+@router.get("/{board}")
+async def get_leaderboard(
+    board: str,
+    limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    period: str = Query("current"),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """排行榜前 limit 名（同分同名次）"""
+    check_board(board, period)
+    result = leaderboard_index.top(db, board, limit, period)
+    user_ids = [user_id for _, user_id, _ in result["entries"]]
+    names = dict(db.query(User.id, User.username).filter(User.id.in_(user_ids)).all()) if user_ids else {}
+    return {
+        "board": board,
+        "periods": result["periods"],
+        "total": result["total"],
+        "entries": [
+            {"rank": rank, "user_id": user_id, "username": names.get(user_id), "score": score}
+            for rank, user_id, score in result["entries"]
+        ],
+    }
+
+@router.get("/{board}/rank/{user_id}")
+async def get_leaderboard_rank(
+    board: str,
+    user_id: int,
+    period: str = Query("current"),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """用户在排行榜中的名次；没有计数时 rank 为 null"""
+    check_board(board, period)
+    result = leaderboard_index.rank(db, board, user_id, period)
+    return {"board": board, "user_id": user_id, **result}
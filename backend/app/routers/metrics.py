@@ -0,0 +1,14 @@
+"""
+运行指标API路由
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..utils.metrics import registry
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """Prometheus 文本格式的运行指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
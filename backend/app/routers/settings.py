@@ -7,12 +7,19 @@ from sqlalchemy.orm import Session
 from ..models import UserDrawSettings
 from ..schemas import UserDrawSettingsCreate, UserDrawSettingsUpdate, UserDrawSettingsResponse
 from ..utils.database import get_db
+from ..services.draw_service import get_settings_snapshot
+from ..utils.tag_expression import TagExpressionError, check_type_counts
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
 
 @router.post("/", response_model=UserDrawSettingsResponse)
 async def create_or_update_settings(settings: UserDrawSettingsCreate, user_id: int, db: Session = Depends(get_db)):
     """创建或更新用户抽题设置"""
+    try:
+        check_type_counts(settings.type_counts)
+    except TagExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     # 查找现有设置
     db_settings = db.query(UserDrawSettings).filter(UserDrawSettings.user_id == user_id).first()
     
@@ -39,7 +46,7 @@ async def create_or_update_settings(settings: UserDrawSettingsCreate, user_id: i
 @router.get("/{user_id}", response_model=UserDrawSettingsResponse)
 async def get_user_settings(user_id: int, db: Session = Depends(get_db)):
     """获取用户抽题设置"""
-    settings = db.query(UserDrawSettings).filter(UserDrawSettings.user_id == user_id).first()
+    settings = get_settings_snapshot(db, user_id)
     if not settings:
         raise HTTPException(status_code=404, detail="用户设置不存在")
     return settings
@@ -53,6 +60,10 @@ async def update_user_settings(user_id: int, settings_update: UserDrawSettingsUp
     
     # 更新字段
     if settings_update.type_counts is not None:
+        try:
+            check_type_counts(settings_update.type_counts)
+        except TagExpressionError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         db_settings.type_counts = settings_update.type_counts
     if settings_update.interval_count is not None:
         db_settings.interval_count = settings_update.interval_count
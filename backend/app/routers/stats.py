@@ -1,5 +1,10 @@
 """
 高级统计相关API路由
+
+统计接口使用同步函数，由线程池并发执行（@track_threadpool：并发名额保留到同步代码结束）；
+相同的并发统计请求在 StatsService 中通过 singleflight 合并为一次计算。
+开启分析快照时，在允许的陈旧度以内读取快照（见 utils/snapshot.py），
+响应头 X-Data-Source / X-Snapshot-Age 标明数据来源和快照年龄。
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query
@@ -10,12 +15,14 @@ from ..schemas import (
     LearningProgressResponse, RecommendationResponse
 )
 from ..services.stats_service import StatsService
-from ..utils.database import get_db
+from ..utils.snapshot import get_analytics_db
+from ..dependencies.rate_limit import admission, track_threadpool
 
-router = APIRouter(prefix="/api/stats", tags=["stats"])
+router = APIRouter(prefix="/api/stats", tags=["stats"], dependencies=[Depends(admission("stats"))])
 
 @router.get("/overview/{user_id}", response_model=UserOverviewResponse)
-async def get_user_overview(user_id: int, db: Session = Depends(get_db)):
+@track_threadpool
+def get_user_overview(user_id: int, db: Session = Depends(get_analytics_db)):
     """获取用户学习总览"""
     stats_service = StatsService(db)
     
@@ -26,10 +33,11 @@ async def get_user_overview(user_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=f"获取总览失败: {str(e)}")
 
 @router.get("/cards/{user_id}", response_model=CardStatisticsResponse)
-async def get_card_statistics(
+@track_threadpool
+def get_card_statistics(
     user_id: int, 
     card_type: Optional[str] = Query(None, description="筛选特定卡片类型"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_analytics_db)
 ):
     """获取卡片详细统计"""
     stats_service = StatsService(db)
@@ -41,10 +49,11 @@ async def get_card_statistics(
         raise HTTPException(status_code=400, detail=f"获取卡片统计失败: {str(e)}")
 
 @router.get("/sessions/{user_id}", response_model=SessionAnalyticsResponse)
-async def get_session_analytics(
+@track_threadpool
+def get_session_analytics(
     user_id: int,
     days: int = Query(30, ge=1, le=365, description="分析天数范围"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_analytics_db)
 ):
     """获取会话分析数据"""
     stats_service = StatsService(db)
@@ -56,7 +65,8 @@ async def get_session_analytics(
         raise HTTPException(status_code=400, detail=f"获取会话分析失败: {str(e)}")
 
 @router.get("/progress/{user_id}", response_model=LearningProgressResponse)
-async def get_learning_progress(user_id: int, db: Session = Depends(get_db)):
+@track_threadpool
+def get_learning_progress(user_id: int, db: Session = Depends(get_analytics_db)):
     """获取学习进度分析"""
     stats_service = StatsService(db)
     
@@ -67,7 +77,8 @@ async def get_learning_progress(user_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=f"获取学习进度失败: {str(e)}")
 
 @router.get("/recommendations/{user_id}", response_model=RecommendationResponse)
-async def get_recommendations(user_id: int, db: Session = Depends(get_db)):
+@track_threadpool
+def get_recommendations(user_id: int, db: Session = Depends(get_analytics_db)):
     """获取个性化学习建议"""
     stats_service = StatsService(db)
     
@@ -78,7 +89,8 @@ async def get_recommendations(user_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=f"获取建议失败: {str(e)}")
 
 @router.get("/dashboard/{user_id}")
-async def get_dashboard_data(user_id: int, db: Session = Depends(get_db)):
+@track_threadpool
+def get_dashboard_data(user_id: int, db: Session = Depends(get_analytics_db)):
     """获取仪表板综合数据"""
     stats_service = StatsService(db)
     
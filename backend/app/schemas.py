@@ -3,7 +3,7 @@ Pydantic 模型 - 请求和响应数据结构
 """
 
 from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 
 # ===== 用户相关 =====
@@ -44,15 +44,25 @@ class MemoryCardCreate(BaseModel):
     content: str
     card_type: str
     notes: Optional[str] = None
+    tags: Optional[List[str]] = None
 
 class MemoryCardBatchCreate(BaseModel):
     cards: List[MemoryCardCreate]
+    # 近似重复的处理：allow 照常创建，flag 创建并在 duplicate_of 中标出相似卡片，skip 不创建
+    duplicates: Literal["allow", "flag", "skip"] = "allow"
 
 class MemoryCardUpdate(BaseModel):
     content: Optional[str] = None
     card_type: Optional[str] = None
     notes: Optional[str] = None
 
+class CardTagsUpdate(BaseModel):
+    tags: List[str]
+
+class CardTagsResponse(BaseModel):
+    card_id: int
+    tags: List[str]
+
 class MemoryCardResponse(BaseModel):
     id: int
     content: str
@@ -67,9 +77,12 @@ class MemoryCardResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class MemoryCardImportResponse(MemoryCardResponse):
+    duplicate_of: Optional[List[int]] = None  # 相似的卡片ID（duplicates=flag 时）
+
 # ===== 用户抽题设置相关 =====
 class UserDrawSettingsCreate(BaseModel):
-    type_counts: Dict[str, int]  # {"M": 5, "N": 3}
+    type_counts: Dict[str, int]  # {"M": 5, "N": 3}，键也可以是标签表达式，如 {"grammar AND NOT retired": 5}
     interval_count: int = 2
 
 class UserDrawSettingsUpdate(BaseModel):
@@ -151,3 +164,37 @@ class LearningProgressResponse(BaseModel):
 class RecommendationResponse(BaseModel):
     recommendations: List[Dict[str, Any]]
     total_recommendations: int
+
+# ===== 后台任务相关 =====
+class JobCreate(BaseModel):
+    job_type: str  # import_cards / export_cards / rebuild_stats / rebuild_duplicate_index / delete_deck / delete_user
+    params: Dict[str, Any] = {}
+
+class JobResponse(BaseModel):
+    id: int
+    user_id: int
+    job_type: str
+    status: str
+    progress: int
+    progress_message: Optional[str]
+    result: Optional[Dict[str, Any]]
+    result_location: Optional[str]
+    error: Optional[str]
+    cancel_requested: bool
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
+
+# ===== 批量请求相关 =====
+class BatchSubRequest(BaseModel):
+    id: Optional[str] = None  # 调用方自定义的标识，原样返回
+    method: str = "GET"
+    path: str  # 以 /api/ 开头，可带查询字符串
+    body: Optional[Any] = None  # JSON 请求体
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest]
+    parallel: bool = False  # 相邻的 GET 子请求并发执行
@@ -2,13 +2,60 @@
 抽题服务 - 核心抽题逻辑
 """
 
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, load_only, undefer
+from sqlalchemy import bindparam, or_, select
 from typing import List, Dict, Any, Optional
 import random
 from ..models import MemoryCard, Session as DrawSession, UserDrawSettings
+from ..utils.group_commit import commit_or_flush, publish_after_commit
+from ..utils.coherence import CoherentCache
+from ..utils.tag_expression import is_tag_expression
+from .tag_service import restrict_to_selection, tag_index
+from .leaderboard_service import record_draw
+from .stats_service import CARD_COUNTS, CARDS_BY_TYPE, SESSION_COUNTS
+from ..utils.statements import hot_statement
 from datetime import datetime, timezone
 
+# 用户抽题设置缓存（按用户缓存版本号校验，跨进程一致）
+settings_cache = CoherentCache("settings")
+
+# 热点语句（见 utils/statements.py）
+SETTINGS_BY_USER = hot_statement(
+    select(UserDrawSettings).where(UserDrawSettings.user_id == bindparam("user_id")).limit(1),
+    user_id=-1,
+)
+LAST_SESSION_NUMBER = hot_statement(
+    select(DrawSession.session_number).order_by(DrawSession.session_number.desc()).limit(1)
+)
+# 指定类型的可抽取卡片：从未被抽取，或距离上次抽取间隔足够；只加载 ID 和计数字段
+AVAILABLE_CARDS = hot_statement(
+    select(MemoryCard).options(
+        load_only(MemoryCard.id, MemoryCard.owner, MemoryCard.card_type,
+                  MemoryCard.appear_count, MemoryCard.last_appeared_session)
+    ).where(
+        MemoryCard.owner == bindparam("user_id"),
+        or_(MemoryCard.last_appeared_session.is_(None), MemoryCard.last_appeared_session <= bindparam("min_session")),
+        MemoryCard.card_type == bindparam("card_type"),
+    ),
+    user_id=-1, min_session=0, card_type="",
+)
+
+def get_settings_snapshot(db: Session, user_id: int) -> Optional[Dict[str, Any]]:
+    """读取用户抽题设置（字典形式，优先使用缓存）；未设置时返回 None"""
+    def load():
+        settings = db.execute(SETTINGS_BY_USER, {"user_id": user_id}).scalar()
+        if settings is None:
+            return user_id, None
+        return user_id, {
+            "id": settings.id,
+            "user_id": settings.user_id,
+            "type_counts": settings.type_counts,
+            "interval_count": settings.interval_count,
+            "created_at": settings.created_at,
+            "updated_at": settings.updated_at,
+        }
+    return settings_cache.get_or_load(user_id, load)
+
 class DrawService:
     
     def __init__(self, db: Session):
@@ -16,31 +63,57 @@ class DrawService:
     
     def get_next_session_number(self) -> int:
         """获取下一个会话编号"""
-        last_session = self.db.query(DrawSession).order_by(DrawSession.session_number.desc()).first()
-        return (last_session.session_number + 1) if last_session else 1
+        last_number = self.db.execute(LAST_SESSION_NUMBER).scalar()
+        return (last_number + 1) if last_number is not None else 1
     
-    def get_available_cards(self, user_id: int, card_type: str, interval_count: int, current_session: int) -> List[MemoryCard]:
-        """获取可抽取的卡片"""
+    def eligible_cards_query(self, user_id: int, interval_count: int, current_session: int):
+        """用户可抽取卡片的查询（间隔检查）"""
         # 计算可以抽取的最小会话编号
         min_session = current_session - interval_count
         
         # 查询条件：
         # 1. 属于指定用户
-        # 2. 属于指定类型
-        # 3. 从未被抽取过，或者距离上次抽取间隔足够
-        query = self.db.query(MemoryCard).filter(
-            MemoryCard.owner == user_id,
-            MemoryCard.card_type == card_type
+        # 2. 从未被抽取过，或者距离上次抽取间隔足够
+        # 只加载 ID 和计数字段，内容和备注在抽中后统一加载
+        return self.db.query(MemoryCard).options(
+            load_only(MemoryCard.id, MemoryCard.owner, MemoryCard.card_type,
+                      MemoryCard.appear_count, MemoryCard.last_appeared_session)
+        ).filter(
+            MemoryCard.owner == user_id
         ).filter(
             (MemoryCard.last_appeared_session.is_(None)) |  # 从未被抽取
             (MemoryCard.last_appeared_session <= min_session)  # 间隔足够
         )
-        
-        return query.all()
     
-    def draw_cards_by_type(self, user_id: int, card_type: str, count: int, interval_count: int, current_session: int) -> List[MemoryCard]:
-        """按类型抽取指定数量的卡片"""
-        available_cards = self.get_available_cards(user_id, card_type, interval_count, current_session)
+    def get_available_cards(self, user_id: int, card_type: str, interval_count: int, current_session: int) -> List[MemoryCard]:
+        """获取指定类型的可抽取卡片"""
+        params = {"user_id": user_id, "min_session": current_session - interval_count, "card_type": card_type}
+        return self.db.execute(AVAILABLE_CARDS, params).scalars().all()
+    
+    def get_available_cards_by_tags(self, user_id: int, expression: str, interval_count: int, current_session: int) -> List[MemoryCard]:
+        """获取符合标签表达式的可抽取卡片：先用内存中的标签位图求出候选集合，再做间隔检查"""
+        selection = tag_index.select(self.db, user_id, expression)
+        query, check = restrict_to_selection(
+            self.eligible_cards_query(user_id, interval_count, current_session), selection
+        )
+        if query is None:
+            return []
+        cards = query.all()
+        return [card for card in cards if selection.contains(card.id)] if check else cards
+    
+    def draw_cards_by_type(self, user_id: int, card_type: str, count: int, interval_count: int, current_session: int,
+                           exclude: Optional[set] = None) -> List[MemoryCard]:
+        """
+        按类型（或标签表达式）抽取指定数量的卡片
+
+        exclude 为本次已抽中的卡片ID：卡片可能同时符合多个键，同一次抽题中只出现一次。
+        """
+        if is_tag_expression(card_type):
+            available_cards = self.get_available_cards_by_tags(user_id, card_type, interval_count, current_session)
+        else:
+            available_cards = self.get_available_cards(user_id, card_type, interval_count, current_session)
+        if exclude:
+            available_cards = [card for card in available_cards if card.id not in exclude]
         
         # 如果可用卡片不足，返回所有可用的
         if len(available_cards) <= count:
@@ -49,14 +122,23 @@ class DrawService:
         # 随机抽取指定数量
         return random.sample(available_cards, count)
     
+    def load_cards(self, card_ids: List[int]):
+        """一次查询重新加载抽中卡片的全部字段（含延迟的文本字段），避免序列化时逐张刷新"""
+        if not card_ids:
+            return
+        self.db.query(MemoryCard).options(
+            undefer(MemoryCard.content), undefer(MemoryCard.content_preview),
+            undefer(MemoryCard.notes), undefer(MemoryCard.created_at), undefer(MemoryCard.updated_at)
+        ).filter(MemoryCard.id.in_(card_ids)).all()
+    
     def update_card_statistics(self, cards: List[MemoryCard], session_number: int):
-        """更新卡片统计信息"""
+        """更新卡片统计信息（只 flush，与会话记录在同一事务中提交）"""
         for card in cards:
             card.appear_count += 1
             card.last_appeared_session = session_number
             card.updated_at = datetime.now(timezone.utc)
         
-        self.db.commit()
+        self.db.flush()
     
     def create_draw_session(self, user_id: int, settings_used: Dict[str, Any], session_number: int) -> DrawSession:
         """创建抽题会话记录"""
@@ -67,7 +149,7 @@ class DrawService:
         )
         
         self.db.add(session)
-        self.db.commit()
+        commit_or_flush(self.db)
         self.db.refresh(session)
         
         return session
@@ -78,7 +160,8 @@ class DrawService:
         
         Args:
             user_id: 用户ID
-            type_counts: 各类型题目数量，如 {"M": 5, "N": 3}，为空时使用用户设置
+            type_counts: 各类型题目数量，如 {"M": 5, "N": 3}，为空时使用用户设置；
+                键也可以是标签表达式，如 {"grammar AND NOT retired": 5}（见 utils/tag_expression.py）
             interval_count: 间隔次数，为空时使用用户设置
             
         Returns:
@@ -86,19 +169,19 @@ class DrawService:
         """
         
         # 获取用户设置
-        user_settings = self.db.query(UserDrawSettings).filter(UserDrawSettings.user_id == user_id).first()
+        user_settings = get_settings_snapshot(self.db, user_id)
         
         # 使用传入参数或用户设置
         if type_counts is None:
-            if user_settings and user_settings.type_counts:
-                type_counts = user_settings.type_counts
+            if user_settings and user_settings["type_counts"]:
+                type_counts = user_settings["type_counts"]
             else:
                 # 默认设置
                 type_counts = {"M": 3, "N": 2}
         
         if interval_count is None:
             if user_settings:
-                interval_count = user_settings.interval_count
+                interval_count = user_settings["interval_count"]
             else:
                 interval_count = 2
         
@@ -109,16 +192,25 @@ class DrawService:
         drawn_cards_by_type = {}
         all_drawn_cards = []
         
+        drawn_ids = set()
         for card_type, count in type_counts.items():
             if count > 0:
-                cards = self.draw_cards_by_type(user_id, card_type, count, interval_count, session_number)
+                cards = self.draw_cards_by_type(user_id, card_type, count, interval_count, session_number, drawn_ids)
                 drawn_cards_by_type[card_type] = cards
                 all_drawn_cards.extend(cards)
+                drawn_ids.update(card.id for card in cards)
+        
+        # 提交后实体会过期，先记下ID，避免之后访问时逐张刷新
+        drawn_card_ids = [card.id for card in all_drawn_cards]
         
         # 更新卡片统计
+        newly_drawn = sum(1 for card in all_drawn_cards if not card.appear_count)
         if all_drawn_cards:
             self.update_card_statistics(all_drawn_cards, session_number)
         
+        # 卡片统计、排行榜计数与会话记录在同一事务中提交
+        record_draw(self.db, user_id, len(all_drawn_cards))
+        
         # 创建会话记录
         settings_used = {
             "type_counts": type_counts,
@@ -126,6 +218,22 @@ class DrawService:
         }
         session = self.create_draw_session(user_id, settings_used, session_number)
         
+        # 推送增量事件
+        publish_after_commit(self.db, user_id, "session_created", {
+            "session_id": session.id,
+            "session_number": session.session_number,
+            "total_cards": len(all_drawn_cards),
+            "cards_by_type": {card_type: len(cards) for card_type, cards in drawn_cards_by_type.items()}
+        })
+        if all_drawn_cards:
+            publish_after_commit(self.db, user_id, "progress_changed", {
+                "drawn_card_ids": drawn_card_ids,
+                "newly_drawn": newly_drawn
+            })
+        
+        # 用一次查询重新加载抽中卡片
+        self.load_cards(drawn_card_ids)
+        
         return {
             "session": session,
             "cards_by_type": drawn_cards_by_type,
@@ -135,27 +243,18 @@ class DrawService:
     
     def get_draw_statistics(self, user_id: int) -> Dict[str, Any]:
         """获取抽题统计信息"""
-        # 总卡片数
-        total_cards = self.db.query(MemoryCard).filter(MemoryCard.owner == user_id).count()
+        # 总卡片数和已抽取过的卡片数
+        total_cards, drawn_cards = self.db.execute(CARD_COUNTS, {"user_id": user_id}).one()
         
         # 按类型统计卡片数
-        cards_by_type = self.db.query(
-            MemoryCard.card_type,
-            func.count(MemoryCard.id).label('count')
-        ).filter(MemoryCard.owner == user_id).group_by(MemoryCard.card_type).all()
-        
-        # 已抽取过的卡片数
-        drawn_cards = self.db.query(MemoryCard).filter(
-            MemoryCard.owner == user_id,
-            MemoryCard.appear_count > 0
-        ).count()
+        cards_by_type = self.db.execute(CARDS_BY_TYPE, {"user_id": user_id}).all()
         
         # 总会话数
-        total_sessions = self.db.query(DrawSession).filter(DrawSession.user_id == user_id).count()
+        total_sessions, _ = self.db.execute(SESSION_COUNTS, {"user_id": user_id, "since": datetime.now(timezone.utc)}).one()
         
         return {
             "total_cards": total_cards,
-            "cards_by_type": {row.card_type: row.count for row in cards_by_type},
+            "cards_by_type": {card_type: count for card_type, count in cards_by_type},
             "drawn_cards": drawn_cards,
             "never_drawn": total_cards - drawn_cards,
             "total_sessions": total_sessions
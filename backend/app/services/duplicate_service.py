@@ -0,0 +1,186 @@
+"""
+近似重复检测服务 - 卡片内容的 MinHash 签名与 LSH 分桶索引
+
+card_signatures 表保存每张卡片内容的签名，card_lsh_buckets 表保存签名每一带的哈希
+（算法见 utils/minhash.py），都在创建、修改、删除卡片的同一事务中维护。
+
+查找某段内容的近似重复时，只需按 (用户, 带, 桶) 主键前缀查出落在相同桶中的候选卡片，
+再用签名估计相似度确认，不需要与用户的全部卡片逐一比较。
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from array import array
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session
+from ..models import CardLshBucket, CardSignature, MemoryCard
+from ..utils.minhash import band_hashes, signature, signature_from_bytes, similarity
+
+# 判定为近似重复的最小相似度（签名估计的 Jaccard 相似度）
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))
+# 一个桶中候选卡片过多时（大量内容相同的卡片），只与其中前若干张比较
+DUPLICATE_BUCKET_LIMIT = int(os.getenv("DUPLICATE_BUCKET_LIMIT", "200"))
+
+# 导入时对近似重复的处理方式：照常创建 / 创建并标出相似卡片 / 不创建
+DUPLICATE_MODES = ("allow", "flag", "skip")
+
+# 单条 IN 查询中的最大参数数
+_IN_CHUNK = 500
+
+def _chunks(items: Sequence, size: int = _IN_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def load_signatures(db: Session, card_ids: Iterable[int]) -> Dict[int, array]:
+    """卡片ID -> 签名（没有签名的卡片不在结果中）"""
+    result: Dict[int, array] = {}
+    for chunk in _chunks(list(card_ids)):
+        rows = db.query(CardSignature.card_id, CardSignature.signature).filter(CardSignature.card_id.in_(chunk))
+        result.update((card_id, signature_from_bytes(data)) for card_id, data in rows)
+    return result
+
+def unindex_cards(db: Session, card_ids: List[int]):
+    """删除卡片前（或内容修改后重建前）调用：移除它们的签名和分桶"""
+    for chunk in _chunks(card_ids):
+        db.query(CardLshBucket).filter(CardLshBucket.card_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(CardSignature).filter(CardSignature.card_id.in_(chunk)).delete(synchronize_session=False)
+
+def index_signatures(db: Session, owner: int, signatures: Dict[int, Optional[array]], is_new: bool = False):
+    """写入卡片的签名和分桶（卡片须已 flush，有ID），替换已有的记录；is_new 表示刚创建的卡片，不必先删除"""
+    if not signatures:
+        return
+    if not is_new:
+        unindex_cards(db, list(signatures))
+    signature_rows, bucket_rows = [], []
+    for card_id, sig in signatures.items():
+        if sig is None:
+            continue
+        signature_rows.append({"card_id": card_id, "owner": owner, "signature": sig.tobytes()})
+        bucket_rows.extend(
+            {"owner": owner, "band": band, "bucket": bucket, "card_id": card_id}
+            for band, bucket in enumerate(band_hashes(sig))
+        )
+    if signature_rows:
+        db.execute(CardSignature.__table__.insert(), signature_rows)
+        db.execute(CardLshBucket.__table__.insert(), bucket_rows)
+
+def index_cards(db: Session, owner: int, contents: Dict[int, str], is_new: bool = False):
+    """按内容为卡片建立索引：{卡片ID: 内容}"""
+    index_signatures(db, owner, {card_id: signature(content) for card_id, content in contents.items()}, is_new)
+
+def rebuild_duplicate_index(db: Session, owner: int, batch_size: int = 1000) -> int:
+    """由卡片内容重建用户的全部签名和分桶（迁移或启用本功能前的旧数据），返回索引的卡片数"""
+    db.query(CardLshBucket).filter(CardLshBucket.owner == owner).delete(synchronize_session=False)
+    db.query(CardSignature).filter(CardSignature.owner == owner).delete(synchronize_session=False)
+    indexed, last_id = 0, 0
+    while True:
+        rows = db.query(MemoryCard.id, MemoryCard.content).filter(
+            MemoryCard.owner == owner, MemoryCard.id > last_id
+        ).order_by(MemoryCard.id).limit(batch_size).all()
+        if not rows:
+            return indexed
+        index_cards(db, owner, dict(rows), is_new=True)
+        indexed += len(rows)
+        last_id = rows[-1][0]
+
+def find_duplicates(
+    db: Session, owner: int, signatures: List[Optional[array]], threshold: float = DUPLICATE_THRESHOLD
+) -> List[Tuple[List[int], List[int]]]:
+    """
+    为一批待导入的内容查找近似重复
+
+    返回与 signatures 一一对应的 (相似的已有卡片ID, 相似的本批中更早的内容下标)，
+    已有卡片按相似度从高到低排列。
+    """
+    band_keys = [band_hashes(sig) if sig is not None else [] for sig in signatures]
+    # (带, 桶) -> 本批中落在该桶的内容下标
+    local: Dict[Tuple[int, int], List[int]] = {}
+    for index, buckets in enumerate(band_keys):
+        for band, bucket in enumerate(buckets):
+            local.setdefault((band, bucket), []).append(index)
+
+    buckets_by_band: Dict[int, List[int]] = {}
+    for band, bucket in local:
+        buckets_by_band.setdefault(band, []).append(bucket)
+
+    candidates: Dict[int, set] = {}
+    for start in range(0, max(map(len, buckets_by_band.values()), default=0), _IN_CHUNK):
+        # 每一带单独一个子查询，才能用上 (owner, band, bucket) 主键前缀；
+        # 写成一个 (band, bucket) IN (...) 条件时 SQLite 只按 owner 扫描
+        statement = union_all(*(
+            select(CardLshBucket.band, CardLshBucket.bucket, CardLshBucket.card_id).where(
+                CardLshBucket.owner == owner,
+                CardLshBucket.band == band,
+                CardLshBucket.bucket.in_(buckets[start:start + _IN_CHUNK]),
+            )
+            for band, buckets in buckets_by_band.items() if start < len(buckets)
+        ))
+        # 复合查询执行时会话拿不到语句本身，显式给出映射类以便分片模式下路由
+        for band, bucket, card_id in db.execute(statement, bind_arguments={"mapper": CardLshBucket.__mapper__}):
+            for index in local[(band, bucket)]:
+                candidates.setdefault(index, set()).add(card_id)
+    existing = load_signatures(db, set().union(*candidates.values())) if candidates else {}
+
+    results = []
+    for index, sig in enumerate(signatures):
+        if sig is None:
+            results.append(([], []))
+            continue
+        scored = [
+            (similarity(sig, existing[card_id]), card_id)
+            for card_id in candidates.get(index, ()) if card_id in existing
+        ]
+        matches = [card_id for score, card_id in sorted(scored, reverse=True) if score >= threshold]
+        earlier = sorted({
+            other for band, bucket in enumerate(band_keys[index]) for other in local[(band, bucket)]
+            if other < index and similarity(sig, signatures[other]) >= threshold
+        })
+        results.append((matches, earlier))
+    return results
+
+def without_duplicates(matches: List[Tuple[List[int], List[int]]]) -> List[int]:
+    """按 find_duplicates 的结果选出要保留的下标：跳过与已有卡片、或与本批中保留下来的更早内容相似的"""
+    kept: List[int] = []
+    kept_set = set()
+    for index, (existing, earlier) in enumerate(matches):
+        if not existing and kept_set.isdisjoint(earlier):
+            kept.append(index)
+            kept_set.add(index)
+    return kept
+
+def duplicate_clusters(db: Session, owner: int, threshold: float = DUPLICATE_THRESHOLD) -> List[List[int]]:
+    """
+    用户卡片中的近似重复簇（每簇至少两张卡片，簇内按ID升序，簇按大小降序）
+
+    只读取有两张以上卡片的桶，对桶内候选对用签名确认后按并查集合并。
+    """
+    rows = db.query(
+        CardLshBucket.band, CardLshBucket.bucket, func.group_concat(CardLshBucket.card_id)
+    ).filter(CardLshBucket.owner == owner).group_by(
+        CardLshBucket.band, CardLshBucket.bucket
+    ).having(func.count() > 1).all()
+    buckets = [[int(card_id) for card_id in members.split(",")][:DUPLICATE_BUCKET_LIMIT] for _, _, members in rows]
+    signatures = load_signatures(db, {card_id for members in buckets for card_id in members})
+
+    parent: Dict[int, int] = {}
+
+    def find(card_id: int) -> int:
+        root = parent.setdefault(card_id, card_id)
+        while root != parent[root]:
+            parent[root] = parent[parent[root]]
+            root = parent[root]
+        return root
+
+    for members in buckets:
+        for i, first in enumerate(members):
+            for second in members[i + 1:]:
+                if find(first) != find(second) and similarity(signatures[first], signatures[second]) >= threshold:
+                    parent[find(second)] = find(first)
+
+    clusters: Dict[int, List[int]] = {}
+    for card_id in parent:
+        clusters.setdefault(find(card_id), []).append(card_id)
+    return sorted(
+        (sorted(members) for members in clusters.values() if len(members) > 1),
+        key=lambda members: (-len(members), members[0]),
+    )
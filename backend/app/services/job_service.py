@@ -0,0 +1,606 @@
+"""
+后台任务服务 - 有界线程池执行耗时的按用户操作
+
+任务记录保存在 jobs 表中，包含状态、进度、结果位置和取消标记：
+- 提交后立即返回任务记录，客户端轮询进度
+- 每个任务在独立的数据库会话中分块执行、分块提交，避免长时间占用写锁
+- 多个工作进程共用 jobs 表：任务由条件更新（status 仍为 pending）原子地领取，只有一个进程能执行
+- 执行中的任务由领取它的进程定期更新心跳；心跳超时的任务（进程已退出）标记为失败，
+  长时间未被领取的任务由其他进程重新排队
+"""
+
+import inspect
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models import CardTombstone, Job, MemoryCard, Session as DrawSession, TagBitmap, UserDrawSettings, User, make_content_preview
+from ..utils.database import DATABASE_DIR, SessionLocal
+from ..utils.events import publish
+from ..utils.metrics import registry
+from ..utils.sharding import route_to_user
+from ..utils.coherence import bump_versions, delete_user_versions
+from .leaderboard_service import delete_user_entries
+from .stats_service import StatsService, stats_cache
+from .sync_service import allocate_change_seqs, record_bulk_deletes
+from ..schemas import MemoryCardCreate
+from .tag_service import MAX_TAGS_PER_CARD, forget_cards, normalize_tags, set_card_tags
+from .duplicate_service import (
+    DUPLICATE_MODES, find_duplicates, index_signatures, rebuild_duplicate_index, unindex_cards, without_duplicates
+)
+from ..utils.minhash import signature
+from ..utils.anki import AnkiCollection, extract_collection, note_to_card
+from ..utils.tag_expression import TAG_PREFIX, TagExpressionError, is_tag_expression, normalize_tag
+
+logger = logging.getLogger(__name__)
+
+# 后台任务配置
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "500"))
+JOB_MAX_ACTIVE_PER_USER = int(os.getenv("JOB_MAX_ACTIVE_PER_USER", "3"))
+JOB_RESULT_DIR = Path(os.getenv("JOB_RESULT_DIR", str(DATABASE_DIR / "job_results")))
+# 任务的上传文件（如 Anki 牌组包），任务结束后删除
+JOB_UPLOAD_DIR = Path(os.getenv("JOB_UPLOAD_DIR", str(DATABASE_DIR / "job_uploads")))
+# 心跳间隔和超时（秒）：执行中的任务超过超时时间没有心跳即视为所在进程已退出
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_HEARTBEAT_TIMEOUT = float(os.getenv("JOB_HEARTBEAT_TIMEOUT", "60"))
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (PENDING, RUNNING)
+
+registry.describe("jobs_total", "counter", "按类型和最终状态统计的后台任务数")
+
+class JobCancelled(Exception):
+    """任务被取消"""
+
+class JobContext:
+    """传给任务处理函数的上下文"""
+
+    def __init__(self, runner: "JobRunner", db: Session, job: Job):
+        self.runner = runner
+        self.db = db
+        self.job = job
+        self.job_id = job.id
+        self.user_id = job.user_id
+        self.params: Dict[str, Any] = job.params or {}
+
+    def report(self, done: int, total: int, message: Optional[str] = None):
+        """更新进度（按百分比变化提交，避免频繁写库）"""
+        progress = min(99, int(done * 100 / total)) if total else 99
+        if progress != self.job.progress or message != self.job.progress_message:
+            self.job.progress = progress
+            self.job.progress_message = message
+            self.db.commit()
+
+    def check_cancelled(self):
+        if self.runner.is_cancel_requested(self.job_id, self.db):
+            raise JobCancelled()
+
+JOB_HANDLERS: Dict[str, Callable[[JobContext], Dict[str, Any]]] = {}
+
+# 需要上传文件的任务类型，只能通过各自的上传接口提交
+UPLOAD_JOB_TYPES = {"import_apkg"}
+
+def upload_path(params: Dict[str, Any]) -> Optional[Path]:
+    """任务的上传文件路径（只取文件名，不会指向上传目录之外）"""
+    upload = params.get("upload")
+    return JOB_UPLOAD_DIR / Path(upload).name if upload else None
+
+def _discard_upload(job: Job):
+    """删除已结束任务的上传文件"""
+    path = upload_path(job.params or {})
+    if path is not None:
+        path.unlink(missing_ok=True)
+
+def job_handler(job_type: str):
+    """注册任务处理函数"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+class JobRunner:
+    """进程内后台任务执行器"""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._cancelled = set()
+        # 已提交到本进程线程池、尚未结束的任务ID，以及其中已领取在执行的
+        self._queued = set()
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动线程池和心跳线程，并接手已失去执行者的任务"""
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        JOB_RESULT_DIR.mkdir(parents=True, exist_ok=True)
+        JOB_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        self.recover(startup=True)
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout=5)
+            self._heartbeat = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                self.heartbeat()
+                self.recover()
+            except Exception:
+                logger.exception("后台任务心跳失败")
+
+    def heartbeat(self):
+        """更新本进程执行中任务的心跳"""
+        with self._lock:
+            running = list(self._running)
+        if not running:
+            return
+        db = SessionLocal()
+        try:
+            db.query(Job).filter(
+                Job.id.in_(running), Job.worker_id == self.worker_id, Job.status == RUNNING
+            ).update({Job.heartbeat_at: datetime.now(timezone.utc)}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def recover(self, startup: bool = False):
+        """
+        心跳超时的执行中任务标记为失败；未开始的任务提交到本进程线程池
+
+        启动时接手全部未开始的任务，之后只接手排队超过心跳超时时间的（提交它的进程可能已退出）。
+        同一任务可能被多个进程提交，执行前的领取保证只有一个进程执行。
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=JOB_HEARTBEAT_TIMEOUT)
+        db = SessionLocal()
+        failed = 0
+        try:
+            stale = db.query(Job).filter(
+                Job.status == RUNNING, func.coalesce(Job.heartbeat_at, Job.started_at) < cutoff
+            ).all()
+            for job in stale:
+                # 条件更新：查询之后执行者可能刚更新了心跳，或其他进程已处理了同一任务
+                failed += db.query(Job).filter(
+                    Job.id == job.id, Job.status == RUNNING,
+                    func.coalesce(Job.heartbeat_at, Job.started_at) < cutoff,
+                ).update({
+                    Job.status: FAILED,
+                    Job.error: "执行任务的进程已退出，任务执行中断",
+                    Job.finished_at: datetime.now(timezone.utc),
+                }, synchronize_session=False)
+            db.commit()
+            for job in stale:
+                db.refresh(job)
+                if job.status == FAILED:
+                    _discard_upload(job)
+                    registry.inc("jobs_total", {"job_type": job.job_type, "status": FAILED})
+
+            pending = db.query(Job.id).filter(Job.status == PENDING)
+            if not startup:
+                pending = pending.filter(Job.created_at < cutoff)
+            pending_ids = [job_id for (job_id,) in pending.order_by(Job.id)]
+        finally:
+            db.close()
+
+        if failed:
+            logger.warning("%d 个后台任务因执行进程退出而失败", failed)
+        for job_id in pending_ids:
+            self._enqueue(job_id)
+
+    def _enqueue(self, job_id: int):
+        with self._lock:
+            if job_id in self._queued or self._executor is None:
+                return
+            self._queued.add(job_id)
+            self._executor.submit(self._run, job_id)
+
+    def submit(self, db: Session, user_id: int, job_type: str, params: Dict[str, Any]) -> Job:
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f"不支持的任务类型: {job_type}")
+
+        active = db.query(Job).filter(Job.user_id == user_id, Job.status.in_(ACTIVE_STATUSES)).count()
+        if active >= JOB_MAX_ACTIVE_PER_USER:
+            raise RuntimeError(f"进行中的任务不能超过 {JOB_MAX_ACTIVE_PER_USER} 个")
+
+        job = Job(user_id=user_id, job_type=job_type, status=PENDING, params=params, progress=0)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        if self._executor is None:
+            self.start()
+        self._enqueue(job.id)
+        return job
+
+    def cancel(self, db: Session, job: Job) -> Job:
+        """
+        未开始的任务直接取消；执行中的任务在下一个检查点停止
+
+        两步都是条件更新：任务可能同时被某个进程领取，取消不会覆盖 running，领取也不会覆盖 cancelled。
+        """
+        cancelled = db.query(Job).filter(Job.id == job.id, Job.status == PENDING).update(
+            {Job.status: CANCELLED, Job.finished_at: datetime.now(timezone.utc)}, synchronize_session=False
+        )
+        if not cancelled and db.query(Job).filter(Job.id == job.id, Job.status == RUNNING).update(
+            {Job.cancel_requested: True}, synchronize_session=False
+        ):
+            with self._lock:
+                self._cancelled.add(job.id)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def is_cancel_requested(self, job_id: int, db: Optional[Session] = None) -> bool:
+        """本进程收到的取消请求；传入会话时还读取 jobs 表中的取消标记（取消请求可能由其他工作进程处理）"""
+        with self._lock:
+            if job_id in self._cancelled:
+                return True
+        if db is None:
+            return False
+        return bool(db.query(Job.cancel_requested).filter(Job.id == job_id).scalar())
+
+    def _claim(self, db: Session, job_id: int) -> bool:
+        """领取任务：只有 status 仍为 pending 时才改为 running，多个进程中只有一个能成功"""
+        now = datetime.now(timezone.utc)
+        claimed = db.query(Job).filter(Job.id == job_id, Job.status == PENDING).update({
+            Job.status: RUNNING, Job.worker_id: self.worker_id, Job.started_at: now, Job.heartbeat_at: now,
+        }, synchronize_session=False)
+        db.commit()
+        return bool(claimed)
+
+    def _run(self, job_id: int):
+        db = SessionLocal()
+        try:
+            if not self._claim(db, job_id):
+                job = db.get(Job, job_id)
+                if job is not None and job.status not in ACTIVE_STATUSES:
+                    _discard_upload(job)
+                return
+            with self._lock:
+                self._running.add(job_id)
+            job = db.get(Job, job_id)
+            route_to_user(db, job.user_id)
+
+            try:
+                result = JOB_HANDLERS[job.job_type](JobContext(self, db, job))
+                job.status = SUCCEEDED
+                job.result = result
+                job.progress = 100
+                job.progress_message = None
+            except JobCancelled:
+                db.rollback()
+                job.status = CANCELLED
+            except Exception as e:
+                db.rollback()
+                logger.exception("后台任务 #%d (%s) 失败", job_id, job.job_type)
+                job.status = FAILED
+                job.error = str(e)
+
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+            _discard_upload(job)
+            registry.inc("jobs_total", {"job_type": job.job_type, "status": job.status})
+        finally:
+            with self._lock:
+                self._cancelled.discard(job_id)
+                self._queued.discard(job_id)
+                self._running.discard(job_id)
+            db.close()
+
+job_runner = JobRunner()
+
+# ===== 任务处理函数 =====
+def _chunks(items, size: int = JOB_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _import_chunks(ctx: JobContext, chunks: Iterable[Tuple[List[Dict[str, Any]], int]], total: int, mode: str) -> Dict[str, Any]:
+    """
+    分块导入卡片，chunks 产出 (本块的卡片, 本块消耗的源记录数)；卡片为 {content, card_type, notes, tags}
+
+    每块单独提交：批量插入、建立近似重复索引和标签位图、递增缓存版本后发布变更事件。
+    """
+    if mode not in DUPLICATE_MODES:
+        raise ValueError(f"不支持的近似重复处理方式: {mode}")
+    imported = skipped = done = 0
+    flagged: Dict[str, Any] = {}
+    for chunk, consumed in chunks:
+        ctx.check_cancelled()
+        done += consumed
+        signatures = [signature(card["content"]) for card in chunk]
+        # 之前的块已提交并建立索引，块之间的重复也能查到
+        matches = find_duplicates(ctx.db, ctx.user_id, signatures) if mode != "allow" and chunk else None
+        kept = without_duplicates(matches) if mode == "skip" else list(range(len(chunk)))
+        skipped += len(chunk) - len(kept)
+        chunk = [chunk[index] for index in kept]
+        if not chunk:
+            ctx.report(done, total, f"已导入 {imported}/{total}")
+            continue
+        # 批量插入不经过 flush 钩子和属性事件，需要自行分配变更序号、生成摘要、递增缓存版本
+        seq = allocate_change_seqs(ctx.db, len(chunk))
+        ctx.db.bulk_insert_mappings(MemoryCard, [
+            {
+                "content": card["content"],
+                "content_preview": make_content_preview(card["content"]),
+                "card_type": card["card_type"],
+                "notes": card.get("notes"),
+                "owner": ctx.user_id,
+                "appear_count": 0,
+                "change_seq": seq + offset,
+            }
+            for offset, card in enumerate(chunk)
+        ])
+        # 批量插入拿不到ID，按变更序号找回后建立近似重复索引
+        id_by_seq = dict(ctx.db.query(MemoryCard.change_seq, MemoryCard.id).filter(
+            MemoryCard.owner == ctx.user_id, MemoryCard.change_seq >= seq, MemoryCard.change_seq < seq + len(chunk)
+        ).all())
+        card_ids = [id_by_seq[seq + offset] for offset in range(len(chunk))]
+        index_signatures(ctx.db, ctx.user_id, {
+            card_id: signatures[index] for card_id, index in zip(card_ids, kept)
+        }, is_new=True)
+        tags_by_card = {card_id: card["tags"] for card_id, card in zip(card_ids, chunk) if card.get("tags")}
+        if tags_by_card:
+            set_card_tags(ctx.db, ctx.user_id, tags_by_card, is_new=True)
+        if mode == "flag":
+            id_by_index = dict(zip(kept, card_ids))
+            for card_id, index in zip(card_ids, kept):
+                existing, earlier = matches[index]
+                if existing or earlier:
+                    flagged[str(card_id)] = existing + [id_by_index[other] for other in earlier]
+        bump_versions(ctx.db, [ctx.user_id])
+        ctx.db.commit()
+        imported += len(chunk)
+        ctx.report(done, total, f"已导入 {imported}/{total}")
+        type_counts_delta = {}
+        for card in chunk:
+            type_counts_delta[card["card_type"]] = type_counts_delta.get(card["card_type"], 0) + 1
+        publish(ctx.user_id, "cards_changed", {"type_counts_delta": type_counts_delta, "bulk": True})
+    result = {"imported": imported, "skipped": skipped}
+    if mode == "flag":
+        result["flagged"] = flagged
+    return result
+
+@job_handler("import_cards")
+def import_cards(ctx: JobContext) -> Dict[str, Any]:
+    """
+    批量导入卡片，params: {"cards": [{content, card_type, notes, tags}], "duplicates": "allow" / "flag" / "skip"}
+
+    duplicates 为 flag 时结果中的 flagged 为 {新卡片ID: 相似卡片ID列表}，为 skip 时不导入近似重复的卡片。
+    """
+    cards = []
+    for index, card in enumerate(ctx.params.get("cards") or []):
+        try:
+            card = MemoryCardCreate.model_validate(card).model_dump()
+            card["tags"] = normalize_tags(card["tags"] or [])
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            raise ValueError(f"第 {index + 1} 张卡片无效: {field} {error['msg']}")
+        except TagExpressionError as e:
+            raise ValueError(f"第 {index + 1} 张卡片无效: {e}")
+        cards.append(card)
+    chunks = ((chunk, len(chunk)) for chunk in _chunks(cards))
+    return _import_chunks(ctx, chunks, len(cards), ctx.params.get("duplicates", "allow"))
+
+def _anki_tags(tags: List[str]) -> List[str]:
+    """Anki 标签转为本系统的标签：层级分隔符 :: 换成 /，丢弃不合法的标签"""
+    result = []
+    for tag in tags:
+        try:
+            result.append(normalize_tag(tag.replace("::", "/").replace(":", "_")))
+        except TagExpressionError:
+            continue
+    return list(dict.fromkeys(result))[:MAX_TAGS_PER_CARD]
+
+def _anki_card_type(name: str) -> str:
+    """笔记类型名转为卡片类型：合并空白、截断到 50 个字符，避免被抽题设置当作标签表达式"""
+    card_type = " ".join(name.split())[:50] or "Anki"
+    if is_tag_expression(card_type):
+        card_type = card_type.replace("(", "[").replace(")", "]")
+        if card_type.startswith(TAG_PREFIX):
+            card_type = "tag_" + card_type[len(TAG_PREFIX):]
+    return card_type
+
+@job_handler("import_apkg")
+def import_apkg(ctx: JobContext) -> Dict[str, Any]:
+    """
+    导入上传的 Anki 牌组包（POST /api/cards/import/apkg 提交），params:
+    {"upload": 上传文件名, "type_map": {笔记类型名: 卡片类型}, "card_type": 可选, "tags": true, "duplicates": ...}
+
+    卡片类型依次取 card_type、type_map 中的映射、笔记类型名（见 _anki_card_type）。
+    集合数据库解压到任务目录下的临时文件，按笔记ID分页读取，每页作为一块导入，内存占用与牌组大小无关。
+    """
+    type_map = ctx.params.get("type_map") or {}
+    forced_type = ctx.params.get("card_type")
+    with_tags = ctx.params.get("tags", True)
+    empty = 0
+
+    def chunks(collection: AnkiCollection):
+        nonlocal empty
+        for notes in collection.iter_notes(JOB_CHUNK_SIZE):
+            cards = []
+            for note in notes:
+                card = note_to_card(note)
+                if card is None:
+                    empty += 1
+                    continue
+                card["card_type"] = _anki_card_type(forced_type or type_map.get(note.note_type) or note.note_type)
+                card["tags"] = _anki_tags(note.tags) if with_tags else []
+                cards.append(card)
+            yield cards, len(notes)
+
+    with tempfile.TemporaryDirectory(dir=JOB_UPLOAD_DIR) as work_dir:
+        ctx.report(0, 1, "正在解压牌组包")
+        collection_path = extract_collection(upload_path(ctx.params), Path(work_dir) / "collection.db")
+        with AnkiCollection(collection_path) as collection:
+            total = collection.count_notes()
+            result = _import_chunks(ctx, chunks(collection), total, ctx.params.get("duplicates", "allow"))
+    result.update({"notes": total, "empty": empty})
+    return result
+
+@job_handler("export_cards")
+def export_cards(ctx: JobContext) -> Dict[str, Any]:
+    """导出用户全部卡片和会话到 JSON 文件，结果通过 /api/jobs/{id}/result 下载"""
+    total_cards = ctx.db.query(MemoryCard).filter(MemoryCard.owner == ctx.user_id).count()
+    file_name = f"export_{ctx.job_id}.json"
+    path = JOB_RESULT_DIR / file_name
+    exported = 0
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"user_id": %d, "export_date": %s, "cards": [' % (
+            ctx.user_id, json.dumps(datetime.now(timezone.utc).isoformat())
+        ))
+        # 按主键分页读取：进度提交会结束事务，不能跨提交保持游标
+        last_id = 0
+        while True:
+            rows = ctx.db.query(
+                MemoryCard.id, MemoryCard.content, MemoryCard.card_type, MemoryCard.notes,
+                MemoryCard.appear_count, MemoryCard.last_appeared_session
+            ).filter(
+                MemoryCard.owner == ctx.user_id, MemoryCard.id > last_id
+            ).order_by(MemoryCard.id).limit(JOB_CHUNK_SIZE).all()
+            if not rows:
+                break
+            for row in rows:
+                if exported:
+                    f.write(",")
+                f.write(json.dumps(row._asdict(), ensure_ascii=False))
+                exported += 1
+            last_id = rows[-1].id
+            ctx.check_cancelled()
+            ctx.report(exported, total_cards, f"已导出 {exported}/{total_cards}")
+
+        f.write('], "sessions": [')
+        sessions = ctx.db.query(DrawSession).filter(
+            DrawSession.user_id == ctx.user_id
+        ).order_by(DrawSession.session_number.asc()).all()
+        f.write(",".join(
+            json.dumps({
+                "session_number": session.session_number,
+                "date": session.created_at.isoformat(),
+                "settings_used": session.settings_used
+            }, ensure_ascii=False)
+            for session in sessions
+        ))
+        f.write("]}")
+
+    ctx.job.result_location = file_name
+    return {"cards": exported, "sessions": len(sessions)}
+
+@job_handler("rebuild_duplicate_index")
+def rebuild_duplicates(ctx: JobContext) -> Dict[str, Any]:
+    """由卡片内容重建近似重复索引（启用该功能前创建的卡片、或修改签名参数之后）"""
+    indexed = rebuild_duplicate_index(ctx.db, ctx.user_id)
+    ctx.db.commit()
+    ctx.report(indexed, indexed, f"已索引 {indexed} 张卡片")
+    return {"indexed": indexed}
+
+@job_handler("rebuild_stats")
+def rebuild_stats(ctx: JobContext) -> Dict[str, Any]:
+    """
+    完整重算用户的各项统计，结果保存在任务记录中
+
+    直接调用未包装的查询方法，不读进程内缓存，也不共享进行中的计算；
+    完成后清除该用户的统计缓存，之后的统计请求同样重新计算。
+    """
+    stats_service = StatsService(ctx.db)
+    steps = [
+        ("overview", StatsService.get_user_overview, ()),
+        ("cards", StatsService.get_card_statistics, ()),
+        ("sessions", StatsService.get_session_analytics, (365,)),
+        ("progress", StatsService.get_learning_progress, ()),
+    ]
+    result = {}
+    for index, (name, method, args) in enumerate(steps):
+        ctx.check_cancelled()
+        result[name] = inspect.unwrap(method)(stats_service, ctx.user_id, *args)
+        ctx.report(index + 1, len(steps), f"已完成 {name}")
+    stats_cache.invalidate_user(ctx.user_id)
+    return result
+
+def _delete_in_chunks(ctx: JobContext, model, id_column, condition, label: str, done: int, total: int) -> int:
+    """按主键分块删除，每块单独提交以尽快释放写锁"""
+    deleted = 0
+    while True:
+        ctx.check_cancelled()
+        ids = [row[0] for row in ctx.db.query(id_column).filter(condition).limit(JOB_CHUNK_SIZE)]
+        if not ids:
+            return deleted
+        if model is MemoryCard:
+            forget_cards(ctx.db, ctx.user_id, ids)
+            unindex_cards(ctx.db, ids)
+        ctx.db.query(model).filter(id_column.in_(ids)).delete(synchronize_session=False)
+        if model is MemoryCard:
+            record_bulk_deletes(ctx.db, ctx.user_id, ids)
+        bump_versions(ctx.db, [ctx.user_id])
+        ctx.db.commit()
+        deleted += len(ids)
+        ctx.report(done + deleted, total, f"已删除{label} {deleted}")
+
+@job_handler("delete_deck")
+def delete_deck(ctx: JobContext) -> Dict[str, Any]:
+    """删除用户卡片，params: {"card_type": 可选}；不指定类型时同时删除会话记录"""
+    card_type = ctx.params.get("card_type")
+    card_condition = MemoryCard.owner == ctx.user_id
+    if card_type:
+        card_condition = card_condition & (MemoryCard.card_type == card_type)
+
+    total = ctx.db.query(MemoryCard).filter(card_condition).count()
+    if not card_type:
+        total += ctx.db.query(DrawSession).filter(DrawSession.user_id == ctx.user_id).count()
+
+    deleted_cards = _delete_in_chunks(ctx, MemoryCard, MemoryCard.id, card_condition, "卡片", 0, total)
+    deleted_sessions = 0
+    if not card_type:
+        deleted_sessions = _delete_in_chunks(
+            ctx, DrawSession, DrawSession.id, DrawSession.user_id == ctx.user_id, "会话", deleted_cards, total
+        )
+    # 批量删除无法给出精确增量，通知客户端重新加载
+    publish(ctx.user_id, "resync", {"reason": "delete_deck"})
+    return {"deleted_cards": deleted_cards, "deleted_sessions": deleted_sessions}
+
+@job_handler("delete_user")
+def delete_user(ctx: JobContext) -> Dict[str, Any]:
+    """删除用户及其全部卡片、会话、设置、删除记录、排行榜计数和缓存版本"""
+    ctx.params = {}
+    result = delete_deck(ctx)
+    ctx.check_cancelled()
+    ctx.db.query(UserDrawSettings).filter(UserDrawSettings.user_id == ctx.user_id).delete(synchronize_session=False)
+    ctx.db.query(TagBitmap).filter(TagBitmap.owner == ctx.user_id).delete(synchronize_session=False)
+    ctx.db.query(CardTombstone).filter(CardTombstone.owner == ctx.user_id).delete(synchronize_session=False)
+    ctx.db.query(User).filter(User.id == ctx.user_id).delete(synchronize_session=False)
+    # 各进程据此丢弃该用户的排名和缓存条目
+    delete_user_entries(ctx.db, ctx.user_id)
+    delete_user_versions(ctx.db, ctx.user_id)
+    ctx.db.commit()
+    result["deleted_user"] = ctx.user_id
+    return result
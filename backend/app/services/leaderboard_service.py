@@ -0,0 +1,217 @@
+"""
+排行榜服务 - 跨用户的周榜和连续练习天数榜
+
+抽题时在同一事务中更新 leaderboard_entries 表中的计数（按时间桶分行）：
+- sessions：本周抽题次数，按 ISO 周分桶
+- cards：本周抽中卡片数，按 ISO 周分桶
+- streak：连续练习天数，按最后练习日分桶；当天第一次抽题时把昨天桶中的天数加一移到今天的桶
+
+每次写入时分配全局递增的 seq（同一条语句写入的各行相同）。各进程在内存中为每个时间桶维护一个 RankedScores
+（utils/ranking.py），读取榜单前只增量读取 seq 大于上次所见的行，取前 k 名和查询名次
+都不需要扫描计数表或会话表。超出保留期的时间桶从内存中丢弃，并由写入路径定期删除。
+删除用户时删除其计数行并更新保留的 reset 计数行，各进程见到该行变化时重新读取全部计数。
+"""
+
+import heapq
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, event, func, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from ..models import LeaderboardEntry
+from ..utils.database import SessionLocal
+from ..utils.metrics import registry
+from ..utils.ranking import RankedScores
+
+# 周榜计数保留的周数（至少 2：本周和上周）
+LEADERBOARD_RETENTION_WEEKS = max(2, int(os.getenv("LEADERBOARD_RETENTION_WEEKS", "4")))
+# 一次最多返回的名次数
+LEADERBOARD_MAX_LIMIT = 100
+
+# 榜单名 -> (计数器, 时间桶粒度, 说明)
+BOARDS: Dict[str, Tuple[str, str, str]] = {
+    "sessions_week": ("sessions", "week", "本周抽题次数"),
+    "cards_week": ("cards", "week", "本周抽中卡片数"),
+    "streak": ("streak", "day", "连续练习天数"),
+}
+PERIODS = ("current", "previous")
+# 保留的计数器：删除用户时更新，通知各进程重建排名结构
+RESET_COUNTER = "reset"
+
+# 本事务中写入过排行榜计数的标记（存放在 Session.info 中）
+LEADERBOARD_MODIFIED_KEY = "leaderboard_modified"
+
+registry.describe("leaderboard_updates_total", "counter", "排行榜计数的更新次数")
+registry.describe("leaderboard_index_loads_total", "counter", "从数据库读取排行榜计数的行数")
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+def week_period(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def board_periods(board: str, period: str = "current", day: Optional[date] = None) -> List[str]:
+    """榜单视图包含的时间桶"""
+    _, unit, _ = BOARDS[board]
+    day = day or today()
+    if unit == "week":
+        return [week_period(day - timedelta(weeks=1) if period == "previous" else day)]
+    if period == "previous":
+        raise ValueError("连续练习天数榜没有上一期")
+    # 昨天练习过、今天还没练习的用户，连续记录仍然有效
+    return [day.isoformat(), (day - timedelta(days=1)).isoformat()]
+
+def _oldest_live_period(unit: str, day: date) -> str:
+    """内存中需要保留的最早时间桶：周榜为上周，连续天数为昨天"""
+    if unit == "week":
+        return week_period(day - timedelta(weeks=1))
+    return (day - timedelta(days=1)).isoformat()
+
+def _write(db: Session, user_id: int, scores: Dict[Tuple[str, str], int], increment: bool):
+    """用一条语句写入该用户的多个计数 {(计数器, 时间桶): 分数}，各行的 seq 相同"""
+    table = LeaderboardEntry.__table__
+    next_seq = select(func.coalesce(func.max(table.c.seq), 0) + 1).scalar_subquery()
+    statement = sqlite_insert(table).values([
+        {"counter": counter, "period": period, "user_id": user_id, "score": score, "seq": next_seq}
+        for (counter, period), score in scores.items()
+    ])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.counter, table.c.period, table.c.user_id],
+        set_={
+            "score": table.c.score + statement.excluded.score if increment else statement.excluded.score,
+            "seq": statement.excluded.seq,
+        },
+    ))
+    for counter, _ in scores:
+        registry.inc("leaderboard_updates_total", {"counter": counter})
+
+def _extend_streak(db: Session, user_id: int, day: date):
+    today_key, yesterday_key = day.isoformat(), (day - timedelta(days=1)).isoformat()
+    scores = dict(db.query(LeaderboardEntry.period, LeaderboardEntry.score).filter(
+        LeaderboardEntry.counter == "streak",
+        LeaderboardEntry.user_id == user_id,
+        LeaderboardEntry.period.in_([today_key, yesterday_key]),
+    ).all())
+    if scores.get(today_key, 0) > 0:
+        return
+    previous = scores.get(yesterday_key, 0)
+    streak = {("streak", today_key): previous + 1}
+    if previous:
+        streak[("streak", yesterday_key)] = 0
+    _write(db, user_id, streak, increment=False)
+
+# 本进程上次清理过期计数的日期
+_pruned_on: Optional[date] = None
+
+def _prune(db: Session, day: date):
+    """删除超出保留期的时间桶（每个进程每天一次）"""
+    global _pruned_on
+    if _pruned_on == day:
+        return
+    # 调用方刚写入了当前时间桶，最大 seq 所在的行不会被删除，seq 不会倒退
+    weekly_cutoff = week_period(day - timedelta(weeks=LEADERBOARD_RETENTION_WEEKS - 1))
+    expired = [
+        and_(LeaderboardEntry.counter == counter,
+             LeaderboardEntry.period < (weekly_cutoff if unit == "week" else _oldest_live_period(unit, day)))
+        for counter, unit, _ in BOARDS.values()
+    ]
+    db.query(LeaderboardEntry).filter(or_(*expired)).delete(synchronize_session=False)
+    _pruned_on = day
+
+def record_draw(db: Session, user_id: int, card_count: int, day: Optional[date] = None):
+    """在抽题事务中更新该用户的排行榜计数"""
+    day = day or today()
+    week = week_period(day)
+    counts = {("sessions", week): 1}
+    if card_count:
+        counts[("cards", week)] = card_count
+    _write(db, user_id, counts, increment=True)
+    _extend_streak(db, user_id, day)
+    _prune(db, day)
+    db.info[LEADERBOARD_MODIFIED_KEY] = True
+
+def delete_user_entries(db: Session, user_id: int):
+    """在当前事务中删除用户的全部计数，并通知各进程重建排名结构"""
+    db.query(LeaderboardEntry).filter(LeaderboardEntry.user_id == user_id).delete(synchronize_session=False)
+    _write(db, 0, {(RESET_COUNTER, ""): 1}, increment=True)
+    db.info[LEADERBOARD_MODIFIED_KEY] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(SessionLocal, "after_rollback")
+def _reset_leaderboard_modified(session: Session):
+    session.info.pop(LEADERBOARD_MODIFIED_KEY, None)
+
+class LeaderboardIndex:
+    """进程内的排名结构：{(计数器, 时间桶): RankedScores}，按 seq 增量刷新"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._buckets: Dict[Tuple[str, str], RankedScores] = {}
+
+    def refresh(self, db: Session, day: Optional[date] = None):
+        """读取 seq 大于上次所见的计数行，并丢弃过期的时间桶"""
+        if db.info.get(LEADERBOARD_MODIFIED_KEY):
+            # 本事务有未提交的计数：改用独立会话读取已提交的数据，避免把可能回滚的修改计入缓存
+            with SessionLocal() as other:
+                return self.refresh(other, day)
+
+        day = day or today()
+        oldest = {counter: _oldest_live_period(unit, day) for counter, unit, _ in BOARDS.values()}
+        with self._lock:
+            query = db.query(
+                LeaderboardEntry.counter, LeaderboardEntry.period, LeaderboardEntry.user_id,
+                LeaderboardEntry.score, LeaderboardEntry.seq,
+            )
+            rows = query.filter(LeaderboardEntry.seq > self._seq).all()
+            if any(row[0] == RESET_COUNTER for row in rows):
+                # 有用户被删除：增量读取看不到删除的行，改为重新读取全部计数
+                rows = query.all()
+                self._buckets.clear()
+            registry.inc("leaderboard_index_loads_total", value=len(rows))
+            for counter, period, user_id, score, seq in rows:
+                self._seq = max(self._seq, seq)
+                if counter in oldest and period >= oldest[counter]:
+                    self._buckets.setdefault((counter, period), RankedScores()).set(user_id, score)
+            for key in [key for key in self._buckets if key[1] < oldest.get(key[0], key[1])]:
+                del self._buckets[key]
+
+    def _view(self, db: Session, board: str, period: str) -> Tuple[List[str], List[RankedScores]]:
+        day = today()
+        periods = board_periods(board, period, day)
+        self.refresh(db, day)
+        counter = BOARDS[board][0]
+        with self._lock:
+            return periods, [self._buckets[(counter, key)] for key in periods if (counter, key) in self._buckets]
+
+    def top(self, db: Session, board: str, limit: int, period: str = "current") -> Dict:
+        """前 limit 名：{"periods", "total", "entries": [(名次, 用户ID, 分数)]}（同分同名次，按用户ID排列）"""
+        periods, buckets = self._view(db, board, period)
+        with self._lock:
+            # 同一用户只会出现在视图的一个时间桶中
+            merged = heapq.merge(*(bucket.top(limit) for bucket in buckets), key=lambda item: (-item[1], item[0]))
+            entries = [
+                (1 + sum(bucket.count_above(score) for bucket in buckets), user_id, score)
+                for user_id, score in list(merged)[:limit]
+            ]
+            total = sum(len(bucket) for bucket in buckets)
+        return {"periods": periods, "total": total, "entries": entries}
+
+    def rank(self, db: Session, board: str, user_id: int, period: str = "current") -> Dict:
+        """用户的名次和分数；没有计数时名次为 None、分数为 0"""
+        periods, buckets = self._view(db, board, period)
+        with self._lock:
+            score = next((bucket.scores[user_id] for bucket in buckets if user_id in bucket.scores), 0)
+            rank = 1 + sum(bucket.count_above(score) for bucket in buckets) if score else None
+            total = sum(len(bucket) for bucket in buckets)
+        return {"periods": periods, "total": total, "rank": rank, "score": score}
+
+    def clear(self):
+        with self._lock:
+            self._seq = 0
+            self._buckets.clear()
+
+leaderboard_index = LeaderboardIndex()
@@ -2,52 +2,78 @@
 统计服务 - 数据统计和分析
 """
 
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, asc, case
+import os
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy import bindparam, func, desc, asc, case, select
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone, timedelta
 from ..models import MemoryCard, Session as DrawSession, UserDrawSettings, User
+from ..utils.singleflight import singleflight
+from ..utils.coherence import CoherentCache, cached_per_user
+from ..utils.snapshot import ANALYTICS_SOURCE_KEY
+from ..utils.statements import hot_statement
+
+# 统计结果缓存：用户数据变化时失效；部分统计与当前时间有关（如最近7天），另设最长有效期（秒）
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "30"))
+stats_cache = CoherentCache("stats", ttl=STATS_CACHE_TTL)
+
+# 热点计数语句（见 utils/statements.py）
+# (总卡片数, 抽取过的卡片数)
+CARD_COUNTS = hot_statement(
+    select(func.count(), func.coalesce(func.sum(case((MemoryCard.appear_count > 0, 1), else_=0)), 0))
+    .select_from(MemoryCard).where(MemoryCard.owner == bindparam("user_id")),
+    user_id=-1,
+)
+# [(卡片类型, 卡片数)]
+CARDS_BY_TYPE = hot_statement(
+    select(MemoryCard.card_type, func.count())
+    .where(MemoryCard.owner == bindparam("user_id")).group_by(MemoryCard.card_type),
+    user_id=-1,
+)
+# (总会话数, since 之后的会话数)
+SESSION_COUNTS = hot_statement(
+    select(func.count(), func.coalesce(func.sum(case((DrawSession.created_at >= bindparam("since"), 1), else_=0)), 0))
+    .select_from(DrawSession).where(DrawSession.user_id == bindparam("user_id")),
+    user_id=-1, since=datetime(1970, 1, 1, tzinfo=timezone.utc),
+)
 
 class StatsService:
+    """
+    统计服务
+
+    查询方法都用 singleflight 包装：相同参数的并发调用只计算一次并共享结果。
+    结果缓存在进程内，按用户缓存版本号校验（见 utils/coherence.py）。
+    读分析快照的会话按快照代数与读主库的会话分开缓存（cache_scope，见 utils/snapshot.py）。
+    """
     
     def __init__(self, db: Session):
         self.db = db
+        self.cache_scope = db.info.get(ANALYTICS_SOURCE_KEY)
     
+    @cached_per_user(stats_cache)
+    @singleflight
     def get_user_overview(self, user_id: int) -> Dict[str, Any]:
         """获取用户总览统计"""
-        # 基础统计
-        total_cards = self.db.query(MemoryCard).filter(MemoryCard.owner == user_id).count()
-        total_sessions = self.db.query(DrawSession).filter(DrawSession.user_id == user_id).count()
-        
+        params = {"user_id": user_id, "since": datetime.now(timezone.utc) - timedelta(days=7)}
+        # 卡片总数和抽过的卡片数
+        total_cards, drawn_cards = self.db.execute(CARD_COUNTS, params).one()
+        # 会话总数和最近7天的会话数
+        total_sessions, recent_sessions = self.db.execute(SESSION_COUNTS, params).one()
         # 卡片类型分布
-        cards_by_type = self.db.query(
-            MemoryCard.card_type,
-            func.count(MemoryCard.id).label('count')
-        ).filter(MemoryCard.owner == user_id).group_by(MemoryCard.card_type).all()
-        
-        # 抽题统计
-        drawn_cards = self.db.query(MemoryCard).filter(
-            MemoryCard.owner == user_id,
-            MemoryCard.appear_count > 0
-        ).count()
-        
-        # 最近7天的抽题会话
-        seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        recent_sessions = self.db.query(DrawSession).filter(
-            DrawSession.user_id == user_id,
-            DrawSession.created_at >= seven_days_ago
-        ).count()
+        cards_by_type = self.db.execute(CARDS_BY_TYPE, params).all()
         
         return {
             "total_cards": total_cards,
             "total_sessions": total_sessions,
-            "cards_by_type": {row.card_type: row.count for row in cards_by_type},
+            "cards_by_type": {card_type: count for card_type, count in cards_by_type},
             "drawn_cards": drawn_cards,
             "never_drawn": total_cards - drawn_cards,
             "recent_sessions_7d": recent_sessions,
             "draw_rate": round(drawn_cards / total_cards * 100, 1) if total_cards > 0 else 0
         }
     
+    @cached_per_user(stats_cache)
+    @singleflight
     def get_card_statistics(self, user_id: int, card_type: Optional[str] = None) -> Dict[str, Any]:
         """获取卡片详细统计"""
         query = self.db.query(MemoryCard).filter(MemoryCard.owner == user_id)
@@ -55,14 +81,12 @@ class StatsService:
         if card_type:
             query = query.filter(MemoryCard.card_type == card_type)
         
-        cards = query.all()
-        
-        # 出现次数分布
-        appear_counts = [card.appear_count for card in cards]
+        # 只读取出现次数，不加载卡片文本
+        appear_counts = [row[0] for row in query.with_entities(MemoryCard.appear_count)]
         
         # 计算统计指标
         total_appears = sum(appear_counts)
-        avg_appears = round(total_appears / len(cards), 2) if cards else 0
+        avg_appears = round(total_appears / len(appear_counts), 2) if appear_counts else 0
         max_appears = max(appear_counts) if appear_counts else 0
         min_appears = min(appear_counts) if appear_counts else 0
         
@@ -72,6 +96,12 @@ class StatsService:
             key = str(count)
             appear_distribution[key] = appear_distribution.get(key, 0) + 1
         
+        # 列表只需要摘要，不加载完整内容和备注
+        query = query.options(load_only(
+            MemoryCard.id, MemoryCard.content_preview, MemoryCard.card_type,
+            MemoryCard.appear_count, MemoryCard.last_appeared_session
+        ))
+        
         # 最常出现的卡片
         most_drawn = query.filter(MemoryCard.appear_count > 0).order_by(
             desc(MemoryCard.appear_count), desc(MemoryCard.last_appeared_session)
@@ -81,7 +111,7 @@ class StatsService:
         never_drawn = query.filter(MemoryCard.appear_count == 0).limit(5).all()
         
         return {
-            "total_cards": len(cards),
+            "total_cards": len(appear_counts),
             "total_appears": total_appears,
             "avg_appears": avg_appears,
             "max_appears": max_appears,
@@ -90,7 +120,7 @@ class StatsService:
             "most_drawn_cards": [
                 {
                     "id": card.id,
-                    "content": card.content[:50] + "..." if len(card.content) > 50 else card.content,
+                    "content": card.content_preview,
                     "appear_count": card.appear_count,
                     "last_session": card.last_appeared_session
                 }
@@ -99,13 +129,15 @@ class StatsService:
             "never_drawn_cards": [
                 {
                     "id": card.id,
-                    "content": card.content[:50] + "..." if len(card.content) > 50 else card.content,
+                    "content": card.content_preview,
                     "card_type": card.card_type
                 }
                 for card in never_drawn
             ]
         }
     
+    @cached_per_user(stats_cache)
+    @singleflight
     def get_session_analytics(self, user_id: int, days: int = 30) -> Dict[str, Any]:
         """获取会话分析数据"""
         # 时间范围
@@ -161,6 +193,8 @@ class StatsService:
             "session_timeline": session_timeline[-10:]  # 最近10次会话
         }
     
+    @cached_per_user(stats_cache)
+    @singleflight
     def get_learning_progress(self, user_id: int) -> Dict[str, Any]:
         """获取学习进度分析"""
         # 按类型分析进度
@@ -190,9 +224,8 @@ class StatsService:
             "mastered": 0     # 6次以上
         }
         
-        cards = self.db.query(MemoryCard).filter(MemoryCard.owner == user_id).all()
-        for card in cards:
-            count = card.appear_count
+        cards = self.db.query(MemoryCard.appear_count).filter(MemoryCard.owner == user_id).all()
+        for (count,) in cards:
             if count == 0:
                 proficiency_levels["beginner"] += 1
             elif count <= 2:
@@ -208,6 +241,8 @@ class StatsService:
             "total_cards": len(cards)
         }
     
+    @cached_per_user(stats_cache)
+    @singleflight
     def get_recommendations(self, user_id: int) -> Dict[str, Any]:
         """获取学习建议"""
         recommendations = []
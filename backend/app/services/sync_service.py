@@ -0,0 +1,109 @@
+"""
+增量同步服务 - 基于变更序号和墓碑记录
+
+每次创建、修改或删除卡片时，在同一事务中从 sync_counters 分配单调递增的
+变更序号：存活卡片写入 MemoryCard.change_seq，删除的卡片写入 card_tombstones。
+客户端带上次的同步令牌（即已见到的最大序号）请求，只取回之后的变更。
+"""
+
+from typing import Any, Dict, List, Optional
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from ..models import MemoryCard, CardTombstone
+from ..utils.database import SessionLocal
+from ..utils.serialization import CARD_COLUMNS, card_row_to_dict
+
+CARD_CHANGE_COUNTER = "card_change_seq"
+
+def allocate_change_seqs(db: Session, count: int) -> int:
+    """
+    分配 count 个连续的变更序号，返回第一个
+
+    UPDATE 会取得 SQLite 写锁，直到事务提交，因此并发事务拿到的区间不会重叠。
+    计数器不存在时以现有最大序号初始化。
+    """
+    value = db.execute(
+        text("UPDATE sync_counters SET value = value + :count WHERE name = :name RETURNING value"),
+        {"count": count, "name": CARD_CHANGE_COUNTER},
+    ).scalar()
+    if value is None:
+        value = db.execute(
+            text(
+                "INSERT INTO sync_counters (name, value) "
+                "SELECT :name, COALESCE(MAX(change_seq), 0) + :count FROM memory_cards RETURNING value"
+            ),
+            {"count": count, "name": CARD_CHANGE_COUNTER},
+        ).scalar_one()
+    return value - count + 1
+
+@event.listens_for(SessionLocal, "before_flush")
+def assign_change_seqs(session: Session, flush_context, instances):
+    """flush 前为新增、修改的卡片分配变更序号，并为删除的卡片写墓碑"""
+    changed = [obj for obj in session.new if isinstance(obj, MemoryCard)]
+    changed += [
+        obj for obj in session.dirty
+        if isinstance(obj, MemoryCard) and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, MemoryCard)]
+    if not changed and not deleted:
+        return
+
+    seq = allocate_change_seqs(session, len(changed) + len(deleted))
+    for card in changed:
+        card.change_seq = seq
+        seq += 1
+    for card in deleted:
+        session.add(CardTombstone(card_id=card.id, owner=card.owner, change_seq=seq))
+        seq += 1
+
+def record_bulk_deletes(db: Session, owner: int, card_ids: List[int]):
+    """query().delete() 等批量删除不经过 flush，需要显式写墓碑"""
+    if not card_ids:
+        return
+    seq = allocate_change_seqs(db, len(card_ids))
+    db.bulk_insert_mappings(CardTombstone, [
+        {"card_id": card_id, "owner": owner, "change_seq": seq + offset}
+        for offset, card_id in enumerate(card_ids)
+    ])
+
+def get_changes(db: Session, owner: int, since: Optional[int], limit: int) -> Dict[str, Any]:
+    """
+    返回 since 之后的变更（按序号排序，最多 limit 条）
+
+    since 为空表示首次同步：只返回存活卡片，不需要墓碑。
+    """
+    since = since or 0
+    rows = db.query(*CARD_COLUMNS, MemoryCard.change_seq).filter(
+        MemoryCard.owner == owner,
+        MemoryCard.change_seq > since
+    ).order_by(MemoryCard.change_seq).limit(limit + 1).all()
+
+    tombstones = []
+    if since:
+        tombstones = db.query(CardTombstone.card_id, CardTombstone.change_seq).filter(
+            CardTombstone.owner == owner,
+            CardTombstone.change_seq > since
+        ).order_by(CardTombstone.change_seq).limit(limit + 1).all()
+
+    # 合并两路结果，按序号取前 limit 条
+    changes = sorted(
+        [(row[-1], "card", row) for row in rows] + [(row.change_seq, "deleted", row) for row in tombstones],
+        key=lambda item: item[0],
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    cards, deleted = [], []
+    for change_seq, kind, row in changes:
+        if kind == "card":
+            cards.append(card_row_to_dict(row[:-1]))
+        else:
+            deleted.append(row.card_id)
+
+    token = changes[-1][0] if changes else since
+    return {
+        "cards": cards,
+        "deleted": deleted,
+        "token": str(token),
+        "has_more": has_more,
+    }
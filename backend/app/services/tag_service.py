@@ -0,0 +1,234 @@
+"""
+标签服务 - 卡片标签与标签位图索引
+
+card_tags 表记录卡片与标签的多对多关系；tag_bitmaps 表为每个用户的每个标签保存
+一份卡片ID位图（Python 整数按小端字节序序列化后 zlib 压缩），在修改标签的同一事务中
+维护，每次修改分配新的变更序号作为 revision。
+
+各进程在内存中按用户缓存解码后的位图（tag_index），使用时只读取 revision 大于已见
+最大值的行：标签没有变化时这是一条走索引的空查询，随后表达式完全在内存中按位求值。
+"""
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from ..models import CardTag, MemoryCard, TagBitmap
+from ..utils.database import SessionLocal
+from ..utils.metrics import registry
+from ..utils.tag_expression import Node, TagExpressionError, TagSelection, evaluate, normalize_tag, parse
+from .sync_service import allocate_change_seqs
+
+# 每张卡片最多的标签数，以及内存中最多缓存位图的用户数
+MAX_TAGS_PER_CARD = int(os.getenv("MAX_TAGS_PER_CARD", "32"))
+TAG_INDEX_MAX_USERS = int(os.getenv("TAG_INDEX_MAX_USERS", "1000"))
+# 选中卡片不超过该数量时直接按ID查询，否则扫描用户卡片ID逐个判断
+TAG_ID_QUERY_LIMIT = int(os.getenv("TAG_ID_QUERY_LIMIT", "500"))
+
+# Session.info 中的标记：当前事务修改过标签（此时读到的位图可能回滚，不能进入进程缓存）
+TAGS_MODIFIED_KEY = "tags_modified"
+
+registry.describe("tag_index_loads_total", "counter", "从数据库读取标签位图的行数")
+
+def encode_bitmap(bits: int) -> bytes:
+    return zlib.compress(bits.to_bytes((bits.bit_length() + 7) // 8, "little"))
+
+def decode_bitmap(data: bytes) -> int:
+    return int.from_bytes(zlib.decompress(data), "little")
+
+def bits_from_ids(card_ids: Iterable[int]) -> int:
+    """由卡片ID构造位图（先写字节数组，避免逐个对大整数做或运算）"""
+    card_ids = list(card_ids)
+    if not card_ids:
+        return 0
+    data = bytearray(max(card_ids) // 8 + 1)
+    for card_id in card_ids:
+        data[card_id >> 3] |= 1 << (card_id & 7)
+    return int.from_bytes(data, "little")
+
+def normalize_tags(tags: Iterable[str]) -> List[str]:
+    """校验、去重标签列表（保持顺序）"""
+    result = list(dict.fromkeys(normalize_tag(tag) for tag in tags))
+    if len(result) > MAX_TAGS_PER_CARD:
+        raise TagExpressionError(f"每张卡片最多 {MAX_TAGS_PER_CARD} 个标签")
+    return result
+
+def apply_bitmap_changes(db: Session, owner: int, changes: Dict[str, Tuple[Set[int], Set[int]]]):
+    """按 {标签: (加入的卡片ID, 移除的卡片ID)} 更新位图，所有变化的标签共用一个新 revision"""
+    changes = {tag: change for tag, change in changes.items() if change[0] or change[1]}
+    if not changes:
+        return
+    revision = allocate_change_seqs(db, 1)
+    existing = {
+        row.tag: row for row in db.query(TagBitmap).filter(
+            TagBitmap.owner == owner, TagBitmap.tag.in_(list(changes))
+        )
+    }
+    for tag, (added, removed) in changes.items():
+        row = existing.get(tag)
+        bits = decode_bitmap(row.bitmap) if row is not None else 0
+        bits = (bits | bits_from_ids(added)) & ~bits_from_ids(removed)
+        # 标签清空后仍保留记录，保证每个用户的最大 revision 只增不减
+        if row is None:
+            row = TagBitmap(owner=owner, tag=tag)
+            db.add(row)
+        row.bitmap = encode_bitmap(bits)
+        row.card_count = bits.bit_count()
+        row.revision = revision
+    db.info[TAGS_MODIFIED_KEY] = True
+
+def get_card_tags(db: Session, card_ids: List[int]) -> Dict[int, List[str]]:
+    """卡片ID -> 标签列表（按名称排序）"""
+    result: Dict[int, List[str]] = {card_id: [] for card_id in card_ids}
+    if card_ids:
+        rows = db.query(CardTag.card_id, CardTag.tag).filter(CardTag.card_id.in_(card_ids)).order_by(CardTag.tag)
+        for card_id, tag in rows:
+            result[card_id].append(tag)
+    return result
+
+def set_card_tags(
+    db: Session, owner: int, tags_by_card: Dict[int, Iterable[str]], is_new: bool = False
+) -> Dict[int, List[str]]:
+    """
+    把各卡片的标签替换为给定列表（卡片须已 flush，有ID），返回规范化后的标签
+
+    is_new 表示刚创建的卡片，还没有标签，不必先查询。
+    """
+    normalized = {card_id: normalize_tags(tags) for card_id, tags in tags_by_card.items()}
+    current = {card_id: [] for card_id in normalized} if is_new else get_card_tags(db, list(normalized))
+    changes: Dict[str, Tuple[Set[int], Set[int]]] = {}
+    inserts, deletes = [], []
+    for card_id, tags in normalized.items():
+        old, new = set(current[card_id]), set(tags)
+        for tag in new - old:
+            changes.setdefault(tag, (set(), set()))[0].add(card_id)
+            inserts.append({"card_id": card_id, "tag": tag, "owner": owner})
+        for tag in old - new:
+            changes.setdefault(tag, (set(), set()))[1].add(card_id)
+            deletes.append((card_id, tag))
+    if inserts:
+        db.execute(CardTag.__table__.insert(), inserts)
+    for card_id, tag in deletes:
+        db.query(CardTag).filter(CardTag.card_id == card_id, CardTag.tag == tag).delete(synchronize_session=False)
+    apply_bitmap_changes(db, owner, changes)
+    return normalized
+
+def forget_cards(db: Session, owner: int, card_ids: List[int]):
+    """删除卡片前调用：移除它们的标签并更新位图"""
+    if not card_ids:
+        return
+    changes: Dict[str, Tuple[Set[int], Set[int]]] = {}
+    rows = db.query(CardTag.card_id, CardTag.tag).filter(CardTag.card_id.in_(card_ids)).all()
+    for card_id, tag in rows:
+        changes.setdefault(tag, (set(), set()))[1].add(card_id)
+    if rows:
+        db.query(CardTag).filter(CardTag.card_id.in_(card_ids)).delete(synchronize_session=False)
+    apply_bitmap_changes(db, owner, changes)
+
+def rebuild_bitmaps(db: Session, owner: int):
+    """由 card_tags 重建用户的全部标签位图（迁移或修复时使用）"""
+    card_ids: Dict[str, List[int]] = {}
+    for card_id, tag in db.query(CardTag.card_id, CardTag.tag).filter(CardTag.owner == owner):
+        card_ids.setdefault(tag, []).append(card_id)
+    bitmaps = {tag: bits_from_ids(ids) for tag, ids in card_ids.items()}
+    # 已不再使用的标签写成空位图，进程缓存才能通过 revision 得知变化
+    for (tag,) in db.query(TagBitmap.tag).filter(TagBitmap.owner == owner):
+        bitmaps.setdefault(tag, 0)
+    revision = allocate_change_seqs(db, 1)
+    db.query(TagBitmap).filter(TagBitmap.owner == owner).delete(synchronize_session=False)
+    db.bulk_insert_mappings(TagBitmap, [
+        {"owner": owner, "tag": tag, "bitmap": encode_bitmap(bits), "card_count": bits.bit_count(), "revision": revision}
+        for tag, bits in bitmaps.items()
+    ])
+    db.info[TAGS_MODIFIED_KEY] = True
+
+def tag_counts(db: Session, owner: int) -> Dict[str, int]:
+    """用户各标签的卡片数（不含已清空的标签）"""
+    rows = db.query(TagBitmap.tag, TagBitmap.card_count).filter(
+        TagBitmap.owner == owner, TagBitmap.card_count > 0
+    ).order_by(TagBitmap.tag)
+    return {tag: count for tag, count in rows}
+
+def restrict_to_selection(query, selection: TagSelection):
+    """
+    按表达式结果缩小卡片查询的范围，返回 (查询, 是否还需逐个判断)
+
+    结果为空时返回 None。正向的小集合直接转成 ID 条件，结果精确；
+    其余情况（补集或大集合）需要调用方对查询结果再用 selection.contains 过滤。
+    """
+    if not selection.negated:
+        if not selection.bits:
+            return None, False
+        if selection.count() <= TAG_ID_QUERY_LIMIT:
+            return query.filter(MemoryCard.id.in_(selection.card_ids())), False
+    return query, True
+
+def matching_card_ids(db: Session, owner: int, selection: TagSelection, *criteria) -> List[int]:
+    """用户卡片中被选中的ID（升序），criteria 为额外的过滤条件"""
+    query, check = restrict_to_selection(
+        db.query(MemoryCard.id).filter(MemoryCard.owner == owner, *criteria), selection
+    )
+    if query is None:
+        return []
+    ids = [card_id for (card_id,) in query.order_by(MemoryCard.id)]
+    return [card_id for card_id in ids if selection.contains(card_id)] if check else ids
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(SessionLocal, "after_rollback")
+def _reset_tags_modified(session: Session):
+    # 只在整个事务结束时清除：SAVEPOINT 回滚后，之前的操作可能仍有未提交的标签修改
+    session.info.pop(TAGS_MODIFIED_KEY, None)
+
+class TagIndex:
+    """进程内的标签位图缓存，按 revision 增量刷新"""
+
+    def __init__(self, max_users: int = TAG_INDEX_MAX_USERS):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        # 用户ID -> (已见到的最大 revision, {标签: 位图})
+        self._users: "OrderedDict[int, Tuple[int, Dict[str, int]]]" = OrderedDict()
+
+    def _load(self, db: Session, owner: int, since: int) -> List[Tuple[str, bytes, int]]:
+        rows = db.query(TagBitmap.tag, TagBitmap.bitmap, TagBitmap.revision).filter(
+            TagBitmap.owner == owner, TagBitmap.revision > since
+        ).all()
+        registry.inc("tag_index_loads_total", value=len(rows))
+        return rows
+
+    def bitmaps(self, db: Session, owner: int) -> Dict[str, int]:
+        """用户当前的 {标签: 位图}"""
+        if db.info.get(TAGS_MODIFIED_KEY):
+            # 本事务有未提交的标签修改：直接读取，不更新进程缓存
+            return {tag: decode_bitmap(bitmap) for tag, bitmap, _ in self._load(db, owner, 0)}
+
+        with self._lock:
+            revision, bitmaps = self._users.get(owner, (0, {}))
+        rows = self._load(db, owner, revision)
+        if rows:
+            bitmaps = dict(bitmaps)
+            for tag, bitmap, row_revision in rows:
+                bitmaps[tag] = decode_bitmap(bitmap)
+                revision = max(revision, row_revision)
+        with self._lock:
+            cached = self._users.get(owner)
+            # 并发刷新时保留 revision 更大的结果
+            if cached is None or cached[0] <= revision:
+                self._users[owner] = (revision, bitmaps)
+            self._users.move_to_end(owner)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return bitmaps
+
+    def select(self, db: Session, owner: int, expression: str, node: Optional[Node] = None) -> TagSelection:
+        """对标签表达式求值"""
+        node = node or parse(expression)
+        return evaluate(node, self.bitmaps(db, owner))
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+tag_index = TagIndex()
@@ -0,0 +1,184 @@
+"""
+Anki 牌组包读取 - 从 .apkg 中解出集合数据库，按主键分页读取笔记
+
+.apkg 是 zip 包，其中的集合是一个 SQLite 数据库：
+- notes 表每行一条笔记：mid 为笔记类型ID，flds 为 \\x1f 分隔的字段，tags 为空格分隔的标签
+- 笔记类型名称在 notetypes 表中（新版结构），或在 col 表 models 列的 JSON 中（旧版结构）
+
+新版 Anki 默认导出 zstd 压缩的 collection.anki21b（需要可选依赖 zstandard），包中的
+collection.anki2 只剩一条提示升级的笔记，因此按 anki21b、anki21、anki2 的顺序选择。
+集合逐块解压到磁盘文件后用 sqlite3 只读打开，内存占用与牌组大小无关。
+"""
+
+import html
+import json
+import os
+import re
+import sqlite3
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖，只有 collection.anki21b 需要
+    zstandard = None
+
+# 解压后集合数据库的大小上限（上传大小上限只限制压缩后的 zip）
+APKG_MAX_COLLECTION_MB = int(os.getenv("APKG_MAX_COLLECTION_MB", "2048"))
+
+COLLECTION_MEMBERS = ("collection.anki21b", "collection.anki21", "collection.anki2")
+FIELD_SEPARATOR = "\x1f"
+_COPY_BUFFER = 1 << 20
+
+_CLOZE = re.compile(r"\{\{c\d+::(.*?)(?:::(.*?))?\}\}", re.DOTALL)
+_LINE_BREAK = re.compile(r"<br\s*/?>|</(?:div|p|li|tr)>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+_SOUND = re.compile(r"\[sound:[^\]]*\]")
+_SPACES = re.compile(r"[ \t\xa0]+")
+
+class AnkiPackageError(ValueError):
+    """不是有效的 Anki 牌组包"""
+
+@dataclass
+class AnkiNote:
+    id: int
+    note_type: str
+    fields: List[str]
+    tags: List[str]
+
+def collection_member(package: zipfile.ZipFile) -> str:
+    """包中要读取的集合文件名"""
+    names = set(package.namelist())
+    for name in COLLECTION_MEMBERS:
+        if name in names:
+            if name.endswith("b") and zstandard is None:
+                if "collection.anki21" in names:
+                    continue
+                raise AnkiPackageError("该牌组包为新版压缩格式，请在 Anki 导出时勾选“支持旧版本 Anki”后重新导出")
+            return name
+    raise AnkiPackageError("不是有效的 Anki 牌组包：缺少集合数据库")
+
+def check_package(path: Path) -> str:
+    """校验上传的文件（只读 zip 目录），返回要读取的集合文件名"""
+    try:
+        with zipfile.ZipFile(path) as package:
+            name = collection_member(package)
+            if package.getinfo(name).file_size > APKG_MAX_COLLECTION_MB * 1024 * 1024:
+                raise AnkiPackageError(f"牌组包解压后超过 {APKG_MAX_COLLECTION_MB}MB")
+            return name
+    except zipfile.BadZipFile:
+        raise AnkiPackageError("不是有效的 Anki 牌组包：文件不是 zip 格式")
+
+def _copy_limited(source, output, max_bytes: int):
+    """逐块复制，超过 max_bytes 时停止（zip 目录中声明的大小不可信，按实际解压的字节数计）"""
+    copied = 0
+    while True:
+        chunk = source.read(_COPY_BUFFER)
+        if not chunk:
+            return
+        copied += len(chunk)
+        if copied > max_bytes:
+            raise AnkiPackageError(f"牌组包解压后超过 {max_bytes // (1024 * 1024)}MB")
+        output.write(chunk)
+
+def extract_collection(path: Path, target: Path, max_bytes: int = APKG_MAX_COLLECTION_MB * 1024 * 1024) -> Path:
+    """把集合数据库逐块解压到 target，解压后超过 max_bytes 时失败并删除 target"""
+    try:
+        with zipfile.ZipFile(path) as package:
+            name = collection_member(package)
+            if package.getinfo(name).file_size > max_bytes:
+                raise AnkiPackageError(f"牌组包解压后超过 {max_bytes // (1024 * 1024)}MB")
+            with package.open(name) as source, open(target, "wb") as output:
+                if name.endswith("b"):
+                    with zstandard.ZstdDecompressor().stream_reader(source) as reader:
+                        _copy_limited(reader, output, max_bytes)
+                else:
+                    _copy_limited(source, output, max_bytes)
+    except zipfile.BadZipFile:
+        target.unlink(missing_ok=True)
+        raise AnkiPackageError("不是有效的 Anki 牌组包：文件不是 zip 格式")
+    except AnkiPackageError:
+        target.unlink(missing_ok=True)
+        raise
+    return target
+
+def html_to_text(value: str) -> str:
+    """字段 HTML 转纯文本：换行标签转为换行，去掉其余标签和音频引用"""
+    value = _SOUND.sub("", _TAG.sub("", _LINE_BREAK.sub("\n", value)))
+    lines = (_SPACES.sub(" ", line).strip() for line in html.unescape(value).splitlines())
+    return "\n".join(line for line in lines if line)
+
+def split_cloze(text: str):
+    """填空题：(挖空后的题面, 完整答案)；没有填空时答案为 None"""
+    if not _CLOZE.search(text):
+        return text, None
+    question = _CLOZE.sub(lambda match: f"[{match.group(2) or '...'}]", text)
+    return question, _CLOZE.sub(lambda match: match.group(1), text)
+
+def note_to_card(note: AnkiNote) -> Optional[Dict[str, str]]:
+    """笔记转为 {content, notes}：第一个非空字段为内容，其余字段作为备注；全部为空时返回 None"""
+    fields = [text for text in (html_to_text(field) for field in note.fields) if text]
+    if not fields:
+        return None
+    content, answer = split_cloze(fields[0])
+    extra = ([answer] if answer else []) + fields[1:]
+    return {"content": content, "notes": "\n".join(extra) or None}
+
+class AnkiCollection:
+    """只读打开的 Anki 集合数据库"""
+
+    def __init__(self, path: Path):
+        self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            tables = {row[0] for row in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if "notes" not in tables:
+                raise AnkiPackageError("不是有效的 Anki 牌组包：集合中没有笔记表")
+            self.note_types = self._note_types("notetypes" in tables)
+        except sqlite3.DatabaseError:
+            self.connection.close()
+            raise AnkiPackageError("不是有效的 Anki 牌组包：集合不是 SQLite 数据库")
+        except AnkiPackageError:
+            self.connection.close()
+            raise
+
+    def _note_types(self, new_schema: bool) -> Dict[int, str]:
+        """笔记类型ID -> 名称"""
+        if new_schema:
+            return {mid: name for mid, name in self.connection.execute("SELECT id, name FROM notetypes")}
+        row = self.connection.execute("SELECT models FROM col").fetchone()
+        models = json.loads(row[0]) if row and row[0] else {}
+        return {int(mid): model.get("name", str(mid)) for mid, model in models.items()}
+
+    def count_notes(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def iter_notes(self, batch_size: int) -> Iterator[List[AnkiNote]]:
+        """按笔记ID分页读取，每次产出一页"""
+        last_id = -(1 << 63)
+        while True:
+            rows = self.connection.execute(
+                "SELECT id, mid, flds, tags FROM notes WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            yield [
+                AnkiNote(
+                    id=note_id,
+                    note_type=self.note_types.get(mid, str(mid)),
+                    fields=fields.split(FIELD_SEPARATOR),
+                    tags=tags.split(),
+                )
+                for note_id, mid, fields, tags in rows
+            ]
+            last_id = rows[-1][0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
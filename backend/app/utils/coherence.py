@@ -0,0 +1,232 @@
+"""
+跨进程缓存一致性 - 进程内缓存按用户版本号校验
+
+多个 uvicorn 工作进程各自持有进程内缓存，任何一个进程写入后其他进程的缓存
+就会过期。这里不依赖外部服务：
+- 每次 flush 修改了某用户的卡片、会话、抽题设置或用户记录时，在同一事务中递增
+  共享表 cache_versions 中该用户的版本号，并分配全局递增的 seq
+- 每个进程用一条专用连接检查 SQLite 的 PRAGMA data_version：其他连接（包括其他进程）
+  提交过事务时该值才会变化，此时增量读取 seq 大于上次所见的版本记录
+- 缓存条目记录所属用户和加载时的版本号，读取时与当前版本比较
+- 版本号取分配到的 seq，全局不重复；删除用户时删除其版本记录并更新保留的 0 号记录，
+  各进程见到 0 号记录变化时重新读取全部版本，被删除用户的缓存条目随之失效，
+  用户ID被重新分配后也不会与旧条目的版本号相同
+
+未变化时校验只需一条 PRAGMA 查询，不读任何表。分片模式下 cache_versions 在目录库中。
+
+用法：
+    settings_cache = CoherentCache("settings")
+    value = settings_cache.get_or_load(user_id, lambda: (user_id, load_settings(db, user_id)))
+"""
+
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from ..models import CacheVersion, MemoryCard, Session as DrawSession, User, UserDrawSettings
+from .database import SessionLocal, engine
+from .metrics import registry
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+registry.describe("cache_hits_total", "counter", "进程内缓存命中次数")
+registry.describe("cache_misses_total", "counter", "进程内缓存未命中（含版本过期）次数")
+registry.describe("cache_version_refreshes_total", "counter", "因 data_version 变化重新读取版本号的次数")
+
+# 保留的用户ID：删除用户时更新，通知各进程重新读取全部版本
+RESET_USER_ID = 0
+
+# Session.info 中记录当前事务已递增过版本的用户
+BUMPED_USERS_KEY = "cache_bumped_users"
+
+# 各模型中表示所属用户的属性
+_OWNER_ATTRIBUTES = (
+    (MemoryCard, "owner"),
+    (DrawSession, "user_id"),
+    (UserDrawSettings, "user_id"),
+    (User, "id"),
+)
+
+def bump_versions(db: Session, user_ids: Iterable[int]):
+    """在当前事务中递增用户的缓存版本号（批量写入等不经过 flush 钩子的路径需要显式调用）"""
+    table = CacheVersion.__table__
+    for user_id in sorted(set(user_ids)):
+        next_seq = select(func.coalesce(func.max(table.c.seq), 0) + 1).scalar_subquery()
+        statement = sqlite_insert(table).values(user_id=user_id, version=next_seq, seq=next_seq)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={"version": statement.excluded.version, "seq": statement.excluded.seq},
+        ))
+
+def delete_user_versions(db: Session, user_id: int):
+    """在当前事务中删除用户的版本记录，并通知各进程重新读取全部版本"""
+    db.query(CacheVersion).filter(CacheVersion.user_id == user_id).delete(synchronize_session=False)
+    bump_versions(db, [RESET_USER_ID])
+
+@event.listens_for(SessionLocal, "before_flush")
+def bump_changed_users(session: Session, flush_context, instances):
+    """flush 前为被修改数据的所属用户递增版本号"""
+    user_ids = set()
+    dirty = [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    for obj in list(session.new) + dirty + list(session.deleted):
+        for model, attribute in _OWNER_ATTRIBUTES:
+            if isinstance(obj, model):
+                user_id = getattr(obj, attribute)
+                if user_id is not None:
+                    user_ids.add(user_id)
+                break
+    # 同一事务中每个用户只需递增一次
+    bumped = session.info.setdefault(BUMPED_USERS_KEY, set())
+    user_ids -= bumped
+    if user_ids:
+        bump_versions(session, user_ids)
+        bumped.update(user_ids)
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _reset_bumped_users(session: Session, *args):
+    # 回滚（包括 SAVEPOINT 回滚）可能撤销了递增，之后需要重新递增
+    session.info.pop(BUMPED_USERS_KEY, None)
+
+class VersionTracker:
+    """维护本进程所见的各用户版本号"""
+
+    def __init__(self, bind):
+        self._bind = bind
+        self._lock = threading.Lock()
+        self._connection = None
+        self._data_version = None
+        self._last_seq = 0
+        self._versions: Dict[int, Tuple[int, int]] = {}
+
+    def _cursor(self):
+        if self._connection is None:
+            # 专用连接从连接池中分离，只读不写，其他连接的提交都会改变它看到的 data_version
+            self._connection = self._bind.raw_connection()
+            if self._bind.dialect.name == "sqlite":
+                # 各请求共用该连接，不能因为某个请求超过截止时间而中止读取（见 utils/deadline.py）
+                self._connection.driver_connection.set_progress_handler(None, 0)
+            self._connection.detach()
+        return self._connection.cursor()
+
+    def refresh(self) -> int:
+        """读取自上次以来的版本变化，返回当前已见到的最大 seq"""
+        with self._lock:
+            cursor = self._cursor()
+            try:
+                if self._bind.dialect.name == "sqlite":
+                    data_version = cursor.execute("PRAGMA data_version").fetchone()[0]
+                    if data_version == self._data_version:
+                        return self._last_seq
+                else:
+                    data_version = None
+                try:
+                    rows = cursor.execute(
+                        "SELECT user_id, version, seq FROM cache_versions WHERE seq > ?", (self._last_seq,)
+                    ).fetchall()
+                except self._bind.dialect.dbapi.OperationalError as e:
+                    # 表尚未创建；其他错误不能当作没有变化，否则会跳过这些版本
+                    if "no such table" not in str(e):
+                        raise
+                    rows = []
+                registry.inc("cache_version_refreshes_total")
+                if any(row[0] == RESET_USER_ID for row in rows):
+                    # 有用户被删除：增量读取看不到删除的记录，改为重新读取全部版本
+                    rows = cursor.execute("SELECT user_id, version, seq FROM cache_versions").fetchall()
+                    self._versions.clear()
+                for user_id, version, seq in rows:
+                    self._versions[user_id] = (version, seq)
+                    self._last_seq = max(self._last_seq, seq)
+                self._data_version = data_version
+                return self._last_seq
+            finally:
+                cursor.close()
+
+    def entry(self, user_id: int) -> Tuple[int, int]:
+        """用户当前的 (版本号, seq)，从未写入过的用户为 (0, 0)"""
+        self.refresh()
+        return self._versions.get(user_id, (0, 0))
+
+version_tracker = VersionTracker(engine)
+
+class _Missing:
+    pass
+
+MISSING = _Missing()
+
+class CoherentCache:
+    """按用户版本号校验的进程内 LRU 缓存，可选设置最长有效期（秒）"""
+
+    def __init__(self, name: str, ttl: Optional[float] = None, max_entries: int = CACHE_MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[int, int, float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            user_id, version, loaded_at, value = entry
+            fresh = self.ttl is None or time.monotonic() - loaded_at < self.ttl
+            if fresh and version_tracker.entry(user_id)[0] == version:
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                registry.inc("cache_hits_total", {"cache": self.name})
+                return value
+        registry.inc("cache_misses_total", {"cache": self.name})
+        return MISSING
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Tuple[int, Any]]) -> Any:
+        """
+        命中时返回缓存值；否则调用 loader 返回 (用户ID, 值) 并缓存
+
+        加载前后各读一次版本：加载期间该用户有写入时不缓存，避免把旧数据记在新版本下。
+        """
+        if not CACHE_ENABLED:
+            return loader()[1]
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        seen_seq = version_tracker.refresh()
+        user_id, value = loader()
+        version, seq = version_tracker.entry(user_id)
+        if seq <= seen_seq:
+            with self._lock:
+                self._entries[key] = (user_id, version, time.monotonic(), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate_user(self, user_id: int):
+        """删除该用户的全部缓存条目"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def cached_per_user(cache: CoherentCache) -> Callable:
+    """服务方法装饰器：以 方法名 + 实例的 cache_scope + 参数 为键缓存，第一个参数为用户ID"""
+    def decorator(method: Callable) -> Callable:
+        name = method.__qualname__
+
+        @functools.wraps(method)
+        def wrapper(self, user_id, *args, **kwargs):
+            key = (name, getattr(self, "cache_scope", None), user_id, args, tuple(sorted(kwargs.items())))
+            return cache.get_or_load(key, lambda: (user_id, method(self, user_id, *args, **kwargs)))
+
+        return wrapper
+    return decorator
@@ -0,0 +1,47 @@
+"""
+自定义列类型
+"""
+
+import os
+import zlib
+from sqlalchemy.types import Text, TypeDecorator
+
+# 超过该字节数的文本压缩存储，0 表示不压缩
+TEXT_COMPRESSION_THRESHOLD = int(os.getenv("TEXT_COMPRESSION_THRESHOLD", "1024"))
+
+# 压缩值的前缀：普通文本以 str 存储，不会以该字节序列开头
+COMPRESSED_PREFIX = b"\x00zl"
+
+class CompressedText(TypeDecorator):
+    """
+    透明压缩的文本列
+
+    较长的值以 zlib 压缩后的 BLOB 存储，较短的值和已有数据仍是普通文本；
+    读取时根据前缀自动解压，对 ORM 使用者完全透明。
+    压缩后的值无法在 SQL 中做 LIKE 等文本比较，只适用于不参与查询条件的列。
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, *args, threshold: int = TEXT_COMPRESSION_THRESHOLD, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not self.threshold:
+            return value
+        encoded = value.encode("utf-8")
+        if len(encoded) < self.threshold:
+            return value
+        compressed = zlib.compress(encoded, 6)
+        if len(compressed) + len(COMPRESSED_PREFIX) >= len(encoded):
+            return value
+        return COMPRESSED_PREFIX + compressed
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            if value.startswith(COMPRESSED_PREFIX):
+                return zlib.decompress(value[len(COMPRESSED_PREFIX):]).decode("utf-8")
+            return value.decode("utf-8")
+        return value
@@ -2,15 +2,26 @@
 数据库工具函数
 """
 
-from sqlalchemy import create_engine
+import hashlib
+import os
+import time
+from fastapi import Request
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from pathlib import Path
 from ..models import Base
+from .sharding import SHARD_COUNT, SHARDED_TABLES, ShardedSession, route_to_user
+from .metrics import record_query
+from .deadline import install_progress_handler
+from .slow_query import slow_query_log
 
 # 数据库配置
 DATABASE_DIR = Path(__file__).parent.parent.parent.parent / "data"
 DATABASE_DIR.mkdir(exist_ok=True)
-DATABASE_URL = f"sqlite:///{DATABASE_DIR}/oblivionis.db"
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DATABASE_DIR}/oblivionis.db")
+
+# 分片库地址模板（SHARD_COUNT > 0 时启用，见 utils/sharding.py）
+SHARD_URL_TEMPLATE = os.getenv("SHARD_URL_TEMPLATE", f"sqlite:///{DATABASE_DIR}/oblivionis_shard_{{index}}.db")
 
 # SQLAlchemy 配置
 engine = create_engine(
@@ -18,18 +29,123 @@ engine = create_engine(
     connect_args={"check_same_thread": False},
     echo=False  # 关闭 SQL 语句输出
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+shard_engines = [
+    create_engine(SHARD_URL_TEMPLATE.format(index=index), connect_args={"check_same_thread": False})
+    for index in range(SHARD_COUNT)
+]
+all_engines = [engine] + shard_engines
+
+if SHARD_COUNT:
+    SessionLocal = sessionmaker(
+        class_=ShardedSession, autocommit=False, autoflush=False, bind=engine, shard_engines=shard_engines
+    )
+else:
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# SQL 语句计数和耗时钩子
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+    record_query(statement, duration, parameters)
+    slow_query_log.maybe_record(conn.engine, statement, parameters, duration, executemany)
+
+for _engine in all_engines:
+    event.listen(_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", after_cursor_execute)
+    # 请求超过截止时间或客户端断开时中止正在执行的语句（utils/deadline.py）
+    install_progress_handler(_engine)
+
+# 批量请求（routers/batch.py）把共用的会话放在子请求 scope 的这个键下，由批量请求负责关闭
+SHARED_SESSION_SCOPE_KEY = "oblivionis.shared_session"
+
+def route_request(db, request: Request):
+    """分片模式下按路径或查询参数中的 user_id 路由；需要认证的接口由 get_current_user 路由"""
+    user_id = request.path_params.get("user_id") or request.query_params.get("user_id")
+    if SHARD_COUNT and user_id and str(user_id).isdigit():
+        route_to_user(db, int(user_id))
 
 # 数据库依赖
-def get_db():
+def get_db(request: Request):
+    shared = request.scope.get(SHARED_SESSION_SCOPE_KEY)
+    if shared is not None:
+        route_request(shared, request)
+        yield shared
+        return
+
     db = SessionLocal()
+    route_request(db, request)
     try:
         yield db
     finally:
         db.close()
 
+# 已有表上后来新增的列：(表名, 列名, 列定义, 添加后执行的回填语句)
+ADDED_COLUMNS = [
+    (
+        "memory_cards", "change_seq", "INTEGER NOT NULL DEFAULT 0",
+        "UPDATE memory_cards SET change_seq = id",
+    ),
+    (
+        "memory_cards", "content_preview", "VARCHAR(60)",
+        "UPDATE memory_cards SET content_preview = "
+        "CASE WHEN length(content) > 50 THEN substr(content, 1, 50) || '...' ELSE content END",
+    ),
+    ("jobs", "worker_id", "VARCHAR(100)", None),
+    ("jobs", "heartbeat_at", "DATETIME", None),
+]
+
+def migrate_columns(bind=engine):
+    """为旧数据库补充新增的列（create_all 不会修改已存在的表）"""
+    with bind.begin() as conn:
+        for table, column, definition, backfill in ADDED_COLUMNS:
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+            if existing and column not in existing:
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                if backfill:
+                    conn.exec_driver_sql(backfill)
+
+def schema_fingerprint(tables) -> int:
+    """
+    表结构指纹：表、列、索引定义和 ADDED_COLUMNS 的哈希
+
+    取 28 位，可以存进 SQLite 的 PRAGMA user_version（32 位有符号整数）。
+    """
+    parts = [repr(ADDED_COLUMNS)]
+    for table in sorted(tables, key=lambda t: t.name):
+        parts.append(table.name)
+        parts.extend(f"{c.name}:{c.type}:{c.nullable}:{c.primary_key}" for c in table.columns)
+        parts.extend(sorted(f"{i.name}:{i.unique}:{[c.name for c in i.columns]}" for i in table.indexes))
+    return int(hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:7], 16)
+
 # 创建数据库表
 def create_tables():
-    """创建数据库表"""
-    Base.metadata.create_all(bind=engine)
+    """
+    创建数据库表（分片模式下目录库只建共享表，各分片只建分片表）
+
+    建表完成后把表结构指纹写入 PRAGMA user_version，下次启动指纹一致时跳过
+    create_all 和逐个索引检查，只需一条 PRAGMA 查询。
+    """
+    if SHARD_COUNT:
+        layout = [(engine, [t for t in Base.metadata.sorted_tables if t.name not in SHARDED_TABLES])]
+        shard_tables = [t for t in Base.metadata.sorted_tables if t.name in SHARDED_TABLES]
+        layout += [(shard_engine, shard_tables) for shard_engine in shard_engines]
+    else:
+        layout = [(engine, Base.metadata.sorted_tables)]
+
+    for bind, tables in layout:
+        fingerprint = schema_fingerprint(tables)
+        with bind.connect() as conn:
+            if conn.exec_driver_sql("PRAGMA user_version").scalar() == fingerprint:
+                continue
+
+        migrate_columns(bind)
+        Base.metadata.create_all(bind=bind, tables=tables)
+        # create_all 只为新建的表创建索引，已有表上新增的索引在这里补建
+        for table in tables:
+            for index in table.indexes:
+                index.create(bind=bind, checkfirst=True)
+        with bind.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {fingerprint}")
     # print(f"数据库已创建: {DATABASE_URL}")
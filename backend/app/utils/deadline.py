@@ -0,0 +1,108 @@
+"""
+请求截止时间 - 把请求的剩余时间传递到 SQLite 语句执行中
+
+DeadlineMiddleware 按路径前缀为请求设置截止时间（REQUEST_DEADLINE_MS，按前缀覆盖见
+REQUEST_DEADLINES），通过 contextvars 绑定到当前请求：线程池中执行的同步代码、组提交写线程
+（在提交方的上下文中执行操作）都能看到它。
+
+每个 SQLite 连接注册一个进度回调，每执行 DEADLINE_CHECK_INSTRUCTIONS 条虚拟机指令调用一次：
+当前请求已超时或客户端已断开时返回非零，SQLite 中止正在执行的语句
+（OperationalError: interrupted），连接随即归还连接池。
+没有截止时间的代码（后台任务、快照线程、启动迁移）不受影响。
+
+多个请求共用的事务和连接（组提交写线程、缓存版本跟踪的专用连接）不能被单个请求中止：
+中止语句时 SQLite 会回滚整个事务。组提交在开始执行操作前检查截止时间，执行中解除截止时间
+（suspend_deadline）；版本跟踪的连接不注册进度回调。
+"""
+
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+from .metrics import registry
+
+# 默认截止时间（毫秒，0 为不限制）
+REQUEST_DEADLINE_MS = float(os.getenv("REQUEST_DEADLINE_MS", "15000"))
+# 按路径前缀覆盖，"前缀=毫秒" 逗号分隔；环境变量中的配置合并在默认配置之上
+DEFAULT_ROUTE_DEADLINES = "/api/events=0,/api/cards/import=0,/api/stats=5000,/api/leaderboards=2000,/api/draw=5000"
+# 进度回调的调用间隔（SQLite 虚拟机指令数）
+DEADLINE_CHECK_INSTRUCTIONS = int(os.getenv("DEADLINE_CHECK_INSTRUCTIONS", "1000"))
+
+registry.describe("request_deadline_exceeded_total", "counter", "超过截止时间的请求数")
+registry.describe("request_disconnects_total", "counter", "处理完成前客户端断开的请求数")
+registry.describe("sqlite_interrupts_total", "counter", "因截止时间或客户端断开被中止的 SQL 语句数")
+
+def parse_route_deadlines(text: str) -> Dict[str, float]:
+    """解析 "前缀=毫秒,..." """
+    result = {}
+    for item in text.split(","):
+        prefix, _, value = item.strip().partition("=")
+        if prefix and value:
+            result[prefix.strip()] = float(value)
+    return result
+
+ROUTE_DEADLINES: List[Tuple[str, float]] = sorted(
+    {**parse_route_deadlines(DEFAULT_ROUTE_DEADLINES), **parse_route_deadlines(os.getenv("REQUEST_DEADLINES", ""))}.items(),
+    key=lambda item: len(item[0]), reverse=True,
+)
+
+def deadline_for_path(path: str) -> Tuple[str, Optional[float]]:
+    """(匹配的前缀, 截止时间秒数)；不限制时秒数为 None"""
+    for prefix, milliseconds in ROUTE_DEADLINES:
+        if path.startswith(prefix):
+            return prefix, milliseconds / 1000 if milliseconds > 0 else None
+    return "default", REQUEST_DEADLINE_MS / 1000 if REQUEST_DEADLINE_MS > 0 else None
+
+class Deadline:
+    """一个请求的截止时间；响应开始发送后不再限制（流式响应按自己的节奏结束）"""
+
+    __slots__ = ("expires_at", "cancelled", "interrupted")
+
+    def __init__(self, seconds: float):
+        self.expires_at: Optional[float] = time.monotonic() + seconds
+        self.cancelled = False  # 客户端已断开
+        self.interrupted = False  # 有语句因此被中止
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def exceeded(self) -> bool:
+        return self.cancelled or (self.expires_at is not None and time.monotonic() >= self.expires_at)
+
+class DeadlineExceeded(Exception):
+    """请求已超过截止时间或客户端已断开，不再开始执行"""
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+def bind_deadline(deadline: Deadline):
+    return _current_deadline.set(deadline)
+
+def unbind_deadline(token):
+    _current_deadline.reset(token)
+
+def suspend_deadline():
+    """在当前上下文中解除截止时间（用于复制出的上下文，不影响请求本身）"""
+    _current_deadline.set(None)
+
+def _progress_handler() -> int:
+    deadline = _current_deadline.get()
+    if deadline is not None and deadline.exceeded():
+        deadline.interrupted = True
+        registry.inc("sqlite_interrupts_total", {"reason": "disconnect" if deadline.cancelled else "deadline"})
+        return 1
+    return 0
+
+def install_progress_handler(engine):
+    """为引擎之后新建的每个 SQLite 连接注册进度回调"""
+    if engine.dialect.name != "sqlite" or DEADLINE_CHECK_INSTRUCTIONS <= 0:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.set_progress_handler(_progress_handler, DEADLINE_CHECK_INSTRUCTIONS)
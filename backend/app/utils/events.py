@@ -0,0 +1,252 @@
+"""
+实时事件工具 - 按用户推送数据变更的增量事件
+
+卡片路由和 DrawService 在提交成功后调用 publish，事件被投递到该用户的
+所有订阅者（SSE 连接）。publish 可以在事件循环中调用，也可以在线程池中调用。
+每个用户保留最近的若干事件，断线重连时可根据 Last-Event-ID 补发。
+
+默认只在进程内投递：只有连在同一工作进程上的订阅者能收到事件，适用于单个工作进程。
+多个工作进程时开启 EVENT_FANOUT_ENABLED，与 utils/coherence.py 一样不依赖外部服务：
+- publish 把事件写入目录库的 event_log 表，事件编号取该表的自增ID，各进程一致
+- 每个进程用一条专用连接轮询 PRAGMA data_version，有其他连接提交过事务时读取新事件，
+  推送给本进程的订阅者并记入历史
+- 超过保留时间的事件定期删除
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 每个订阅者的队列长度，溢出时通知客户端重新全量加载
+SUBSCRIBER_QUEUE_SIZE = 100
+# 每个用户保留的历史事件数（用于重连补发）
+HISTORY_SIZE = 50
+# 多进程事件分发：开关、轮询间隔（秒）和 event_log 中事件的保留时间（秒）
+EVENT_FANOUT_ENABLED = os.getenv("EVENT_FANOUT_ENABLED", "false").lower() in ("1", "true", "yes")
+EVENT_POLL_INTERVAL = float(os.getenv("EVENT_POLL_INTERVAL", "0.2"))
+EVENT_RETENTION_SECONDS = float(os.getenv("EVENT_RETENTION_SECONDS", "600"))
+# 每次轮询最多读取的事件数
+EVENT_POLL_BATCH = 1000
+
+registry.describe("events_published_total", "counter", "发布的实时事件数")
+registry.describe("events_subscribers", "gauge", "当前实时事件订阅数")
+registry.describe("events_fanout_received_total", "counter", "从 event_log 读到的其他进程发布的事件数")
+
+class Subscriber:
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def _deliver(self, event: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+class EventBroker:
+    """按用户发布/订阅；传入 bind 时经由 event_log 表在多个进程之间分发"""
+
+    def __init__(self, bind=None):
+        self._bind = bind
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, List[Subscriber]] = {}
+        self._history: Dict[int, deque] = {}
+        self._last_id = 0
+        # 历史从该编号之后是完整的（开始轮询之前的事件本进程没有见过）
+        self._history_from = 0
+        # 专用连接及其锁：写入和轮询都在锁内进行
+        self._db_lock = threading.Lock()
+        self._connection = None
+        # 已轮询到的最大事件ID，以及本进程写入、轮询时应跳过的事件ID
+        self._polled_id = 0
+        self._own: Set[int] = set()
+        self._data_version = None
+        self._last_pruned = 0.0
+        self._stop = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+    def subscribe(self, user_id: int) -> Subscriber:
+        subscriber = Subscriber(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(user_id, []).append(subscriber)
+            registry.set_gauge("events_subscribers", sum(len(s) for s in self._subscribers.values()))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.user_id, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self._subscribers.pop(subscriber.user_id, None)
+            registry.set_gauge("events_subscribers", sum(len(s) for s in self._subscribers.values()))
+
+    def publish(self, user_id: int, event_type: str, data: Dict[str, Any]):
+        """发布事件；没有订阅者时只记录历史"""
+        if self._bind is not None:
+            self._publish_shared(user_id, event_type, data)
+            return
+        with self._lock:
+            self._last_id += 1
+            event = {
+                "id": self._last_id,
+                "type": event_type,
+                "user_id": user_id,
+                "timestamp": time.time(),
+                "data": data,
+            }
+            self._history.setdefault(user_id, deque(maxlen=HISTORY_SIZE)).append(event)
+            subscribers = list(self._subscribers.get(user_id, []))
+        registry.inc("events_published_total", {"type": event_type})
+        self._notify(subscribers, event)
+
+    def _notify(self, subscribers: List[Subscriber], event: Dict[str, Any]):
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber._deliver, event)
+            except RuntimeError:
+                # 订阅者所在的事件循环已关闭
+                self.unsubscribe(subscriber)
+
+    def _dispatch(self, event: Dict[str, Any]):
+        """记入历史并投递给本进程的订阅者（多进程分发时事件ID由 event_log 分配）"""
+        with self._lock:
+            self._history.setdefault(event["user_id"], deque(maxlen=HISTORY_SIZE)).append(event)
+            self._last_id = max(self._last_id, event["id"])
+            subscribers = list(self._subscribers.get(event["user_id"], []))
+        self._notify(subscribers, event)
+
+    # ===== 多进程分发 =====
+    def _cursor(self):
+        if self._connection is None:
+            # 与 utils/coherence.py 的版本跟踪连接相同：从连接池分离，不受请求截止时间影响
+            self._connection = self._bind.raw_connection()
+            if self._bind.dialect.name == "sqlite":
+                self._connection.driver_connection.set_progress_handler(None, 0)
+            self._connection.detach()
+        return self._connection.cursor()
+
+    def _publish_shared(self, user_id: int, event_type: str, data: Dict[str, Any]):
+        event = {"type": event_type, "user_id": user_id, "timestamp": time.time(), "data": data}
+        with self._db_lock:
+            cursor = self._cursor()
+            try:
+                cursor.execute(
+                    "INSERT INTO event_log (user_id, event_type, data, created_at) VALUES (?, ?, ?, ?)",
+                    (user_id, event_type, json.dumps(data, ensure_ascii=False), event["timestamp"]),
+                )
+                event["id"] = cursor.lastrowid
+                self._connection.commit()
+                if self._poller is not None:
+                    self._own.add(event["id"])
+            except Exception:
+                # 数据已提交，事件丢失只影响实时推送：客户端下次重连或刷新时会重新加载
+                self._connection.rollback()
+                logger.exception("写入事件日志失败: 用户 %d 的 %s 事件", user_id, event_type)
+                return
+            finally:
+                cursor.close()
+            # 在锁内投递，与轮询到的事件互不交错
+            self._dispatch(event)
+        registry.inc("events_published_total", {"type": event_type})
+
+    def start(self):
+        """开始轮询 event_log（只在开启多进程分发时有效）"""
+        if self._bind is None or self._poller is not None:
+            return
+        with self._db_lock:
+            cursor = self._cursor()
+            try:
+                latest = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM event_log").fetchone()[0]
+            finally:
+                cursor.close()
+        self._polled_id = latest
+        with self._lock:
+            self._last_id = self._history_from = max(self._last_id, latest)
+        self._stop.clear()
+        self._poller = threading.Thread(target=self._poll_loop, name="event-fanout", daemon=True)
+        self._poller.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join(timeout=5)
+            self._poller = None
+
+    def _poll_loop(self):
+        while not self._stop.wait(EVENT_POLL_INTERVAL):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("读取事件日志失败")
+
+    def poll(self):
+        """读取其他进程新发布的事件并投递"""
+        with self._db_lock:
+            cursor = self._cursor()
+            try:
+                if self._bind.dialect.name == "sqlite":
+                    data_version = cursor.execute("PRAGMA data_version").fetchone()[0]
+                    if data_version == self._data_version:
+                        return
+                else:
+                    data_version = None
+                rows = cursor.execute(
+                    "SELECT id, user_id, event_type, data, created_at FROM event_log WHERE id > ? ORDER BY id LIMIT ?",
+                    (self._polled_id, EVENT_POLL_BATCH),
+                ).fetchall()
+                if len(rows) < EVENT_POLL_BATCH:
+                    # 没读完时不记录 data_version，下次继续读
+                    self._data_version = data_version
+                now = time.time()
+                if now - self._last_pruned > EVENT_RETENTION_SECONDS / 10:
+                    cursor.execute("DELETE FROM event_log WHERE created_at < ?", (now - EVENT_RETENTION_SECONDS,))
+                    self._connection.commit()
+                    self._last_pruned = now
+            finally:
+                cursor.close()
+            for event_id, user_id, event_type, data, created_at in rows:
+                self._polled_id = event_id
+                if event_id in self._own:
+                    self._own.discard(event_id)
+                    continue
+                registry.inc("events_fanout_received_total")
+                self._dispatch({
+                    "id": event_id, "type": event_type, "user_id": user_id,
+                    "timestamp": created_at, "data": json.loads(data),
+                })
+
+    def history_since(self, user_id: int, last_event_id: int) -> Optional[List[Dict[str, Any]]]:
+        """返回 last_event_id 之后的历史事件；历史已不完整时返回 None"""
+        with self._lock:
+            history = list(self._history.get(user_id, ()))
+            latest = self._last_id
+        if last_event_id > latest:
+            # 事件编号比当前还大，说明服务重启过
+            return None
+        if last_event_id < self._history_from:
+            return None
+        if len(history) == HISTORY_SIZE and history[0]["id"] > last_event_id:
+            return None
+        return [event for event in history if event["id"] > last_event_id]
+
+def _shared_bind():
+    if not EVENT_FANOUT_ENABLED:
+        return None
+    from .database import engine
+    return engine
+
+event_broker = EventBroker(_shared_bind())
+
+def publish(user_id: int, event_type: str, data: Dict[str, Any]):
+    event_broker.publish(user_id, event_type, data)
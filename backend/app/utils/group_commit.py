@@ -0,0 +1,221 @@
+"""
+组提交（group commit）写入器
+
+SQLite 每次提交都要 fsync，并发写请求各自提交时吞吐量受限于提交延迟。
+开启后（GROUP_COMMIT_ENABLED，默认关闭），抽题、创建卡片等写操作被放入队列，由单个写线程每隔几毫秒（或攒够
+若干个操作）在一个事务中依次执行，一次提交后再逐个返回结果。
+
+每个操作在独立的 SAVEPOINT 中执行，单个操作失败只回滚它自己；整批提交失败时
+该批的所有请求都收到异常。请求的截止时间只在操作开始前检查，执行中的语句不会被中止
+（中止会使 SQLite 回滚整批事务）；如果仍有错误导致整个事务被回滚，已执行的操作全部失败，
+尚未执行的操作放到新的事务中执行。操作函数内：
+- 用 commit_or_flush(db) 代替 db.commit()，组提交时只 flush，由写入器统一提交
+- 用 publish_after_commit 发布事件，组提交时事件在提交成功后才发出
+- 返回值应是普通数据（如 card_to_dict 的结果），会话在提交后即关闭
+
+用法：
+    result = await group_commit.execute(db, operation, user_id=user.id)
+"""
+
+import asyncio
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+from sqlalchemy import event, exc
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .deadline import DeadlineExceeded, current_deadline, suspend_deadline
+from .events import publish
+from .metrics import registry
+from .sharding import route_to_user
+
+GROUP_COMMIT_ENABLED = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+# 攒批等待时间（毫秒）和每批最多操作数
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "2"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "64"))
+
+# Session.info 中的标记：组提交中的会话，以及当前操作待发布的事件
+GROUP_COMMIT_KEY = "group_commit"
+PENDING_EVENTS_KEY = "pending_events"
+
+registry.describe("group_commit_batches_total", "counter", "组提交的事务数")
+registry.describe("group_commit_operations_total", "counter", "经组提交执行的写操作数")
+registry.describe("group_commit_batch_size", "histogram", "每次组提交包含的操作数", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+registry.describe("group_commit_failures_total", "counter", "组提交中失败的写操作数")
+
+# SQLite 回滚了整个事务的错误：语句被中止后，外层事务和所有 SAVEPOINT 都已不存在
+_TRANSACTION_ABORTED = ("interrupted", "no such savepoint")
+
+def _aborts_transaction(error: Optional[BaseException]) -> bool:
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (exc.DBAPIError, sqlite3.Error)) and any(
+            message in str(error) for message in _TRANSACTION_ABORTED
+        ):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+def commit_or_flush(db: Session):
+    """组提交中只 flush（分配ID等），否则直接提交"""
+    if db.info.get(GROUP_COMMIT_KEY):
+        db.flush()
+    else:
+        db.commit()
+
+def publish_after_commit(db: Session, user_id: int, event_type: str, data: dict):
+    """组提交中暂存事件，等事务提交后再发布；否则立即发布（调用方已提交）"""
+    pending = db.info.get(PENDING_EVENTS_KEY)
+    if pending is not None:
+        pending.append((user_id, event_type, data))
+    else:
+        publish(user_id, event_type, data)
+
+@event.listens_for(SessionLocal, "after_begin")
+def _begin_immediate(session: Session, transaction, connection):
+    """
+    组提交会话显式开启事务
+
+    pysqlite 不会为 SAVEPOINT 开启事务，由 SAVEPOINT 开始的事务在 RELEASE 时就会提交，
+    每个操作都会单独 fsync。这里先执行 BEGIN IMMEDIATE，同时提前取得写锁。
+    """
+    if not session.info.get(GROUP_COMMIT_KEY) or connection.dialect.name != "sqlite":
+        return
+    # SAVEPOINT 对应的嵌套事务也会触发该事件，只在尚未开启事务时执行
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+class _Operation:
+    __slots__ = ("fn", "user_id", "future", "context")
+
+    def __init__(self, fn: Callable[[Session], Any], user_id: Optional[int]):
+        self.fn = fn
+        self.user_id = user_id
+        self.future: Future = Future()
+        # 提交方的上下文（当前请求的统计等），写线程在其中执行操作，SQL 语句计入提交的请求
+        self.context = contextvars.copy_context()
+
+class GroupCommitWriter:
+    """单写线程，按时间窗口或数量攒批执行写操作"""
+
+    def __init__(self, window_ms: float, max_batch: int, enabled: bool = True):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.enabled = enabled
+        self._queue: "queue.Queue[Optional[_Operation]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="group-commit", daemon=True)
+                self._thread.start()
+
+    def shutdown(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=5)
+
+    def submit(self, fn: Callable[[Session], Any], user_id: Optional[int] = None) -> Future:
+        operation = _Operation(fn, user_id)
+        if self._thread is None:
+            self.start()
+        self._queue.put(operation)
+        return operation.future
+
+    async def execute(self, db: Session, fn: Callable[[Session], Any], user_id: Optional[int] = None) -> Any:
+        """执行写操作；未开启组提交时直接在请求自己的会话中执行并提交"""
+        if not self.enabled:
+            return fn(db)
+        return await asyncio.wrap_future(self.submit(fn, user_id))
+
+    def _loop(self):
+        while True:
+            operation = self._queue.get()
+            if operation is None:
+                return
+            batch = [operation]
+            stop = False
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    operation = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if operation is None:
+                    stop = True
+                    break
+                batch.append(operation)
+            self._apply(batch)
+            if stop:
+                return
+
+    @staticmethod
+    def _run(operation: _Operation, db: Session) -> Any:
+        """在提交方的上下文中执行：开始前检查截止时间，之后解除，语句不会被中止"""
+        deadline = current_deadline()
+        if deadline is not None:
+            if deadline.exceeded():
+                deadline.interrupted = True
+                raise DeadlineExceeded()
+            suspend_deadline()
+        with db.begin_nested():
+            return operation.fn(db)
+
+    def _apply(self, batch: List[_Operation]):
+        db = SessionLocal()
+        db.info[GROUP_COMMIT_KEY] = True
+        done = []
+        remaining: List[_Operation] = []
+        try:
+            for index, operation in enumerate(batch):
+                if not operation.future.set_running_or_notify_cancel():
+                    continue
+                route_to_user(db, operation.user_id)
+                events = db.info[PENDING_EVENTS_KEY] = []
+                try:
+                    result = operation.context.run(self._run, operation, db)
+                    done.append((operation, result, events))
+                except Exception as e:
+                    registry.inc("group_commit_failures_total")
+                    operation.future.set_exception(e)
+                    if _aborts_transaction(e):
+                        # 之前的操作已随事务回滚，之后的操作不能在事务之外执行
+                        remaining = batch[index + 1:]
+                        raise
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            registry.inc("group_commit_failures_total", value=len(done))
+            for operation, _, _ in done:
+                operation.future.set_exception(e)
+            done = None
+        finally:
+            db.close()
+
+        if done is None:
+            if remaining:
+                self._apply(remaining)
+            return
+
+        registry.inc("group_commit_batches_total")
+        registry.inc("group_commit_operations_total", value=len(done))
+        registry.observe("group_commit_batch_size", len(batch))
+        for operation, result, events in done:
+            for event in events:
+                publish(*event)
+            operation.future.set_result(result)
+
+group_commit = GroupCommitWriter(GROUP_COMMIT_WINDOW_MS, GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_ENABLED)
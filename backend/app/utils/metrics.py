@@ -0,0 +1,225 @@
+"""
+运行指标工具 - 进程内指标注册表与请求级 SQL 统计
+
+- MetricsRegistry 保存计数器、仪表和直方图，并输出 Prometheus 文本格式
+- RequestStats 通过 contextvars 绑定到当前请求，数据库钩子据此累计语句数和耗时
+"""
+
+import bisect
+import logging
+import os
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 单个请求允许执行的 SQL 语句数，超出时记录告警（用于发现 N+1 查询）
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "10"))
+# 按路径前缀覆盖，"前缀=语句数" 逗号分隔（0 为不检查）；环境变量中的配置合并在默认配置之上。
+# 写卡片和抽题还要维护变更序号、缓存版本、查重索引、标签位图和排行榜计数（组提交和分片再各加几条事务语句），
+# 默认预算较高；批量请求的语句数随子请求数增长，不检查
+DEFAULT_QUERY_BUDGETS = "/api/cards=18,/api/draw=20,/api/batch=0"
+
+# 直方图默认分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def parse_query_budgets(text: str) -> Dict[str, int]:
+    """解析 "前缀=语句数,..." """
+    result = {}
+    for item in text.split(","):
+        prefix, _, value = item.strip().partition("=")
+        if prefix and value:
+            result[prefix.strip()] = int(value)
+    return result
+
+ROUTE_QUERY_BUDGETS: List[Tuple[str, int]] = sorted(
+    {**parse_query_budgets(DEFAULT_QUERY_BUDGETS), **parse_query_budgets(os.getenv("QUERY_BUDGETS", ""))}.items(),
+    key=lambda item: len(item[0]), reverse=True,
+)
+
+def query_budget_for_path(path: str) -> int:
+    """路径对应的语句预算，0 为不检查"""
+    for prefix, budget in ROUTE_QUERY_BUDGETS:
+        if path.startswith(prefix):
+            return budget
+    return QUERY_BUDGET
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((labels or {}).items()))
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in items
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+class MetricsRegistry:
+    """线程安全的进程内指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+
+    def describe(self, name: str, metric_type: str, help_text: str, buckets: Optional[Sequence[float]] = None):
+        """登记指标类型和说明，直方图需要同时给出分桶"""
+        with self._lock:
+            self._meta[name] = (metric_type, help_text)
+            if metric_type == "histogram":
+                self._buckets[name] = buckets or LATENCY_BUCKETS
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    def get_counter(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def reset(self):
+        """清空所有样本（保留指标说明），主要用于基准测试之间"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式（version 0.0.4）"""
+        lines: List[str] = []
+        with self._lock:
+            names = sorted(set(self._counters) | set(self._gauges) | set(self._histograms))
+            for name in names:
+                metric_type, help_text = self._meta.get(name, ("untyped", ""))
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+                for key, value in sorted(self._counters.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                for key, value in sorted(self._gauges.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                for key, histogram in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = _format_labels(key, [("le", _format_value(bound))])
+                        lines.append(f"{name}_bucket{le} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.total)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+registry.describe("http_requests_total", "counter", "HTTP 请求总数")
+registry.describe("http_request_duration_seconds", "histogram", "HTTP 请求耗时", LATENCY_BUCKETS)
+registry.describe("http_response_size_bytes", "histogram", "HTTP 响应体大小", SIZE_BUCKETS)
+registry.describe("db_statements_per_request", "histogram", "单个请求执行的 SQL 语句数", COUNT_BUCKETS)
+registry.describe("db_time_per_request_seconds", "histogram", "单个请求的数据库耗时", LATENCY_BUCKETS)
+registry.describe("db_statements_total", "counter", "执行的 SQL 语句总数")
+registry.describe("query_budget_exceeded_total", "counter", "SQL 语句数超出预算的请求数")
+
+# ===== 请求级统计 =====
+@dataclass
+class RequestStats:
+    method: str
+    path: str
+    scope: Dict[str, Any] = field(default_factory=dict, repr=False)
+    statements: int = 0
+    db_time: float = 0.0
+    response_size: int = 0
+    status_code: int = 0
+    # 被剖析的请求才有（utils/profiling.py 的 RequestProfile）
+    profile: Optional[Any] = field(default=None, repr=False)
+
+    @property
+    def route(self) -> str:
+        """路由模板（如 /api/stats/overview/{user_id}），避免按具体路径产生过多标签"""
+        route = self.scope.get("route")
+        return getattr(route, "path", "unmatched")
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+def current_request() -> Optional[RequestStats]:
+    """获取当前请求的统计对象（不在请求上下文中时为 None）"""
+    return _current_request.get()
+
+def bind_request(stats: RequestStats):
+    return _current_request.set(stats)
+
+def unbind_request(token):
+    _current_request.reset(token)
+
+def record_query(statement: str, duration: float, parameters: Any = None):
+    """数据库钩子调用：累计当前请求的语句数和数据库耗时（被剖析的请求还记下语句本身）"""
+    stats = _current_request.get()
+    route = stats.route if stats is not None else "background"
+    registry.inc("db_statements_total", {"route": route})
+    if stats is not None:
+        stats.statements += 1
+        stats.db_time += duration
+        if stats.profile is not None:
+            stats.profile.add_statement(statement, parameters, duration)
+
+def record_request(stats: RequestStats, duration: float):
+    """请求结束时调用：写入各项请求指标，并检查 SQL 语句预算"""
+    labels = {"method": stats.method, "route": stats.route}
+    registry.inc("http_requests_total", {**labels, "status": str(stats.status_code)})
+    registry.observe("http_request_duration_seconds", duration, labels)
+    registry.observe("http_response_size_bytes", stats.response_size, labels)
+    registry.observe("db_statements_per_request", stats.statements, labels)
+    registry.observe("db_time_per_request_seconds", stats.db_time, labels)
+
+    budget = query_budget_for_path(stats.path)
+    if budget and stats.statements > budget:
+        registry.inc("query_budget_exceeded_total", labels)
+        logger.warning(
+            "SQL 语句数超出预算: %s %s 执行了 %d 条语句（预算 %d，数据库耗时 %.1fms）",
+            stats.method, stats.path, stats.statements, budget, stats.db_time * 1000,
+        )
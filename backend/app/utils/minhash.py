@@ -0,0 +1,87 @@
+"""
+MinHash 签名与 LSH 分带 - 近似重复内容的检测
+
+内容先规范化（NFKC、小写、去掉空白和标点），取字符 3-gram 作为特征集合；两张卡片的
+Jaccard 相似度由签名中相等位置的比例估计。
+
+签名用单次哈希（one permutation hashing）计算：每个特征只哈希一次，按哈希值的高位分到
+SIGNATURE_SIZE 个桶中，各桶取最小值；空桶从后面最近的非空桶借值并按距离扰动
+（densification）。代价与特征数成正比，而不是特征数 × 签名长度。
+
+签名分成 LSH_BANDS 带、每带 LSH_ROWS 个值，任意一带完全相同的两张卡片成为候选。
+相似度为 s 的两张卡片成为候选的概率为 1 - (1 - s^R)^B：默认 16 带 × 4 行时，
+s = 0.8 约为 99.98%，s = 0.3 约为 12%。
+
+这些参数决定了已保存的签名和分桶，修改后需要重建索引（rebuild_duplicate_index 任务）。
+"""
+
+import hashlib
+import unicodedata
+import zlib
+from array import array
+from typing import List, Optional
+
+SHINGLE_SIZE = 3
+SIGNATURE_SIZE = 64
+LSH_BANDS = 16
+LSH_ROWS = SIGNATURE_SIZE // LSH_BANDS
+
+_MASK = 0xFFFFFFFF
+# 借值时按距离扰动用的奇数常数（黄金分割比）
+_GOLDEN = 0x9E3779B9
+_BIN_SHIFT = 32 - (SIGNATURE_SIZE.bit_length() - 1)
+_EMPTY = _MASK + 1
+
+def normalize_text(text: str) -> str:
+    """NFKC、小写，只保留字母和数字（含汉字）"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(char for char in text if char.isalnum())
+
+def shingles(text: str) -> set:
+    """字符 n-gram 集合；不足 n 个字符的内容整体作为一个特征"""
+    normalized = normalize_text(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+def signature(text: str) -> Optional[array]:
+    """内容的 MinHash 签名（SIGNATURE_SIZE 个 32 位无符号整数）；没有特征时返回 None"""
+    features = shingles(text)
+    if not features:
+        return None
+    bins = [_EMPTY] * SIGNATURE_SIZE
+    for feature in features:
+        # crc32 的低位分布较差，乘法混合后取高位分桶
+        value = (zlib.crc32(feature.encode("utf-8")) * _GOLDEN) & _MASK
+        index = value >> _BIN_SHIFT
+        if value < bins[index]:
+            bins[index] = value
+    if _EMPTY in bins:
+        filled = list(bins)
+        for index in range(SIGNATURE_SIZE):
+            if bins[index] != _EMPTY:
+                continue
+            distance = 1
+            while bins[(index + distance) % SIGNATURE_SIZE] == _EMPTY:
+                distance += 1
+            filled[index] = (bins[(index + distance) % SIGNATURE_SIZE] + distance * _GOLDEN) & _MASK
+        bins = filled
+    return array("I", bins)
+
+def signature_from_bytes(data: bytes) -> array:
+    result = array("I")
+    result.frombytes(data)
+    return result
+
+def similarity(a: array, b: array) -> float:
+    """由签名估计的 Jaccard 相似度"""
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+def band_hashes(sig: array) -> List[int]:
+    """每一带的 64 位有符号哈希值（可直接存入 SQLite INTEGER）"""
+    data = sig.tobytes()
+    width = LSH_ROWS * sig.itemsize
+    return [
+        int.from_bytes(hashlib.blake2b(data[start:start + width], digest_size=8).digest(), "little", signed=True)
+        for start in range(0, len(data), width)
+    ]
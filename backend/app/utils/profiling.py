@@ -0,0 +1,326 @@
+"""
+按需请求剖析 - 采样调用栈与 SQL 语句，生成可直接画火焰图的记录
+
+被剖析的请求（管理员带 X-Profile 请求头，或按 PROFILE_SAMPLE_RATE 抽样）在 RequestStats
+上挂一个 RequestProfile：
+- 采样线程每隔 PROFILE_INTERVAL_MS 用 sys._current_frames() 读取参与该请求的线程的调用栈，
+  按折叠格式（"根;...;叶 次数"）累计，可直接交给 flamegraph.pl 或 speedscope
+- 事件循环线程和线程池线程同时在处理其他请求，只计入属于该请求的样本：
+  事件循环线程上当前运行的 asyncio 任务须是该请求的任务（处理请求的任务，以及在该请求上下文中
+  创建的任务，由剖析开始时安装的任务工厂记录）；线程池线程的调用栈中须包含为该请求执行 SQL 的
+  那次任务调用的帧，从第一条语句起采样；不属于线程池任务的线程（如组提交写线程）同时为多个请求
+  工作，不采样
+- 数据库钩子把该请求的每条语句连同开始时间和耗时记入剖析记录；参数只记类型和长度，不记值，
+  抽样剖析的普通请求也不会把用户数据写入 PROFILE_DIR
+
+请求结束后记录保存为 PROFILE_DIR 下的 JSON 文件（各工作进程共用），通过 /api/admin/profiles 查看。
+没有请求被剖析时采样线程不运行，其余请求只多一次属性判断。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from types import CodeType
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from .database import DATABASE_DIR
+from .metrics import current_request, registry
+
+logger = logging.getLogger(__name__)
+
+# 抽样剖析的请求比例（0 为只剖析带请求头的管理员请求）
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# 采样间隔（毫秒）
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+# 单个请求最长采样时间（秒），避免事件流等长连接一直采样
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+# 单个请求最多记录的 SQL 语句数
+PROFILE_MAX_STATEMENTS = int(os.getenv("PROFILE_MAX_STATEMENTS", "1000"))
+# 保留的剖析记录数
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(DATABASE_DIR / "profiles")))
+
+registry.describe("profiled_requests_total", "counter", "被剖析的请求数")
+
+# 栈顶为这些函数的样本是线程在空闲等待（事件循环 select、线程池取任务），不计入火焰图
+_IDLE_LEAVES = {("selectors.py", "select"), ("threading.py", "wait"), ("queue.py", "get")}
+# 线程池工作线程中逐个调用任务的函数（concurrent.futures 的 _WorkItem.run、anyio 的 WorkerThread.run），
+# 它们调用的下一层帧就是一次任务调用
+_WORKER_RUNNERS = {("thread.py", "run"), ("_asyncio.py", "run")}
+
+_labels: Dict[CodeType, str] = {}
+
+def _label(code: CodeType) -> str:
+    """函数在火焰图中的名字：函数名 (文件:起始行)"""
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename.replace("\\", "/")
+        if "/site-packages/" in path:
+            path = path.rsplit("/site-packages/", 1)[1]
+        elif "/app/" in path:
+            path = "app/" + path.rsplit("/app/", 1)[1]
+        else:
+            path = path.rsplit("/", 1)[-1]
+        label = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ",")
+    return label
+
+def _code_key(code: CodeType):
+    return code.co_filename.replace("\\", "/").rsplit("/", 1)[-1], code.co_name
+
+def _shape(value: Any) -> str:
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+def _scrub_row(row: Any) -> str:
+    if isinstance(row, dict):
+        return "{" + ", ".join(f"{key}: {_shape(value)}" for key, value in row.items()) + "}"
+    if isinstance(row, (list, tuple)):
+        return "(" + ", ".join(_shape(value) for value in row) + ")"
+    return _shape(row)
+
+def _scrub_parameters(parameters: Any, limit: int = 500) -> str:
+    """参数只保留类型和长度（如 "(int, str[12])"），批量执行时给出组数和第一组"""
+    if isinstance(parameters, list) and parameters and isinstance(parameters[0], (dict, list, tuple)):
+        text = f"{len(parameters)} 组 {_scrub_row(parameters[0])}"
+    else:
+        text = _scrub_row(parameters)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+def _task_frame(frame):
+    """线程池线程中当前任务调用的帧（工作函数调用的下一层）；不在线程池任务中时返回 None"""
+    task = None
+    while frame is not None:
+        if _code_key(frame.f_code) in _WORKER_RUNNERS:
+            return task
+        task = frame
+        frame = frame.f_back
+    return None
+
+def _profiling_task_factory(previous: Optional[Callable]) -> Callable:
+    """任务工厂：在被剖析请求的上下文中创建的任务记入该请求"""
+    def factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous is not None else asyncio.Task(coro, loop=loop, **kwargs)
+        stats = current_request()
+        if stats is not None and stats.profile is not None:
+            stats.profile.tasks.add(task)
+        return task
+
+    factory.profiling = True
+    return factory
+
+def _install_task_factory(loop: asyncio.AbstractEventLoop):
+    previous = loop.get_task_factory()
+    if not getattr(previous, "profiling", False):
+        loop.set_task_factory(_profiling_task_factory(previous))
+
+class RequestProfile:
+    """一个被剖析请求的调用栈样本和 SQL 语句"""
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.created_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.foreign_samples = 0
+        self.statements: List[Dict[str, Any]] = []
+        self.dropped_statements = 0
+        # 事件循环和其中属于该请求的任务
+        self.loop = asyncio.get_running_loop()
+        self.tasks: Set[asyncio.Task] = {asyncio.current_task()}
+        _install_task_factory(self.loop)
+        # 线程ID -> (线程名, 锚点帧)；线程池线程只采样调用栈中包含锚点帧的样本，事件循环线程的锚点为 None
+        self._loop_thread = threading.get_ident()
+        self.threads: Dict[int, Tuple[str, Any]] = {self._loop_thread: (threading.current_thread().name, None)}
+
+    def attach_thread(self):
+        """为执行语句的线程池线程记下当前任务调用的帧（同一线程之后的任务调用会替换它）"""
+        ident = threading.get_ident()
+        if ident == self._loop_thread:
+            return
+        anchor = _task_frame(sys._getframe(1))
+        if anchor is not None:
+            self.threads[ident] = (threading.current_thread().name, anchor)
+
+    def add_statement(self, statement: str, parameters: Any, duration: float):
+        """数据库钩子调用（在执行语句的线程中）"""
+        self.attach_thread()
+        if len(self.statements) >= PROFILE_MAX_STATEMENTS:
+            self.dropped_statements += 1
+            return
+        self.statements.append({
+            "offset_ms": round((time.perf_counter() - duration - self.started) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+            "thread": threading.current_thread().name,
+            "statement": statement,
+            "parameters": _scrub_parameters(parameters),
+        })
+
+    def sample(self, frames: Dict[int, Any]):
+        """采样线程调用：记录参与线程中属于该请求的调用栈"""
+        for ident, (name, anchor) in list(self.threads.items()):
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            if _code_key(frame.f_code) in _IDLE_LEAVES:
+                self.idle_samples += 1
+                continue
+            stack = []
+            owned = anchor is None and asyncio.current_task(self.loop) in self.tasks
+            while frame is not None:
+                stack.append(_label(frame.f_code))
+                owned = owned or frame is anchor
+                frame = frame.f_back
+            if not owned:
+                # 线程正在处理其他请求
+                self.foreign_samples += 1
+                continue
+            stack.append(name)
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """折叠格式的调用栈，每行 "根;...;叶 样本数" """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def to_dict(self, stats, duration: float) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "created_at": self.created_at.isoformat(),
+            "trigger": self.trigger,
+            "method": self.method,
+            "path": self.path,
+            "route": stats.route,
+            "status_code": stats.status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "db_time_ms": round(stats.db_time * 1000, 3),
+            "statement_count": stats.statements,
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "samples": self.samples,
+            "idle_samples": self.idle_samples,
+            "foreign_samples": self.foreign_samples,
+            "threads": sorted({name for name, _ in self.threads.values()}),
+            "statements": self.statements,
+            "dropped_statements": self.dropped_statements,
+            "folded": self.folded(),
+        }
+
+class Sampler:
+    """进程内唯一的采样线程，有请求在被剖析时才运行"""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.interval = interval_ms / 1000
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._profiles: List[RequestProfile] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: RequestProfile):
+        with self._lock:
+            if profile in self._profiles:
+                self._profiles.remove(profile)
+
+    def _loop(self):
+        while True:
+            now = time.perf_counter()
+            with self._lock:
+                profiles = [profile for profile in self._profiles if now - profile.started < self.max_seconds]
+                if not profiles:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile.sample(frames)
+            del frames
+            time.sleep(self.interval)
+
+class ProfileStore:
+    """剖析记录的文件存储（每条一个 JSON 文件，超出 PROFILE_KEEP 时删除最旧的）"""
+
+    def __init__(self, directory: Path = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+
+    def _files(self) -> List[Path]:
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob("*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+
+    def save(self, record: Dict[str, Any]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{record['id']}.json"
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+        temporary.replace(path)
+        for stale in self._files()[self.keep:]:
+            stale.unlink(missing_ok=True)
+
+    def load(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        if not profile_id.isalnum():
+            return None
+        path = self.directory / f"{profile_id}.json"
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def summaries(self, limit: int) -> List[Dict[str, Any]]:
+        """按时间倒序的记录摘要（不含语句和调用栈）"""
+        result = []
+        for path in self._files()[:limit]:
+            try:
+                record = json.loads(path.read_text(encoding="utf-8"))
+            except (FileNotFoundError, ValueError):
+                continue
+            for key in ("statements", "folded"):
+                record.pop(key, None)
+            result.append(record)
+        return result
+
+    def clear(self) -> int:
+        files = self._files()
+        for path in files:
+            path.unlink(missing_ok=True)
+        return len(files)
+
+sampler = Sampler()
+profile_store = ProfileStore()
+
+def start_profile(stats, trigger: str) -> RequestProfile:
+    """开始剖析当前请求（在处理请求的任务中调用）"""
+    profile = stats.profile = RequestProfile(stats.method, stats.path, trigger)
+    sampler.add(profile)
+    return profile
+
+def finish_profile(stats, duration: float):
+    """请求结束时调用：停止采样并保存记录"""
+    profile = stats.profile
+    sampler.remove(profile)
+    registry.inc("profiled_requests_total", {"trigger": profile.trigger})
+    try:
+        profile_store.save(profile.to_dict(stats, duration))
+    except OSError:
+        logger.exception("保存剖析记录失败: %s %s", stats.method, stats.path)
+    finally:
+        # 锚点帧和任务引用着请求处理中的局部变量，不再保留
+        profile.threads.clear()
+        profile.tasks.clear()
@@ -0,0 +1,103 @@
+"""
+排名结构 - 支持 O(log S) 更新、排名和取前 k 名的分数表
+
+RankedScores 保存 用户 -> 分数（正整数），并用树状数组（Fenwick tree）按分数统计人数：
+- 修改分数：树状数组上两次单点更新
+- 排名：1 + 分数更高的人数，一次前缀和
+- 前 k 名：从最高分开始，用树状数组按名次定位下一个有人的分数
+
+S 为当前最高分（树状数组按需倍增扩容），与用户数无关。
+"""
+
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+class RankedScores:
+    """一个榜单时间桶内的分数表；分数为 0 的用户不在表中"""
+
+    def __init__(self, capacity: int = 64):
+        self.scores: Dict[int, int] = {}
+        self._users_by_score: Dict[int, Set[int]] = {}
+        self._tree = [0] * (capacity + 1)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def _add(self, score: int, delta: int):
+        index = score
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def _grow(self, score: int):
+        capacity = len(self._tree) - 1
+        while capacity < score:
+            capacity *= 2
+        self._tree = [0] * (capacity + 1)
+        for value, users in self._users_by_score.items():
+            self._add(value, len(users))
+
+    def _prefix(self, score: int) -> int:
+        """分数不超过 score 的人数"""
+        total = 0
+        index = min(score, len(self._tree) - 1)
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def _score_at(self, position: int) -> int:
+        """按分数升序的第 position 个人（从 1 开始）的分数"""
+        index = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            following = index + step
+            if following < len(self._tree) and self._tree[following] < position:
+                index = following
+                position -= self._tree[following]
+            step >>= 1
+        return index + 1
+
+    def set(self, user_id: int, score: int):
+        old = self.scores.get(user_id)
+        if old == score or (old is None and score <= 0):
+            return
+        if old is not None:
+            self._add(old, -1)
+            users = self._users_by_score[old]
+            users.discard(user_id)
+            if not users:
+                del self._users_by_score[old]
+            del self.scores[user_id]
+        if score > 0:
+            if score >= len(self._tree):
+                self._grow(score)
+            self._add(score, 1)
+            self._users_by_score.setdefault(score, set()).add(user_id)
+            self.scores[user_id] = score
+
+    def count_above(self, score: int) -> int:
+        """分数高于 score 的人数"""
+        return len(self.scores) - self._prefix(score)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """用户的名次（并列同名次）；不在表中时返回 None"""
+        score = self.scores.get(user_id)
+        return None if score is None else self.count_above(score) + 1
+
+    def descending(self) -> Iterator[Tuple[int, List[int]]]:
+        """按分数从高到低依次给出 (分数, 该分数的用户ID)，只访问实际取到的分数"""
+        position = len(self.scores)
+        while position > 0:
+            score = self._score_at(position)
+            users = sorted(self._users_by_score[score])
+            yield score, users
+            position -= len(users)
+
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        """前 k 名的 (用户ID, 分数)，同分按用户ID升序"""
+        result: List[Tuple[int, int]] = []
+        for score, users in self.descending():
+            result.extend((user_id, score) for user_id in users[:k - len(result)])
+            if len(result) >= k:
+                break
+        return result
@@ -0,0 +1,152 @@
+"""
+快速序列化工具 - 大列表响应的精简读取路径
+
+默认路径为：ORM 实体 -> from_attributes 校验 -> jsonable_encoder -> json.dumps，
+卡片数量较多时序列化会占据大部分请求时间。这里提供按路由选择启用的精简路径：
+只查询需要的列，直接构造字典，再用 orjson（未安装时回退到标准库 json）输出。
+"""
+
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+from fastapi.responses import JSONResponse
+from ..models import MemoryCard, Session as DrawSession
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+# MemoryCardResponse 对应的列，顺序与 card_row_to_dict 中的下标一致
+CARD_COLUMNS = (
+    MemoryCard.id,
+    MemoryCard.content,
+    MemoryCard.card_type,
+    MemoryCard.notes,
+    MemoryCard.owner,
+    MemoryCard.appear_count,
+    MemoryCard.last_appeared_session,
+    MemoryCard.created_at,
+    MemoryCard.updated_at,
+)
+
+# 预览列表使用的列：以内容摘要代替完整内容，不读取备注
+CARD_PREVIEW_COLUMNS = (
+    MemoryCard.id,
+    MemoryCard.content_preview,
+    MemoryCard.card_type,
+    MemoryCard.owner,
+    MemoryCard.appear_count,
+    MemoryCard.last_appeared_session,
+    MemoryCard.created_at,
+    MemoryCard.updated_at,
+)
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    """
+    与 Pydantic 默认的 datetime 输出格式保持一致
+
+    数据库中保存的是不带时区的 UTC 时间；刚写入、尚未从数据库重新读取的实体（如组提交中只 flush
+    的卡片）上仍是带时区的值，统一转换为不带时区的 UTC 时间，与列表和详情接口的输出相同。
+    """
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
+
+def card_row_to_dict(row: Iterable[Any]) -> Dict[str, Any]:
+    """将 CARD_COLUMNS 查询得到的行元组转换为响应字典"""
+    (card_id, content, card_type, notes, owner, appear_count,
+     last_appeared_session, created_at, updated_at) = row
+    return {
+        "id": card_id,
+        "content": content,
+        "card_type": card_type,
+        "notes": notes,
+        "owner": owner,
+        "appear_count": appear_count,
+        "last_appeared_session": last_appeared_session,
+        "created_at": _isoformat(created_at),
+        "updated_at": _isoformat(updated_at),
+    }
+
+def card_preview_row_to_dict(row: Iterable[Any]) -> Dict[str, Any]:
+    """将 CARD_PREVIEW_COLUMNS 查询得到的行元组转换为预览字典（notes 固定为 None）"""
+    (card_id, content_preview, card_type, owner, appear_count,
+     last_appeared_session, created_at, updated_at) = row
+    return {
+        "id": card_id,
+        "content": content_preview,
+        "card_type": card_type,
+        "notes": None,
+        "owner": owner,
+        "appear_count": appear_count,
+        "last_appeared_session": last_appeared_session,
+        "created_at": _isoformat(created_at),
+        "updated_at": _isoformat(updated_at),
+    }
+
+def card_to_dict(card: MemoryCard) -> Dict[str, Any]:
+    """将已加载的 ORM 卡片直接转换为响应字典（跳过 from_attributes 校验）"""
+    return {
+        "id": card.id,
+        "content": card.content,
+        "card_type": card.card_type,
+        "notes": card.notes,
+        "owner": card.owner,
+        "appear_count": card.appear_count,
+        "last_appeared_session": card.last_appeared_session,
+        "created_at": _isoformat(card.created_at),
+        "updated_at": _isoformat(card.updated_at),
+    }
+
+def session_to_dict(session: DrawSession) -> Dict[str, Any]:
+    """将会话 ORM 对象转换为 SessionResponse 结构的字典"""
+    return {
+        "id": session.id,
+        "session_number": session.session_number,
+        "user_id": session.user_id,
+        "settings_used": session.settings_used,
+        "created_at": _isoformat(session.created_at),
+    }
+
+def draw_result_to_dict(result: Dict[str, Any]) -> Dict[str, Any]:
+    """将 DrawService.draw_cards 的返回值转换为 DrawResponse 结构的字典"""
+    return {
+        "session": session_to_dict(result["session"]),
+        "cards_by_type": {
+            card_type: [card_to_dict(card) for card in cards]
+            for card_type, cards in result["cards_by_type"].items()
+        },
+        "total_cards": result["total_cards"],
+        "settings_used": result["settings_used"],
+    }
+
+def dumps(content: Any) -> bytes:
+    """序列化为 JSON 字节串，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """
+    精简 JSON 响应
+
+    路由直接返回该响应时，FastAPI 会跳过 response_model 校验和 jsonable_encoder，
+    因此内容必须已经是可直接序列化的结构（见 card_row_to_dict 等函数）。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def card_list_response(rows: Iterable[Iterable[Any]], preview: bool = False) -> FastJSONResponse:
+    """由列查询结果构造卡片列表响应；preview 为 True 时 rows 来自 CARD_PREVIEW_COLUMNS"""
+    to_dict = card_preview_row_to_dict if preview else card_row_to_dict
+    cards: List[Dict[str, Any]] = [to_dict(row) for row in rows]
+    return FastJSONResponse(cards)
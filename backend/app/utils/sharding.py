@@ -0,0 +1,240 @@
+"""
+按用户分片存储
+
+开启后（SHARD_COUNT > 0），每个用户的卡片、会话、抽题设置等数据按用户ID
+存放在 N 个 SQLite 文件之一，users、jobs 等表留在共享的目录库（DATABASE_URL）。
+每个分片有独立的写锁，不同分片上的写入可以并行。
+
+会话通过 route_to_user 确定当前用户后，访问分片表的语句自动路由到对应分片；
+未确定用户就访问分片表会抛出 ShardRoutingError。
+
+迁移与重新分片（需先停止服务）:
+    python -m app.utils.sharding status --shards 4
+    python -m app.utils.sharding rebalance --from 0 --to 4    # 单库迁移到 4 个分片
+    python -m app.utils.sharding rebalance --from 4 --to 8
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, List, Optional
+from sqlalchemy import TextClause, create_engine, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# 分片数，0 表示不分片（所有表在同一个库中）
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+
+# 按用户分片的表，以及各表中表示所属用户的列
+SHARDED_TABLES = {
+    "memory_cards": "owner",
+    "sessions": "user_id",
+    "user_draw_settings": "user_id",
+    "card_tombstones": "owner",
+    "card_tags": "owner",
+    "tag_bitmaps": "owner",
+    "card_signatures": "owner",
+    "card_lsh_buckets": "owner",
+    "sync_counters": None,  # 每个分片各自的变更序号计数器
+}
+
+# Session.info 中记录当前路由用户的键
+SHARD_USER_KEY = "shard_user_id"
+
+class ShardRoutingError(RuntimeError):
+    """访问分片表时无法确定用户"""
+
+def shard_index(user_id: int, shard_count: int = SHARD_COUNT) -> int:
+    """用户所在的分片编号"""
+    return user_id % shard_count
+
+def route_to_user(db: Session, user_id: Optional[int]):
+    """指定会话中分片表访问的目标用户"""
+    if user_id is not None:
+        db.info[SHARD_USER_KEY] = int(user_id)
+
+def _statement_tables(mapper, clause) -> List[str]:
+    if mapper is not None:
+        return [mapper.persist_selectable.name]
+    table = getattr(clause, "table", None)
+    if table is not None:
+        return [table.name]
+    if hasattr(clause, "get_final_froms"):
+        return [getattr(from_, "name", None) for from_ in clause.get_final_froms()]
+    return []
+
+class ShardedSession(Session):
+    """按表路由的会话：分片表走当前用户所在分片，其余表走目录库"""
+
+    def __init__(self, *args, shard_engines: List[Engine] = (), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shard_engines = list(shard_engines)
+
+    def shard_engine(self) -> Engine:
+        user_id = self.info.get(SHARD_USER_KEY)
+        if user_id is None:
+            raise ShardRoutingError("分片模式下访问用户数据前必须先确定用户（route_to_user）")
+        return self.shard_engines[shard_index(user_id, len(self.shard_engines))]
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        tables = _statement_tables(mapper, clause)
+        if any(table in SHARDED_TABLES for table in tables):
+            return self.shard_engine()
+        # 文本语句（如变更序号计数器）在已确定用户时走分片
+        if not tables and isinstance(clause, TextClause) and self.info.get(SHARD_USER_KEY) is not None:
+            return self.shard_engine()
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+def shard_url(index: int) -> str:
+    from .database import SHARD_URL_TEMPLATE
+    return SHARD_URL_TEMPLATE.format(index=index)
+
+# ---- 迁移与重新分片 ----
+
+def _location_engines(catalog: Engine, shard_count: int) -> List[Engine]:
+    """某种分片布局下各位置的引擎；不分片时只有目录库"""
+    if not shard_count:
+        return [catalog]
+    return [create_engine(shard_url(i)) for i in range(shard_count)]
+
+def _prepare(engine: Engine):
+    from ..models import Base
+    from .database import migrate_columns
+    tables = [Base.metadata.tables[name] for name in SHARDED_TABLES]
+    migrate_columns(engine)
+    Base.metadata.create_all(bind=engine, tables=tables)
+
+def _move_user(user_id: int, source: Engine, target: Engine) -> Dict[str, int]:
+    """
+    把一个用户的分片数据从 source 移到 target
+
+    自增ID在不同分片之间会冲突，卡片和会话在目标分片中获得新ID。为了让增量同步
+    的客户端得知ID变化，卡片以新的变更序号写入，并为旧ID写入墓碑。
+    会话编号平移到目标分片已有编号之后，卡片的 last_appeared_session 同步平移。
+    卡片标签按新ID写入，标签位图和近似重复索引在目标分片中重建。
+    """
+    from ..models import Base, CardTombstone
+    from ..services.sync_service import allocate_change_seqs
+    from ..services.tag_service import rebuild_bitmaps
+    from ..services.duplicate_service import rebuild_duplicate_index
+
+    tables = Base.metadata.tables
+    with Session(bind=source) as src, Session(bind=target) as dst:
+        rows = {
+            name: [dict(row._mapping) for row in src.execute(
+                select(tables[name]).where(tables[name].c[column] == user_id)
+            )]
+            for name, column in SHARDED_TABLES.items() if column
+        }
+        cards = rows["memory_cards"]
+        tombstones = rows["card_tombstones"]
+
+        seq = allocate_change_seqs(dst, len(cards) * 2 + len(tombstones))
+        dst.bulk_insert_mappings(CardTombstone, [
+            {"card_id": old["card_id"], "owner": user_id, "change_seq": seq + offset}
+            for offset, old in enumerate(tombstones + [{"card_id": card["id"]} for card in cards])
+        ])
+        seq += len(tombstones) + len(cards)
+        # 插入后按变更序号找回新ID
+        old_ids_by_seq = {}
+        for offset, card in enumerate(cards):
+            old_ids_by_seq[seq + offset] = card.pop("id")
+            card["change_seq"] = seq + offset
+
+        # 会话编号在分片内唯一：整体平移到目标分片现有编号之后，保持用户自己的间隔
+        sessions = rows["sessions"]
+        if sessions:
+            target_max = dst.execute(select(func.max(tables["sessions"].c.session_number))).scalar() or 0
+            shift = max(0, target_max + 1 - min(row["session_number"] for row in sessions))
+            for row in sessions:
+                row["session_number"] += shift
+            for card in cards:
+                if card["last_appeared_session"] is not None:
+                    card["last_appeared_session"] += shift
+        for name in ("memory_cards", "sessions", "user_draw_settings"):
+            for row in rows[name]:
+                row.pop("id", None)
+            if rows[name]:
+                dst.execute(tables[name].insert(), rows[name])
+
+        if rows["card_tags"]:
+            new_ids = {
+                old_ids_by_seq[change_seq]: card_id
+                for card_id, change_seq in dst.execute(
+                    select(tables["memory_cards"].c.id, tables["memory_cards"].c.change_seq).where(
+                        tables["memory_cards"].c.owner == user_id,
+                        tables["memory_cards"].c.change_seq >= seq,
+                    )
+                )
+                if change_seq in old_ids_by_seq
+            }
+            for row in rows["card_tags"]:
+                row["card_id"] = new_ids[row["card_id"]]
+            dst.execute(tables["card_tags"].insert(), rows["card_tags"])
+        if rows["tag_bitmaps"]:
+            rebuild_bitmaps(dst, user_id)
+        if rows["card_signatures"]:
+            rebuild_duplicate_index(dst, user_id)
+        dst.commit()
+
+        for name, column in SHARDED_TABLES.items():
+            if column:
+                src.execute(tables[name].delete().where(tables[name].c[column] == user_id))
+        src.commit()
+    return {name: len(value) for name, value in rows.items()}
+
+def rebalance(catalog: Engine, from_count: int, to_count: int) -> Dict[str, int]:
+    """按新的分片数重新分布所有用户的数据，只移动所在位置发生变化的用户"""
+    from ..models import User
+
+    sources = _location_engines(catalog, from_count)
+    targets = _location_engines(catalog, to_count)
+    for engine in targets:
+        _prepare(engine)
+
+    with Session(bind=catalog) as db:
+        user_ids = [user_id for (user_id,) in db.query(User.id).order_by(User.id)]
+
+    summary = {"users": len(user_ids), "moved_users": 0, "moved_cards": 0}
+    for user_id in user_ids:
+        source = sources[shard_index(user_id, from_count) if from_count else 0]
+        target = targets[shard_index(user_id, to_count) if to_count else 0]
+        if source.url == target.url:
+            continue
+        moved = _move_user(user_id, source, target)
+        summary["moved_users"] += 1
+        summary["moved_cards"] += moved["memory_cards"]
+    return summary
+
+def status(catalog: Engine, shard_count: int) -> List[Dict[str, int]]:
+    """各位置上的用户数和卡片数"""
+    from ..models import MemoryCard
+    report = []
+    for index, engine in enumerate(_location_engines(catalog, shard_count)):
+        with Session(bind=engine) as db:
+            try:
+                users, cards = db.query(func.count(func.distinct(MemoryCard.owner)), func.count(MemoryCard.id)).one()
+            except Exception:
+                users, cards = 0, 0
+        report.append({"shard": index, "url": str(engine.url), "users": users, "cards": cards})
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    status_parser = subparsers.add_parser("status", help="查看各分片的数据量")
+    status_parser.add_argument("--shards", type=int, default=SHARD_COUNT)
+    rebalance_parser = subparsers.add_parser("rebalance", help="按新的分片数迁移数据（0 表示单库）")
+    rebalance_parser.add_argument("--from", dest="from_count", type=int, required=True)
+    rebalance_parser.add_argument("--to", dest="to_count", type=int, required=True)
+    args = parser.parse_args()
+
+    from .database import engine
+    if args.command == "status":
+        result = status(engine, args.shards)
+    else:
+        result = rebalance(engine, args.from_count, args.to_count)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+单飞（single-flight）工具 - 合并相同的并发计算
+
+多个线程同时以相同的键调用时，只有第一个真正执行，其余等待并共享它的结果
+（或异常）。计算结束后键立即移除，不做任何缓存，因此不会引入数据陈旧。
+
+执行的调用方因自己的截止时间到期或客户端断开而失败时（语句被中止、DeadlineExceeded），
+错误不属于计算本身，不共享给等待方：等待方重新调用，由其中一个重新执行。
+"""
+
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable
+from .deadline import DeadlineExceeded, current_deadline
+from .metrics import registry
+
+registry.describe("singleflight_calls_total", "counter", "单飞包装的调用次数")
+registry.describe("singleflight_shared_total", "counter", "共享了进行中计算结果的调用次数")
+registry.describe("singleflight_retries_total", "counter", "执行方因自己的截止时间失败后等待方重新调用的次数")
+
+def _caller_aborted(error: BaseException) -> bool:
+    """执行方的失败是否由它自己的截止时间或客户端断开引起（在执行方线程中调用）"""
+    if isinstance(error, DeadlineExceeded):
+        return True
+    deadline = current_deadline()
+    return deadline is not None and deadline.exceeded()
+
+class _Call:
+    __slots__ = ("done", "result", "error", "aborted")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.aborted = False
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+
+            call.done.wait()
+            if call.aborted:
+                registry.inc("singleflight_retries_total")
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            call.aborted = _caller_aborted(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+_group = SingleFlight()
+
+def singleflight(method: Callable) -> Callable:
+    """
+    服务方法装饰器：以 方法名 + 参数 为键合并并发调用
+
+    只适用于返回值不会被调用方修改的只读查询。实例的 cache_scope 属性（如数据来源）
+    也是键的一部分，不同来源的调用不会共享结果。
+    """
+    name = method.__qualname__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (name, getattr(self, "cache_scope", None), args, tuple(sorted(kwargs.items())))
+        labels = {"method": name}
+        registry.inc("singleflight_calls_total", labels)
+        shared = [True]
+
+        def compute():
+            shared[0] = False
+            return method(self, *args, **kwargs)
+
+        result = _group.do(key, compute)
+        if shared[0]:
+            registry.inc("singleflight_shared_total", labels)
+        return result
+
+    return wrapper
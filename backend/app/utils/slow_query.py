@@ -0,0 +1,112 @@
+"""
+慢查询记录工具
+
+超过阈值的 SQL 语句会连同参数和所属路由一起记录到日志，
+并在后台线程中执行 EXPLAIN QUERY PLAN，标记出全表扫描（SCAN 表名）。
+最近 N 条记录保存在内存中，可通过管理接口查看。
+"""
+
+import itertools
+import logging
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from .metrics import current_request, registry
+
+logger = logging.getLogger(__name__)
+
+# 慢查询配置
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+
+# 形如 "SCAN memory_cards" 的计划行表示全表扫描；使用覆盖索引的扫描不算
+FULL_SCAN_PATTERN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?!.*\bINDEX\b)")
+
+registry.describe("slow_queries_total", "counter", "超过阈值的 SQL 语句数")
+registry.describe("slow_query_full_scans_total", "counter", "慢查询中出现全表扫描的次数")
+
+def _format_parameters(parameters: Any, limit: int = 500) -> str:
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+class SlowQueryLog:
+    """保存最近 N 条慢查询，并异步补充执行计划"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, size: int = SLOW_QUERY_LOG_SIZE):
+        self.threshold_ms = threshold_ms
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+
+    def maybe_record(self, engine, statement: str, parameters: Any, duration: float, executemany: bool):
+        """数据库钩子调用：语句耗时超过阈值时记录"""
+        duration_ms = duration * 1000
+        if duration_ms < self.threshold_ms or statement.lstrip().upper().startswith(("EXPLAIN", "PRAGMA")):
+            return
+
+        stats = current_request()
+        route = stats.route if stats is not None else "background"
+        entry = {
+            "id": next(self._ids),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "route": route,
+            "path": stats.path if stats is not None else None,
+            "statement": statement,
+            "parameters": _format_parameters(parameters),
+            "duration_ms": round(duration_ms, 2),
+            "plan": None,
+            "full_scan_tables": [],
+        }
+        with self._lock:
+            self._entries.append(entry)
+
+        registry.inc("slow_queries_total", {"route": route})
+        logger.warning(
+            "慢查询 %.1fms [%s] %s 参数=%s",
+            duration_ms, route, statement, entry["parameters"],
+        )
+
+        # executemany 的参数是列表，无法直接用于 EXPLAIN
+        if not executemany:
+            self._executor.submit(self._explain, engine, entry, statement, parameters)
+
+    def _explain(self, engine, entry: Dict[str, Any], statement: str, parameters: Any):
+        """在独立连接上执行 EXPLAIN QUERY PLAN，不占用请求的连接"""
+        try:
+            with engine.connect() as conn:
+                rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+        except Exception as e:
+            entry["plan"] = [f"EXPLAIN 失败: {e}"]
+            return
+
+        plan = [row[-1] for row in rows]
+        full_scans = []
+        for detail in plan:
+            match = FULL_SCAN_PATTERN.match(detail)
+            if match:
+                full_scans.append(match.group(1))
+                registry.inc("slow_query_full_scans_total", {"table": match.group(1)})
+
+        entry["plan"] = plan
+        entry["full_scan_tables"] = full_scans
+        if full_scans:
+            logger.warning("慢查询 #%d 存在全表扫描: %s", entry["id"], ", ".join(full_scans))
+
+    def entries(self, limit: Optional[int] = None, full_scan_only: bool = False) -> List[Dict[str, Any]]:
+        """按时间倒序返回记录"""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        if full_scan_only:
+            entries = [entry for entry in entries if entry["full_scan_tables"]]
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+slow_query_log = SlowQueryLog()
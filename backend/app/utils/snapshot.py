@@ -0,0 +1,253 @@
+"""
+分析快照 - 统计查询读取定期复制的只读副本，与抽题等写入路径隔离
+
+开启后（ANALYTICS_SNAPSHOT_ENABLED），后台线程每隔 ANALYTICS_SNAPSHOT_INTERVAL 秒用
+SQLite 在线备份 API 把数据库复制到快照文件。复制按 ANALYTICS_SNAPSHOT_PAGES 页一步进行，
+步与步之间释放读锁，写入方最多只需等待一步的时间。复制期间其他连接有写入时 SQLite 会
+从头重新复制；重新开始超过 ANALYTICS_SNAPSHOT_MAX_RESTARTS 次时，最后一次整体复制。
+
+统计接口通过 get_analytics_db 取得会话：快照年龄在允许的陈旧度以内（默认
+ANALYTICS_SNAPSHOT_MAX_STALENESS 秒，可用查询参数 max_staleness 调整，0 表示必须读主库）
+时读快照，否则回退到主库。响应头 X-Data-Source 标明数据来源，X-Snapshot-Age 为快照年龄（秒）。
+
+分片模式下目录库和每个分片各有一份快照，年龄按最旧的一份计算。
+每个工作进程维护自己的快照，文件名中带进程号。
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+from fastapi import Query, Request, Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .database import (
+    DATABASE_DIR, SHARD_COUNT, SHARED_SESSION_SCOPE_KEY, SessionLocal, all_engines, after_cursor_execute,
+    before_cursor_execute, route_request,
+)
+from .deadline import install_progress_handler
+from .metrics import registry
+from .sharding import ShardedSession
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_SNAPSHOT_ENABLED = os.getenv("ANALYTICS_SNAPSHOT_ENABLED", "false").lower() in ("1", "true", "yes")
+ANALYTICS_SNAPSHOT_INTERVAL = float(os.getenv("ANALYTICS_SNAPSHOT_INTERVAL", "60"))
+ANALYTICS_SNAPSHOT_MAX_STALENESS = float(os.getenv("ANALYTICS_SNAPSHOT_MAX_STALENESS", "120"))
+ANALYTICS_SNAPSHOT_DIR = Path(os.getenv("ANALYTICS_SNAPSHOT_DIR", str(DATABASE_DIR / "snapshots")))
+# 每步复制的页数，以及步与步之间让出的时间（毫秒）
+ANALYTICS_SNAPSHOT_PAGES = int(os.getenv("ANALYTICS_SNAPSHOT_PAGES", "256"))
+ANALYTICS_SNAPSHOT_STEP_SLEEP_MS = float(os.getenv("ANALYTICS_SNAPSHOT_STEP_SLEEP_MS", "1"))
+ANALYTICS_SNAPSHOT_MAX_RESTARTS = int(os.getenv("ANALYTICS_SNAPSHOT_MAX_RESTARTS", "3"))
+
+# Session.info 中记录数据来源的键："live" 或 "snapshot:<快照代数>"，
+# 同一份快照上的查询结果才能共享缓存
+ANALYTICS_SOURCE_KEY = "analytics_source"
+
+registry.describe("analytics_snapshots_total", "counter", "完成的分析快照次数")
+registry.describe("analytics_snapshot_failures_total", "counter", "失败的分析快照次数")
+registry.describe("analytics_snapshot_restarts_total", "counter", "因复制期间有写入而重新开始的备份次数")
+registry.describe(
+    "analytics_snapshot_duration_seconds", "histogram", "一轮分析快照的耗时",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60),
+)
+registry.describe("analytics_reads_total", "counter", "统计请求按数据来源（snapshot/live）的次数")
+
+class _Restarted(Exception):
+    """备份因源库被写入而重新开始的次数超过上限"""
+
+def _sqlite_path(bind: Engine) -> Optional[str]:
+    """文件型 SQLite 库的路径，其他数据库（或内存库）返回 None"""
+    if bind.dialect.name != "sqlite":
+        return None
+    database = bind.url.database
+    if not database or database == ":memory:" or database.startswith("file:"):
+        return None
+    return database
+
+def backup_database(source_path: str, target_path: Path, pages: int = ANALYTICS_SNAPSHOT_PAGES) -> int:
+    """
+    用在线备份 API 把 source_path 复制到 target_path，返回重新开始的次数
+
+    pages 页为一步，每步之后让出 ANALYTICS_SNAPSHOT_STEP_SLEEP_MS 毫秒。源库使用不带忙等待的
+    专用连接：写入方持有锁时立即返回 SQLITE_BUSY，同样只等待这么久再重试，不会在忙等待中
+    与写入方争抢锁。
+    """
+    sleep = ANALYTICS_SNAPSHOT_STEP_SLEEP_MS / 1000
+    source = sqlite3.connect(source_path, timeout=0)
+    target = sqlite3.connect(str(target_path))
+    restarts = 0
+    try:
+        last_remaining = [None]
+
+        def progress(status, remaining, total):
+            nonlocal restarts
+            # 剩余页数变多说明源库被其他连接写入，备份从头开始
+            if last_remaining[0] is not None and remaining > last_remaining[0]:
+                restarts += 1
+                if restarts > ANALYTICS_SNAPSHOT_MAX_RESTARTS:
+                    raise _Restarted()
+            last_remaining[0] = remaining
+            if remaining and sleep:
+                time.sleep(sleep)
+
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except _Restarted:
+            # 写入频繁时分步复制追不上，整体复制一次（期间持有读锁）
+            source.backup(target, pages=-1, sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+    return restarts
+
+class SnapshotManager:
+    """维护各数据库的最新快照，后台线程定期刷新"""
+
+    def __init__(self, sources: List[Engine], directory: Path = ANALYTICS_SNAPSHOT_DIR):
+        self.sources = sources
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._generation = 0
+        # 当前快照：(各库对应的只读引擎, 开始复制的时间)；数据不早于开始复制时的状态
+        self._current: Optional[Tuple[List[Engine], float]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def supported(self) -> bool:
+        return all(_sqlite_path(source) for source in self.sources)
+
+    def start(self, interval: float = ANALYTICS_SNAPSHOT_INTERVAL):
+        if not self.supported:
+            logger.warning("分析快照只支持文件型 SQLite 数据库，未启用")
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="analytics-snapshot", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout=5)
+        with self._lock:
+            current, self._current = self._current, None
+        if current is not None:
+            for snapshot_engine in current[0]:
+                snapshot_engine.dispose()
+        self._remove_files(keep=None)
+
+    def _loop(self, interval: float):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                registry.inc("analytics_snapshot_failures_total")
+                logger.exception("分析快照失败")
+            self._stop.wait(interval)
+
+    def _path(self, index: int, generation: int) -> Path:
+        name = "catalog" if index == 0 else f"shard_{index - 1}"
+        return self.directory / f"{name}.{os.getpid()}.{generation}.db"
+
+    def _remove_files(self, keep: Optional[int]):
+        """删除本进程不再使用的快照文件（仍被打开的文件在 Windows 上删除失败，下次再试）"""
+        for path in self.directory.glob(f"*.{os.getpid()}.*.db"):
+            if keep is not None and path.name.endswith(f".{keep}.db"):
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def refresh(self):
+        """复制一轮快照，完成后替换当前快照"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        generation = self._generation + 1
+        started = time.monotonic()
+        restarts = 0
+        snapshot_engines = []
+        for index, source in enumerate(self.sources):
+            path = self._path(index, generation)
+            restarts += backup_database(_sqlite_path(source), path)
+            snapshot_engine = create_engine(
+                f"sqlite:///file:{path.as_posix()}?mode=ro&uri=true",
+                connect_args={"check_same_thread": False},
+            )
+            event.listen(snapshot_engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(snapshot_engine, "after_cursor_execute", after_cursor_execute)
+            install_progress_handler(snapshot_engine)
+            snapshot_engines.append(snapshot_engine)
+
+        with self._lock:
+            self._generation = generation
+            previous, self._current = self._current, (snapshot_engines, started)
+        # 进行中的请求仍持有旧连接，dispose 只关闭空闲连接，旧连接归还时关闭
+        if previous is not None:
+            for snapshot_engine in previous[0]:
+                snapshot_engine.dispose()
+        self._remove_files(keep=generation)
+
+        registry.inc("analytics_snapshots_total")
+        registry.inc("analytics_snapshot_restarts_total", value=restarts)
+        registry.observe("analytics_snapshot_duration_seconds", time.monotonic() - started)
+
+    def current(self) -> Tuple[Optional[List[Engine]], Optional[float], int]:
+        """当前快照的引擎列表、年龄（秒）和代数，没有快照时为 (None, None, 0)"""
+        with self._lock:
+            current, generation = self._current, self._generation
+        if current is None:
+            return None, None, 0
+        snapshot_engines, taken_at = current
+        return snapshot_engines, time.monotonic() - taken_at, generation
+
+    def session(self, max_staleness: float) -> Tuple[Optional[Session], Optional[float]]:
+        """年龄不超过 max_staleness 秒的快照会话；没有合适的快照时返回 (None, 年龄)"""
+        snapshot_engines, age, generation = self.current()
+        if snapshot_engines is None or age > max_staleness:
+            return None, age
+        if SHARD_COUNT:
+            db = ShardedSession(bind=snapshot_engines[0], shard_engines=snapshot_engines[1:], autoflush=False)
+        else:
+            db = Session(bind=snapshot_engines[0], autoflush=False)
+        db.info[ANALYTICS_SOURCE_KEY] = f"snapshot:{generation}"
+        return db, age
+
+snapshot_manager = SnapshotManager(all_engines)
+
+def get_analytics_db(
+    request: Request,
+    response: Response,
+    max_staleness: Optional[float] = Query(
+        None, ge=0, description="允许读取的快照最大年龄（秒），0 表示必须读主库"
+    ),
+):
+    """统计接口的数据库依赖：快照足够新时读快照，否则读主库"""
+    bound = ANALYTICS_SNAPSHOT_MAX_STALENESS if max_staleness is None else max_staleness
+    db, age = (None, None)
+    if ANALYTICS_SNAPSHOT_ENABLED and bound > 0:
+        db, age = snapshot_manager.session(bound)
+    source = "snapshot" if db is not None else "live"
+    # 批量请求中读主库时使用批量请求共用的会话
+    shared = request.scope.get(SHARED_SESSION_SCOPE_KEY) if db is None else None
+    if db is None:
+        db = shared if shared is not None else SessionLocal()
+        db.info[ANALYTICS_SOURCE_KEY] = source
+    route_request(db, request)
+
+    registry.inc("analytics_reads_total", {"source": source})
+    response.headers["X-Data-Source"] = source
+    if source == "snapshot":
+        response.headers["X-Snapshot-Age"] = f"{age:.1f}"
+    try:
+        yield db
+    finally:
+        if db is not shared:
+            db.close()
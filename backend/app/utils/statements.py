@@ -0,0 +1,50 @@
+"""
+热点语句 - 模块级构造一次的参数化 select()，启动时预热编译缓存
+
+每次请求都执行的查询（认证用户、抽题设置、可抽取卡片、会话编号、统计计数）如果写成
+db.query(...)，每次调用都要重新构造 Query 和 Select 对象，再计算缓存键查找编译缓存。
+改为模块级的 select() 常量，参数用 bindparam 绑定：语句对象只构造一次，缓存键也随语句对象缓存，
+每次执行只剩绑定参数和取结果。
+
+登记的语句在启动时各执行一次（参数不会匹配到任何数据），填充各引擎的编译缓存，
+第一个请求不再承担编译开销。分片模式下每个分片库都会预热。
+
+用法：
+    _SETTINGS_BY_USER = hot_statement(
+        select(UserDrawSettings).where(UserDrawSettings.user_id == bindparam("user_id")).limit(1),
+        user_id=-1,
+    )
+    settings = db.execute(_SETTINGS_BY_USER, {"user_id": user_id}).scalar()
+"""
+
+import logging
+from typing import Any, Dict, List, Tuple
+from sqlalchemy.sql import Executable
+from .database import SHARD_COUNT, SessionLocal
+from .sharding import route_to_user
+
+logger = logging.getLogger(__name__)
+
+_hot_statements: List[Tuple[Executable, Dict[str, Any]]] = []
+
+def hot_statement(statement: Executable, **warm_params) -> Executable:
+    """登记热点语句；warm_params 为预热时使用的参数，应当不匹配任何数据（如 user_id=-1）"""
+    _hot_statements.append((statement, warm_params))
+    return statement
+
+def warm_statement_cache() -> int:
+    """在每个库上执行一次登记的语句，返回执行的语句数"""
+    executed = 0
+    for index in range(SHARD_COUNT) if SHARD_COUNT else [None]:
+        with SessionLocal() as db:
+            if index is not None:
+                # 负数用户ID路由到第 index 个分片，且不匹配任何数据
+                route_to_user(db, index - SHARD_COUNT)
+            for statement, params in _hot_statements:
+                try:
+                    db.execute(statement, params).all()
+                    executed += 1
+                except Exception:
+                    logger.exception("预热语句失败: %s", statement)
+                    db.rollback()
+    return executed
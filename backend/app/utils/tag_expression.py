@@ -0,0 +1,182 @@
+"""
+标签表达式 - 解析与按位图求值
+
+语法（关键字不区分大小写）：
+    grammar AND hard AND NOT retired
+    (grammar OR vocab) AND NOT tag:retired
+
+原子是标签名，也可以写成 tag:名称；AND 优先级高于 OR，NOT 最高。
+抽题设置 type_counts 中的键只有以 tag: 开头或整体包在括号中时才按表达式处理，
+其余的键（包括含空格或括号的，如 "Basic (and reversed card)"）仍是卡片类型。
+每个标签对应一个以卡片ID为位序号的整数位图，表达式通过整数按位运算求值，
+不需要知道用户全部卡片的集合：NOT 的结果记为“补集”，由调用方在筛选候选卡片时处理。
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple, Union
+
+# 标签名：不含空白、括号和冒号，最长 50 个字符
+TAG_PATTERN = re.compile(r"[^\s():]{1,50}")
+KEYWORDS = ("AND", "OR", "NOT")
+TAG_PREFIX = "tag:"
+
+_TOKEN = re.compile(r"\(|\)|[^\s()]+")
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+# 每个字节值中置位的位序号
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+# 语法树节点：("tag", 名称) / ("not", 子节点) / ("and", [子节点]) / ("or", [子节点])
+Node = Tuple[str, Union[str, "Node", List["Node"]]]
+
+class TagExpressionError(ValueError):
+    """标签名或标签表达式不合法"""
+
+def normalize_tag(name: str) -> str:
+    """校验并规范化标签名（去掉首尾空白）"""
+    tag = name.strip() if isinstance(name, str) else ""
+    if not TAG_PATTERN.fullmatch(tag) or tag.upper() in KEYWORDS:
+        raise TagExpressionError(f"无效的标签名: {name!r}")
+    return tag
+
+def is_tag_expression(key: str) -> bool:
+    """type_counts 的键是否为标签表达式：以 tag: 开头或整体包在括号中（否则按卡片类型处理）"""
+    key = key.strip()
+    return key.startswith(TAG_PREFIX) or (key.startswith("(") and key.endswith(")"))
+
+def check_type_counts(type_counts: Dict[str, int]):
+    """校验 type_counts 中作为标签表达式的键"""
+    for key in type_counts:
+        if is_tag_expression(key):
+            parse(key)
+
+def parse(expression: str) -> Node:
+    """解析标签表达式为语法树"""
+    tokens = _TOKEN.findall(expression)
+    if not tokens:
+        raise TagExpressionError("标签表达式为空")
+    position = 0
+
+    def peek() -> Optional[str]:
+        return tokens[position] if position < len(tokens) else None
+
+    def keyword(token: Optional[str]) -> Optional[str]:
+        return token.upper() if token is not None and token.upper() in KEYWORDS else None
+
+    def parse_or() -> Node:
+        nonlocal position
+        children = [parse_and()]
+        while keyword(peek()) == "OR":
+            position += 1
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def parse_and() -> Node:
+        nonlocal position
+        children = [parse_not()]
+        while keyword(peek()) == "AND":
+            position += 1
+            children.append(parse_not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def parse_not() -> Node:
+        nonlocal position
+        if keyword(peek()) == "NOT":
+            position += 1
+            return ("not", parse_not())
+        return parse_atom()
+
+    def parse_atom() -> Node:
+        nonlocal position
+        token = peek()
+        if token is None:
+            raise TagExpressionError(f"标签表达式不完整: {expression!r}")
+        position += 1
+        if token == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise TagExpressionError(f"缺少右括号: {expression!r}")
+            position += 1
+            return node
+        if token == ")" or keyword(token):
+            raise TagExpressionError(f"标签表达式中意外的 {token!r}: {expression!r}")
+        if token.startswith(TAG_PREFIX):
+            token = token[len(TAG_PREFIX):]
+        return ("tag", normalize_tag(token))
+
+    node = parse_or()
+    if position != len(tokens):
+        raise TagExpressionError(f"标签表达式中多余的 {tokens[position]!r}: {expression!r}")
+    return node
+
+class TagSelection:
+    """
+    表达式求值结果：卡片ID位图 bits，negated 为 True 时表示“不在 bits 中的卡片”
+
+    交、并、补按下面的规则计算，不需要全集：
+        A ∧ ¬B = A & ~B        ¬A ∧ ¬B = ¬(A | B)
+        A ∨ ¬B = ¬(B & ~A)     ¬A ∨ ¬B = ¬(A & B)
+    """
+
+    __slots__ = ("bits", "negated", "_bytes")
+
+    def __init__(self, bits: int, negated: bool = False):
+        self.bits = bits
+        self.negated = negated
+        self._bytes: Optional[bytes] = None
+
+    def __and__(self, other: "TagSelection") -> "TagSelection":
+        if not self.negated and not other.negated:
+            return TagSelection(self.bits & other.bits)
+        if self.negated and other.negated:
+            return TagSelection(self.bits | other.bits, True)
+        positive, negative = (other, self) if self.negated else (self, other)
+        return TagSelection(positive.bits & ~negative.bits)
+
+    def __or__(self, other: "TagSelection") -> "TagSelection":
+        if not self.negated and not other.negated:
+            return TagSelection(self.bits | other.bits)
+        if self.negated and other.negated:
+            return TagSelection(self.bits & other.bits, True)
+        positive, negative = (other, self) if self.negated else (self, other)
+        return TagSelection(negative.bits & ~positive.bits, True)
+
+    def __invert__(self) -> "TagSelection":
+        return TagSelection(self.bits, not self.negated)
+
+    def _as_bytes(self) -> bytes:
+        if self._bytes is None:
+            self._bytes = self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little")
+        return self._bytes
+
+    def contains(self, card_id: int) -> bool:
+        """O(1) 判断卡片是否被选中（按字节查表，避免对大整数移位）"""
+        data = self._as_bytes()
+        index = card_id >> 3
+        present = index < len(data) and ((data[index] >> (card_id & 7)) & 1) == 1
+        return present != self.negated
+
+    def count(self) -> int:
+        """bits 中的卡片数"""
+        return self.bits.bit_count()
+
+    def card_ids(self) -> List[int]:
+        """bits 中的卡片ID（升序），只扫描非零字节"""
+        data = self._as_bytes()
+        ids = []
+        for match in _NONZERO_BYTE.finditer(data):
+            base = match.start() * 8
+            ids.extend(base + bit for bit in _BYTE_BITS[data[match.start()]])
+        return ids
+
+def evaluate(node: Node, bitmaps: Dict[str, int]) -> TagSelection:
+    """按标签位图求值，不存在的标签视为空集"""
+    kind, value = node
+    if kind == "tag":
+        return TagSelection(bitmaps.get(value, 0))
+    if kind == "not":
+        return ~evaluate(value, bitmaps)
+    results = [evaluate(child, bitmaps) for child in value]
+    selection = results[0]
+    for result in results[1:]:
+        selection = selection & result if kind == "and" else selection | result
+    return selection
@@ -0,0 +1,107 @@
+"""
+近似重复检测基准测试 - LSH 分桶查找与逐一比较对比
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_duplicates
+    python -m benchmarks.bench_duplicates --cards 50000 --queries 200
+
+生成一个用户的 N 张随机词组卡片并建立索引，再构造若干查询内容：一半是已有卡片的
+轻微改写（替换一个词、加标点），一半是新内容。分别测量：
+- lsh: find_duplicates（按 (用户, 带, 桶) 查候选，再用签名确认）
+- scan: 读取用户全部签名后逐一比较（每次查询都扫描整个牌组）
+并输出 LSH 对改写内容的召回率、对新内容的误报数。
+"""
+
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models import Base, CardSignature, MemoryCard, User
+from app.services.duplicate_service import DUPLICATE_THRESHOLD, find_duplicates, index_cards
+from app.utils.minhash import signature, signature_from_bytes, similarity
+
+# 固定种子生成的伪词表（词汇量接近真实卡片，随机内容之间的特征重叠较少）
+_vocabulary = random.Random(0)
+WORDS = ["".join(_vocabulary.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(_vocabulary.randint(3, 9))) for _ in range(3000)]
+
+def sentence(rng: random.Random, length: int = 14) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+def rewrite(rng: random.Random, text: str) -> str:
+    """轻微改写：改动一个词的大小写和结尾标点"""
+    words = text.split()
+    position = rng.randrange(len(words))
+    words[position] = words[position].capitalize() + ","
+    return " ".join(words) + "."
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(bind=engine)
+        with SessionLocal() as db:
+            user = User(username="bench_dup", email="bench_dup@example.com", hashed_password="x")
+            db.add(user)
+            db.flush()
+            contents = [sentence(rng) for _ in range(args.cards)]
+            db.bulk_insert_mappings(MemoryCard, [
+                {"content": content, "card_type": "M", "owner": user.id, "appear_count": 0} for content in contents
+            ])
+            rows = db.query(MemoryCard.id, MemoryCard.content).filter(MemoryCard.owner == user.id).all()
+            start = time.perf_counter()
+            index_cards(db, user.id, dict(rows))
+            db.commit()
+            index_seconds = time.perf_counter() - start
+
+            sources = rng.sample(rows, args.queries // 2)
+            queries = [(rewrite(rng, content), card_id) for card_id, content in sources]
+            queries += [(sentence(rng), None) for _ in range(args.queries - len(queries))]
+
+            lsh_samples, scan_samples = [], []
+            found = false_positives = 0
+            for text, source_id in queries:
+                sig = signature(text)
+
+                start = time.perf_counter()
+                matches, _ = find_duplicates(db, user.id, [sig])[0]
+                lsh_samples.append((time.perf_counter() - start) * 1e3)
+
+                start = time.perf_counter()
+                scanned = [
+                    card_id for card_id, data in db.query(CardSignature.card_id, CardSignature.signature).filter(
+                        CardSignature.owner == user.id
+                    ) if similarity(sig, signature_from_bytes(data)) >= DUPLICATE_THRESHOLD
+                ]
+                scan_samples.append((time.perf_counter() - start) * 1e3)
+
+                if source_id is not None:
+                    found += source_id in matches
+                else:
+                    false_positives += bool(matches)
+                assert set(matches) <= set(scanned)
+        engine.dispose()
+
+    print(json.dumps({
+        "cards": args.cards,
+        "queries": len(queries),
+        "index_ms_per_card": round(index_seconds / args.cards * 1e3, 3),
+        "lsh": {"median_ms": round(statistics.median(lsh_samples), 2), "max_ms": round(max(lsh_samples), 2)},
+        "scan": {"median_ms": round(statistics.median(scan_samples), 2), "max_ms": round(max(scan_samples), 2)},
+        "recall": round(found / len(sources), 3),
+        "false_positive_queries": false_positives,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+组提交基准测试 - 对比并发写请求逐个提交与组提交的吞吐量
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_group_commit
+    python -m benchmarks.bench_group_commit --concurrency 1 4 8 --requests 200 --window-ms 5
+
+以固定并发度持续发送抽题和创建卡片请求，分别在关闭和开启组提交时测量吞吐量，
+输出 JSON。数据库为临时目录中按固定种子生成的 SQLite 文件。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+from .datagen import BENCH_PASSWORD, generate_dataset, spec_for_scale, username_for
+
+async def run_load(request: Callable[[int], object], total: int, concurrency: int) -> Dict[str, float]:
+    """以固定并发度发送 total 个请求"""
+    counter = iter(range(total))
+    latencies: List[float] = []
+
+    async def worker():
+        for i in counter:
+            begin = time.perf_counter()
+            response = await request(i)
+            latencies.append(time.perf_counter() - begin)
+            if response.status_code >= 400:
+                raise RuntimeError(f"请求失败 {response.status_code}: {response.text[:200]}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "throughput_rps": round(total / elapsed, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+    }
+
+async def bench(args) -> Dict[str, Dict[str, Dict[str, float]]]:
+    import httpx
+    from app.main import app
+    from app.utils.database import create_tables
+    from app.utils.group_commit import group_commit
+
+    create_tables()
+    group_commit.window = args.window_ms / 1000
+    users = args.users
+    transport = httpx.ASGITransport(app=app)
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        tokens = {}
+        for user_index in range(1, users + 1):
+            response = await client.post(
+                "/api/users/login", json={"username": username_for(user_index), "password": BENCH_PASSWORD}
+            )
+            response.raise_for_status()
+            tokens[user_index] = response.json()["access_token"]
+
+        scenarios = {
+            "draw": lambda i: client.post(f"/api/draw/?user_id={i % users + 1}", json={"type_counts": {"M": 3, "N": 2}}),
+            "card_create": lambda i: client.post(
+                "/api/cards/",
+                json={"content": f"group commit card {i}", "card_type": "M", "notes": None},
+                headers={"Authorization": f"Bearer {tokens[i % users + 1]}"},
+            ),
+        }
+        for name, request in scenarios.items():
+            for concurrency in args.concurrency:
+                for enabled in (False, True):
+                    group_commit.enabled = enabled
+                    label = f"{name}/c{concurrency}/{'group' if enabled else 'direct'}"
+                    results[label] = await run_load(request, args.requests, concurrency)
+                    print(f"{label}: {results[label]}", file=sys.stderr)
+    group_commit.shutdown()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", default="1k")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    spec = spec_for_scale(args.scale, args.users, 50, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = generate_dataset(Path(tmp) / "bench.db", spec)
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+        os.environ["HEAVY_CONCURRENCY_LIMIT"] = "0"
+        results = asyncio.run(bench(args))
+
+    print(json.dumps({"window_ms": args.window_ms, "requests": args.requests, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+排行榜基准测试 - 内存排名结构与 SQL 排序/计数对比
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_leaderboard
+    python -m benchmarks.bench_leaderboard --users 200000 --queries 500
+
+为 N 个用户写入本周抽题次数，分别测量：
+- index: LeaderboardIndex 的前 10 名和单个用户名次（增量刷新一次后全部在内存中）
+- sql: 对计数表 ORDER BY score DESC LIMIT 10，以及 COUNT(*) WHERE score > 用户分数
+以及每次更新一个用户的计数后刷新排名结构的耗时。
+"""
+
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from app.models import Base, LeaderboardEntry
+from app.services.leaderboard_service import LeaderboardIndex, record_draw, today, week_period
+
+def timed(samples, action):
+    start = time.perf_counter()
+    result = action()
+    samples.append((time.perf_counter() - start) * 1e3)
+    return result
+
+def summary(samples):
+    return {"median_ms": round(statistics.median(samples), 3), "max_ms": round(max(samples), 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    week = week_period(today())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(bind=engine)
+        with SessionLocal() as db:
+            db.bulk_insert_mappings(LeaderboardEntry, [
+                {"counter": "sessions", "period": week, "user_id": user_id,
+                 "score": int(rng.paretovariate(1.2)), "seq": user_id}
+                for user_id in range(1, args.users + 1)
+            ])
+            db.commit()
+
+            index = LeaderboardIndex()
+            start = time.perf_counter()
+            index.refresh(db)
+            load_seconds = time.perf_counter() - start
+
+            samples = {"index_top": [], "index_rank": [], "sql_top": [], "sql_rank": [], "update_refresh": []}
+            for _ in range(args.queries):
+                user_id = rng.randint(1, args.users)
+                expected = timed(samples["index_top"], lambda: index.top(db, "sessions_week", 10))
+                sql_top = timed(samples["sql_top"], lambda: db.query(LeaderboardEntry.user_id, LeaderboardEntry.score).filter(
+                    LeaderboardEntry.counter == "sessions", LeaderboardEntry.period == week, LeaderboardEntry.score > 0
+                ).order_by(LeaderboardEntry.score.desc(), LeaderboardEntry.user_id).limit(10).all())
+                assert [(user_id, score) for _, user_id, score in expected["entries"]] == [tuple(row) for row in sql_top]
+
+                rank = timed(samples["index_rank"], lambda: index.rank(db, "sessions_week", user_id))
+                score = db.query(LeaderboardEntry.score).filter(
+                    LeaderboardEntry.counter == "sessions", LeaderboardEntry.period == week,
+                    LeaderboardEntry.user_id == user_id,
+                ).scalar()
+                above = timed(samples["sql_rank"], lambda: db.query(func.count()).filter(
+                    LeaderboardEntry.counter == "sessions", LeaderboardEntry.period == week,
+                    LeaderboardEntry.score > score,
+                ).scalar())
+                assert rank["rank"] == above + 1
+
+                # 写入用独立会话（本基准的会话工厂没有应用中清除写入标记的提交钩子）
+                with SessionLocal() as writer:
+                    record_draw(writer, user_id, 5)
+                    writer.commit()
+                timed(samples["update_refresh"], lambda: index.refresh(db))
+        engine.dispose()
+
+    print(json.dumps({
+        "users": args.users,
+        "queries": args.queries,
+        "initial_load_ms": round(load_seconds * 1e3, 1),
+        **{name: summary(values) for name, values in samples.items()},
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
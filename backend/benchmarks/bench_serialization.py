@@ -0,0 +1,97 @@
+"""
+卡片列表序列化基准测试 - 对比默认路径与精简路径
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --sizes 100 1000 10000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models import Base, MemoryCard, User
+from app.schemas import MemoryCardResponse
+from app.utils.serialization import CARD_COLUMNS, card_list_response
+
+RESPONSE_FIELD = create_response_field(name="Response_list_cards", type_=List[MemoryCardResponse])
+
+def seed(db, count: int) -> int:
+    """写入指定数量的卡片，返回所属用户ID"""
+    user = User(username=f"bench_{count}", email=f"bench_{count}@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    db.bulk_insert_mappings(MemoryCard, [
+        {
+            "content": f"content {i} " + "lorem ipsum " * 8,
+            "card_type": "MN"[i % 2],
+            "notes": f"notes {i} " + "dolor sit amet " * 4,
+            "owner": user.id,
+            "appear_count": i % 7,
+            "last_appeared_session": i % 11 or None,
+        }
+        for i in range(count)
+    ])
+    db.commit()
+    return user.id
+
+def legacy_path(db, user_id: int) -> bytes:
+    """ORM 实体 -> response_model 校验 -> JSONResponse"""
+    cards = db.query(MemoryCard).filter(MemoryCard.owner == user_id).all()
+    content = asyncio.run(serialize_response(field=RESPONSE_FIELD, response_content=cards))
+    return JSONResponse(content).body
+
+def fast_path(db, user_id: int) -> bytes:
+    """列查询 -> 直接构造字典 -> FastJSONResponse"""
+    rows = db.query(*CARD_COLUMNS).filter(MemoryCard.owner == user_id).all()
+    return card_list_response(rows).body
+
+def measure(fn, db, user_id: int, repeat: int) -> float:
+    """返回多次执行的最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        db.expunge_all()
+        start = time.perf_counter()
+        fn(db, user_id)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(bind=engine)
+
+        results = []
+        for size in args.sizes:
+            with SessionLocal() as db:
+                user_id = seed(db, size)
+                # 两条路径输出的数据必须一致
+                assert json.loads(legacy_path(db, user_id)) == json.loads(fast_path(db, user_id))
+                legacy_ms = measure(legacy_path, db, user_id, args.repeat)
+                fast_ms = measure(fast_path, db, user_id, args.repeat)
+            results.append({
+                "cards": size,
+                "legacy_ms": round(legacy_ms, 2),
+                "fast_ms": round(fast_ms, 2),
+                "speedup": round(legacy_ms / fast_ms, 2) if fast_ms else None,
+            })
+        engine.dispose()
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
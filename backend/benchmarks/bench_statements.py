@@ -0,0 +1,143 @@
+"""
+热点语句基准测试 - 每次构造 db.query(...) 与模块级预编译语句对比
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_statements
+    python -m benchmarks.bench_statements --repeat 5000 --cards 50
+
+对每个热点查询分别执行旧写法（每次构造 Query）和 utils/statements.py 中登记的语句，
+测量每次调用的耗时，并用游标钩子扣除 SQLite 执行时间，得到 Python 侧开销（微秒）。
+数据量很小，结果主要反映语句构造、缓存键计算和结果处理的开销。
+最后按一次抽题请求（设置 + 会话编号 + 两种类型的可抽取卡片）和一次总览统计请求汇总节省的时间。
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import load_only, sessionmaker
+from app.dependencies.auth import USER_BY_USERNAME
+from app.models import Base, MemoryCard, Session as DrawSession, User, UserDrawSettings
+from app.services.draw_service import AVAILABLE_CARDS, LAST_SESSION_NUMBER, SETTINGS_BY_USER
+from app.services.stats_service import CARD_COUNTS, CARDS_BY_TYPE, SESSION_COUNTS
+
+def legacy_cases(db, user_id: int, username: str):
+    """改写前的查询写法"""
+    since = datetime.now(timezone.utc) - timedelta(days=7)
+    def overview():
+        db.query(MemoryCard).filter(MemoryCard.owner == user_id).count()
+        db.query(DrawSession).filter(DrawSession.user_id == user_id).count()
+        db.query(MemoryCard.card_type, func.count(MemoryCard.id).label("count")).filter(
+            MemoryCard.owner == user_id).group_by(MemoryCard.card_type).all()
+        db.query(MemoryCard).filter(MemoryCard.owner == user_id, MemoryCard.appear_count > 0).count()
+        db.query(DrawSession).filter(DrawSession.user_id == user_id, DrawSession.created_at >= since).count()
+    return {
+        "user_lookup": lambda: db.query(User).filter(User.username == username).first(),
+        "settings_lookup": lambda: db.query(UserDrawSettings).filter(UserDrawSettings.user_id == user_id).first(),
+        "next_session_number": lambda: db.query(DrawSession).order_by(DrawSession.session_number.desc()).first(),
+        "available_cards": lambda: db.query(MemoryCard).options(
+            load_only(MemoryCard.id, MemoryCard.owner, MemoryCard.card_type,
+                      MemoryCard.appear_count, MemoryCard.last_appeared_session)
+        ).filter(MemoryCard.owner == user_id).filter(
+            (MemoryCard.last_appeared_session.is_(None)) | (MemoryCard.last_appeared_session <= 8)
+        ).filter(MemoryCard.card_type == "M").all(),
+        "stats_overview": overview,
+    }
+
+def hot_cases(db, user_id: int, username: str):
+    """预编译语句写法"""
+    since = datetime.now(timezone.utc) - timedelta(days=7)
+    params = {"user_id": user_id, "since": since}
+    def overview():
+        db.execute(CARD_COUNTS, params).one()
+        db.execute(SESSION_COUNTS, params).one()
+        db.execute(CARDS_BY_TYPE, params).all()
+    return {
+        "user_lookup": lambda: db.execute(USER_BY_USERNAME, {"username": username}).scalar(),
+        "settings_lookup": lambda: db.execute(SETTINGS_BY_USER, {"user_id": user_id}).scalar(),
+        "next_session_number": lambda: db.execute(LAST_SESSION_NUMBER).scalar(),
+        "available_cards": lambda: db.execute(
+            AVAILABLE_CARDS, {"user_id": user_id, "min_session": 8, "card_type": "M"}
+        ).scalars().all(),
+        "stats_overview": overview,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+        sql_time = [0.0]
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info["bench_start"] = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            sql_time[0] += time.perf_counter() - conn.info["bench_start"]
+
+        SessionLocal = sessionmaker(bind=engine, autoflush=False)
+        with SessionLocal() as db:
+            user = User(username="bench_statements", email="bench_statements@example.com", hashed_password="x")
+            db.add(user)
+            db.flush()
+            db.add(UserDrawSettings(user_id=user.id, type_counts={"M": 3, "N": 2}, interval_count=2))
+            db.bulk_insert_mappings(MemoryCard, [
+                {"content": f"card {i}", "card_type": "MN"[i % 2], "owner": user.id,
+                 "appear_count": i % 3, "last_appeared_session": (i % 10) or None}
+                for i in range(args.cards)
+            ])
+            db.bulk_insert_mappings(DrawSession, [
+                {"user_id": user.id, "session_number": number + 1, "settings_used": {}}
+                for number in range(args.sessions)
+            ])
+            db.commit()
+
+            results = {}
+            cases = {"legacy": legacy_cases(db, user.id, user.username), "hot": hot_cases(db, user.id, user.username)}
+            for name in cases["legacy"]:
+                results[name] = {}
+                for variant in ("legacy", "hot"):
+                    action = cases[variant][name]
+                    for _ in range(50):
+                        action()
+                    db.expunge_all()
+                    totals, pythons = [], []
+                    for _ in range(args.repeat):
+                        sql_time[0] = 0.0
+                        start = time.perf_counter()
+                        action()
+                        elapsed = time.perf_counter() - start
+                        totals.append(elapsed * 1e6)
+                        pythons.append((elapsed - sql_time[0]) * 1e6)
+                    results[name][variant] = {
+                        "total_us": round(statistics.median(totals), 1),
+                        "python_us": round(statistics.median(pythons), 1),
+                    }
+                legacy, hot = results[name]["legacy"], results[name]["hot"]
+                results[name]["saved_python_us"] = round(legacy["python_us"] - hot["python_us"], 1)
+        engine.dispose()
+
+    saved = {name: result["saved_python_us"] for name, result in results.items()}
+    print(json.dumps({
+        "repeat": args.repeat,
+        "queries": results,
+        "saved_per_request_us": {
+            "auth": saved["user_lookup"],
+            "draw": round(saved["settings_lookup"] + saved["next_session_number"] + 2 * saved["available_cards"], 1),
+            "stats_overview": saved["stats_overview"],
+        },
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+标签表达式筛选基准测试 - 位图求值与 SQL 子查询对比
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_tags
+    python -m benchmarks.bench_tags --cards 100000 --repeat 50
+
+生成一个用户的 N 张卡片，按固定种子为每张卡片分配若干标签（各标签密度不同），
+分别测量：
+- bitmap: 在内存中的标签位图上按位求值（tag_index 命中后的路径）
+- bitmap+ids: 求值后再取出选中的卡片ID
+- sql: 用 card_tags 上的 EXISTS / NOT EXISTS 子查询在 SQLite 中求出卡片ID
+"""
+
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from sqlalchemy import and_, create_engine, exists, not_, or_
+from sqlalchemy.orm import sessionmaker
+from app.models import Base, CardTag, MemoryCard, User
+from app.services.tag_service import bits_from_ids
+from app.utils.tag_expression import evaluate, parse
+
+# 标签及其密度（拥有该标签的卡片比例）
+TAG_DENSITIES = {
+    "grammar": 0.3, "vocab": 0.4, "hard": 0.2, "easy": 0.25, "retired": 0.05,
+    "listening": 0.1, "n1": 0.02, "n2": 0.08, "kanji": 0.15, "review": 0.5,
+}
+
+EXPRESSIONS = [
+    "grammar",
+    "grammar AND hard AND NOT retired",
+    "(grammar OR vocab) AND NOT (retired OR easy)",
+    "NOT review",
+    "n1 AND kanji AND hard",
+]
+
+def seed(db, cards: int, seed_value: int) -> Tuple[int, Dict[str, List[int]]]:
+    """写入卡片和标签，返回 (用户ID, {标签: 卡片ID列表})"""
+    rng = random.Random(seed_value)
+    user = User(username="bench_tags", email="bench_tags@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    db.bulk_insert_mappings(MemoryCard, [
+        {"content": f"card {i}", "card_type": "MN"[i % 2], "owner": user.id, "appear_count": 0}
+        for i in range(cards)
+    ])
+    card_ids = [card_id for (card_id,) in db.query(MemoryCard.id).filter(MemoryCard.owner == user.id)]
+    tagged: Dict[str, List[int]] = {tag: [] for tag in TAG_DENSITIES}
+    for card_id in card_ids:
+        for tag, density in TAG_DENSITIES.items():
+            if rng.random() < density:
+                tagged[tag].append(card_id)
+    db.bulk_insert_mappings(CardTag, [
+        {"card_id": card_id, "tag": tag, "owner": user.id}
+        for tag, ids in tagged.items() for card_id in ids
+    ])
+    db.commit()
+    return user.id, tagged
+
+def sql_condition(node, owner: int):
+    """把表达式语法树转换为 card_tags 上的子查询条件"""
+    kind, value = node
+    if kind == "tag":
+        return exists().where(CardTag.card_id == MemoryCard.id, CardTag.owner == owner, CardTag.tag == value)
+    if kind == "not":
+        return not_(sql_condition(value, owner))
+    children = [sql_condition(child, owner) for child in value]
+    return and_(*children) if kind == "and" else or_(*children)
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """多次执行，返回中位数和最短耗时（微秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return {"median_us": round(statistics.median(samples), 1), "min_us": round(min(samples), 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(bind=engine)
+        with SessionLocal() as db:
+            owner, tagged = seed(db, args.cards, args.seed)
+            bitmaps = {tag: bits_from_ids(ids) for tag, ids in tagged.items()}
+
+            results = []
+            for expression in EXPRESSIONS:
+                node = parse(expression)
+                selection = evaluate(node, bitmaps)
+                condition = sql_condition(node, owner)
+
+                def run_sql():
+                    return [card_id for (card_id,) in db.query(MemoryCard.id).filter(MemoryCard.owner == owner, condition)]
+
+                def run_ids():
+                    result = evaluate(node, bitmaps)
+                    if result.negated:
+                        return [card_id for card_id in range(1, args.cards + 1) if result.contains(card_id)]
+                    return result.card_ids()
+
+                expected = run_sql()
+                assert sorted(run_ids()) == sorted(expected), expression
+                results.append({
+                    "expression": expression,
+                    "matched": len(expected),
+                    "negated": selection.negated,
+                    "bitmap": measure(lambda: evaluate(node, bitmaps), args.repeat),
+                    "bitmap+ids": measure(run_ids, max(3, args.repeat // 5)),
+                    "sql": measure(run_sql, max(3, args.repeat // 5)),
+                })
+        engine.dispose()
+
+    print(json.dumps({"cards": args.cards, "results": results}, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
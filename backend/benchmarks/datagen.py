@@ -0,0 +1,176 @@
+"""
+合成数据生成器 - 按固定随机种子生成 用户 × 卡片 × 会话 数据
+
+用法（在 backend 目录下）:
+    python -m benchmarks.datagen --scale 100k --output /tmp/bench.db
+
+相同的参数和种子总是生成完全相同的数据。为了在百万级规模下保持速度，
+这里直接使用 sqlite3 的 executemany 批量写入，而不是经过 ORM。
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, Tuple
+from sqlalchemy import create_engine
+from app.models import Base, make_content_preview
+from app.utils.auth import get_password_hash
+
+# 基准测试用户的统一密码（只计算一次哈希，避免生成时被 bcrypt 拖慢）
+BENCH_PASSWORD = "benchmark-password"
+
+# 预设规模：总卡片数
+SCALES = {
+    "1k": 1_000,
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+}
+
+CARD_TYPES = ("M", "N", "V", "G")
+WORDS = (
+    "memory", "recall", "interval", "grammar", "vocabulary", "review", "practice",
+    "concept", "example", "definition", "sentence", "translation", "context", "theory",
+)
+
+# 基准时间固定，保证生成结果与运行日期无关
+BASE_TIME = datetime(2026, 1, 1)
+BATCH_SIZE = 10_000
+
+@dataclass
+class DatasetSpec:
+    users: int = 10
+    cards: int = 1_000
+    sessions_per_user: int = 50
+    seed: int = 42
+
+    @property
+    def cards_per_user(self) -> int:
+        return max(1, self.cards // self.users)
+
+def spec_for_scale(scale: str, users: int = 10, sessions_per_user: int = 50, seed: int = 42) -> DatasetSpec:
+    """根据预设规模名称（或直接给出的卡片数）构造数据集参数"""
+    cards = SCALES[scale.lower()] if scale.lower() in SCALES else int(scale)
+    return DatasetSpec(users=users, cards=cards, sessions_per_user=sessions_per_user, seed=seed)
+
+def username_for(index: int) -> str:
+    return f"bench_user_{index}"
+
+def _timestamp(value: datetime) -> str:
+    """SQLAlchemy 在 SQLite 中保存 DateTime 的格式"""
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def _text(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+def _sessions(spec: DatasetSpec, rng: random.Random) -> Iterator[Tuple]:
+    session_number = 0
+    for user_id in range(1, spec.users + 1):
+        for i in range(spec.sessions_per_user):
+            session_number += 1
+            created_at = BASE_TIME + timedelta(minutes=session_number * 37 + rng.randint(0, 30))
+            settings_used = {
+                "type_counts": {card_type: rng.randint(1, 5) for card_type in CARD_TYPES[:2]},
+                "interval_count": 2,
+            }
+            yield (session_number, user_id, json.dumps(settings_used), _timestamp(created_at))
+
+def _cards(spec: DatasetSpec, rng: random.Random) -> Iterator[Tuple]:
+    change_seq = 0
+    for user_id in range(1, spec.users + 1):
+        # 与 _sessions 中的编号规则一致：每个用户的会话编号是连续区间
+        first_session = (user_id - 1) * spec.sessions_per_user + 1
+        last_session = user_id * spec.sessions_per_user
+        for i in range(spec.cards_per_user):
+            created_at = _timestamp(BASE_TIME + timedelta(seconds=i))
+            if spec.sessions_per_user and rng.random() < 0.6:
+                appear_count = rng.randint(1, 8)
+                last_appeared = rng.randint(first_session, last_session)
+            else:
+                appear_count = 0
+                last_appeared = None
+            notes = _text(rng, 5, 60) if rng.random() < 0.7 else None
+            content = _text(rng, 3, 20)
+            change_seq += 1
+            yield (
+                content, make_content_preview(content), rng.choice(CARD_TYPES), notes, user_id,
+                appear_count, last_appeared, change_seq, created_at, created_at,
+            )
+
+def _batched(rows: Iterator[Tuple], size: int = BATCH_SIZE) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def generate_dataset(path: Path, spec: DatasetSpec) -> Path:
+    """在指定路径生成数据库文件（已存在时覆盖）"""
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    rng = random.Random(spec.seed)
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+    created_at = _timestamp(BASE_TIME)
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executemany(
+            "INSERT INTO users (id, username, email, hashed_password, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (i, username_for(i), f"{username_for(i)}@example.com", hashed_password, created_at, created_at)
+                for i in range(1, spec.users + 1)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO user_draw_settings (user_id, type_counts, interval_count, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (i, json.dumps({"M": 3, "N": 2}), 2, created_at, created_at)
+                for i in range(1, spec.users + 1)
+            ],
+        )
+        for batch in _batched(_sessions(spec, rng)):
+            conn.executemany(
+                "INSERT INTO sessions (session_number, user_id, settings_used, created_at) VALUES (?, ?, ?, ?)",
+                batch,
+            )
+        for batch in _batched(_cards(spec, rng)):
+            conn.executemany(
+                "INSERT INTO memory_cards (content, content_preview, card_type, notes, owner, appear_count, "
+                "last_appeared_session, change_seq, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", default="1k", help="预设规模（1k/10k/100k/1m）或卡片总数")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--sessions-per-user", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, required=True)
+    args = parser.parse_args()
+
+    spec = spec_for_scale(args.scale, args.users, args.sessions_per_user, args.seed)
+    generate_dataset(args.output, spec)
+    print(json.dumps({"path": str(args.output), **spec.__dict__}))
+
+if __name__ == "__main__":
+    main()
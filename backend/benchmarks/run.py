@@ -0,0 +1,188 @@
+"""
+基准测试套件 - 在进程内驱动真实的 FastAPI 应用测量热点接口
+
+用法（在 backend 目录下）:
+    python -m benchmarks.run --scale 1k
+    python -m benchmarks.run --scale 100k --iterations 200 --output result.json
+    python -m benchmarks.run --scale 1k --only draw stats_overview
+    python -m benchmarks.run --scale 10k --shards 4
+
+每个场景输出吞吐量、p50/p99 延迟和每个请求的 SQL 语句数（JSON），
+可在不同提交之间对比。数据库为临时目录中按固定种子生成的 SQLite 文件。
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+from .datagen import BENCH_PASSWORD, generate_dataset, spec_for_scale, username_for
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """最近秩法求分位数"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+class Scenario:
+    def __init__(self, name: str, request: Callable[[int], object], iterations: int):
+        self.name = name
+        self.request = request
+        self.iterations = iterations
+
+def build_scenarios(client, spec, iterations: int) -> List[Scenario]:
+    """构造各热点接口的场景，用户按迭代序号轮换"""
+    tokens = {}
+    for user_index in range(1, spec.users + 1):
+        response = client.post("/api/users/login", json={"username": username_for(user_index), "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        tokens[user_index] = response.json()["access_token"]
+
+    def user_for(i: int) -> int:
+        return i % spec.users + 1
+
+    def auth(i: int) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {tokens[user_for(i)]}"}
+
+    def stats(path: str) -> Callable[[int], object]:
+        return lambda i: client.get(f"/api/stats/{path}/{user_for(i)}")
+
+    batch_cards = {"cards": [
+        {"content": f"benchmark card {n}", "card_type": "M", "notes": "benchmark notes"}
+        for n in range(50)
+    ]}
+
+    scenarios = [
+        # 登录以 bcrypt 为主，迭代次数单独压低
+        Scenario("login", lambda i: client.post(
+            "/api/users/login", json={"username": username_for(user_for(i)), "password": BENCH_PASSWORD}
+        ), max(1, iterations // 10)),
+        Scenario("draw", lambda i: client.post(
+            f"/api/draw/?user_id={user_for(i)}", json={"type_counts": {"M": 3, "N": 2}}
+        ), iterations),
+        Scenario("draw_statistics", lambda i: client.get(f"/api/draw/statistics/{user_for(i)}"), iterations),
+        Scenario("cards_list", lambda i: client.get("/api/cards/?limit=100", headers=auth(i)), iterations),
+        Scenario("cards_list_1000", lambda i: client.get("/api/cards/?limit=1000", headers=auth(i)), iterations),
+        Scenario("cards_list_by_type", lambda i: client.get("/api/cards/?card_type=V&limit=100", headers=auth(i)), iterations),
+        Scenario("cards_batch_create", lambda i: client.post("/api/cards/batch", json=batch_cards, headers=auth(i)), iterations),
+        Scenario("stats_overview", stats("overview"), iterations),
+        Scenario("stats_cards", stats("cards"), iterations),
+        Scenario("stats_sessions", stats("sessions"), iterations),
+        Scenario("stats_progress", stats("progress"), iterations),
+        Scenario("stats_recommendations", stats("recommendations"), iterations),
+        Scenario("stats_dashboard", stats("dashboard"), iterations),
+    ]
+    return scenarios
+
+def run_scenario(scenario: Scenario, query_counter: Dict[str, int], warmup: int) -> Dict[str, float]:
+    for i in range(warmup):
+        scenario.request(i)
+
+    latencies = []
+    query_counter["count"] = 0
+    started = time.perf_counter()
+    for i in range(scenario.iterations):
+        begin = time.perf_counter()
+        response = scenario.request(i)
+        latencies.append(time.perf_counter() - begin)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{scenario.name} 返回 {response.status_code}: {response.text[:200]}")
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "iterations": scenario.iterations,
+        "throughput_rps": round(scenario.iterations / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "queries_per_request": round(query_counter["count"] / scenario.iterations, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", default="1k", help="预设规模（1k/10k/100k/1m）或卡片总数")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--sessions-per-user", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="只运行指定名称的场景")
+    parser.add_argument("--shards", type=int, default=0, help="按用户分片的数据库个数（0 表示单库）")
+    parser.add_argument("--output", type=Path, help="结果写入文件（默认输出到标准输出）")
+    args = parser.parse_args()
+
+    spec = spec_for_scale(args.scale, args.users, args.sessions_per_user, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = generate_dataset(Path(tmp) / "bench.db", spec)
+        # 应用在导入时创建引擎，必须先设置数据库地址；基准测试需要关闭限流和并发上限
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+        os.environ.setdefault("HEAVY_CONCURRENCY_LIMIT", "0")
+        os.environ["SHARD_COUNT"] = str(args.shards)
+        os.environ["SHARD_URL_TEMPLATE"] = f"sqlite:///{Path(tmp)}/bench_shard_{{index}}.db"
+        if args.shards:
+            from app.utils.database import engine as catalog_engine
+            from app.utils.sharding import rebalance
+            rebalance(catalog_engine, 0, args.shards)
+        from fastapi.testclient import TestClient
+        from sqlalchemy import event
+        from app.main import app
+        from app.utils.database import all_engines
+
+        query_counter = {"count": 0}
+
+        def count_queries(conn, cursor, statement, parameters, context, executemany):
+            query_counter["count"] += 1
+
+        for engine in all_engines:
+            event.listen(engine, "after_cursor_execute", count_queries)
+
+        random.seed(args.seed)
+        results = {}
+        with TestClient(app) as client:
+            for scenario in build_scenarios(client, spec, args.iterations):
+                if args.only and scenario.name not in args.only:
+                    continue
+                results[scenario.name] = run_scenario(scenario, query_counter, args.warmup)
+                print(f"{scenario.name}: {results[scenario.name]}", file=sys.stderr)
+        for engine in all_engines:
+            engine.dispose()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset": spec.__dict__,
+            "iterations": args.iterations,
+            "shards": args.shards,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+分片模式路由检查 - 在分片模式下逐个调用全部接口，发现无法路由到分片的接口
+
+用法（在 backend 目录下）:
+    python -m benchmarks.shard_routes
+    python -m benchmarks.shard_routes --shards 4
+
+在临时目录中以分片模式启动应用，注册用户并准备卡片、会话和任务，然后按注册顺序调用
+每个接口的每个方法（删除类请求放在最后）。路径参数和请求体取自下面的示例；
+新增的接口缺少示例时同样视为失败，提醒补充。
+
+任何接口返回 5xx（例如访问分片表前没有确定用户而抛出 ShardRoutingError）时以非零状态码退出，可用于 CI。
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# 持续推送、不会自行结束的接口
+SKIPPED_PATHS = {"/api/events/{user_id}"}
+
+# 写接口的示例请求体：(方法, 路径) -> JSON
+SAMPLE_BODIES: Dict[tuple, Any] = {
+    ("POST", "/api/users/register"): {"username": "probe", "email": "probe@example.com", "password": "pw"},
+    ("POST", "/api/users/login"): {"username": "admin", "password": "pw"},
+    ("POST", "/api/cards/"): {"content": "路由检查卡片", "card_type": "M", "tags": ["probe"]},
+    ("POST", "/api/cards/batch"): {"cards": [{"content": "路由检查批量卡片", "card_type": "N"}]},
+    ("PUT", "/api/cards/{card_id}/tags"): {"tags": ["probe", "checked"]},
+    ("PUT", "/api/cards/{card_id}"): {"content": "路由检查卡片（已修改）"},
+    ("POST", "/api/settings/"): {"type_counts": {"M": 1, "N": 1}, "interval_count": 1},
+    ("PUT", "/api/settings/{user_id}"): {"interval_count": 2},
+    ("POST", "/api/draw/"): {},
+    ("POST", "/api/jobs/"): {"job_type": "rebuild_stats", "params": {}},
+    ("POST", "/api/batch"): {"requests": [
+        {"id": "cards", "method": "GET", "path": "/api/cards/"},
+        {"id": "draw", "method": "POST", "path": "/api/draw/?user_id={user_id}", "body": {}},
+    ]},
+}
+
+def _fill(template: Any, values: Dict[str, Any]) -> Any:
+    if isinstance(template, str):
+        return template.format(**values)
+    if isinstance(template, dict):
+        return {key: _fill(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        return [_fill(item, values) for item in template]
+    return template
+
+def check(shards: int) -> List[Dict[str, Any]]:
+    """调用全部接口，返回每次调用的结果"""
+    tmp = tempfile.mkdtemp(prefix="shard_routes_")
+    # 应用在导入时创建引擎，必须先设置数据库地址和分片配置
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/catalog.db"
+    os.environ["SHARD_COUNT"] = str(shards)
+    os.environ["SHARD_URL_TEMPLATE"] = f"sqlite:///{tmp}/shard_{{index}}.db"
+    os.environ["ADMIN_USERNAMES"] = "admin"
+    os.environ["JOB_RESULT_DIR"] = f"{tmp}/job_results"
+    os.environ["JOB_UPLOAD_DIR"] = f"{tmp}/job_uploads"
+    os.environ["PROFILE_DIR"] = f"{tmp}/profiles"
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from fastapi.routing import APIRoute
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    results: List[Dict[str, Any]] = []
+    with TestClient(app, raise_server_exceptions=False) as client:
+        # 两个用户落在不同分片上，避免碰巧都在默认分片而掩盖路由问题
+        tokens = []
+        for name in ("admin", "other"):
+            response = client.post(
+                "/api/users/register", json={"username": name, "email": f"{name}@example.com", "password": "pw"}
+            )
+            response.raise_for_status()
+            tokens.append((response.json()["user"]["id"], response.json()["access_token"]))
+        (user_id, token), _ = tokens
+        headers = {"Authorization": f"Bearer {token}"}
+
+        client.post(f"/api/settings/?user_id={user_id}", json=SAMPLE_BODIES[("POST", "/api/settings/")])
+        card_id = client.post("/api/cards/", json={"content": "示例卡片", "card_type": "M"}, headers=headers).json()["id"]
+        draw = client.post(f"/api/draw/?user_id={user_id}", json={}).json()
+        job_id = client.post("/api/jobs/", json=SAMPLE_BODIES[("POST", "/api/jobs/")], headers=headers).json()["id"]
+        values = {
+            "user_id": user_id, "card_id": card_id, "session_id": draw["session"]["id"],
+            "job_id": job_id, "board": "sessions_week", "profile_id": "missing",
+        }
+
+        routes = [route for route in app.routes if isinstance(route, APIRoute)]
+        calls = [(method, route) for route in routes for method in sorted(route.methods)]
+        calls.sort(key=lambda call: call[0] == "DELETE")
+        for method, route in calls:
+            if route.path in SKIPPED_PATHS:
+                continue
+            result: Dict[str, Any] = {"method": method, "path": route.path}
+            missing = [param.name for param in route.dependant.path_params if param.name not in values]
+            body: Optional[Any] = None
+            if route.body_field is not None:
+                body = SAMPLE_BODIES.get((method, route.path))
+                if body is None and route.path != "/api/cards/import/apkg":
+                    missing.append("请求体")
+            if missing:
+                result.update(status=None, error=f"缺少示例: {', '.join(missing)}")
+                results.append(result)
+                continue
+
+            url = route.path.format(**values)
+            query = {param.name: values[param.name] for param in route.dependant.query_params if param.name in values}
+            if route.path == "/api/cards/import/apkg":
+                response = client.post(url, params=query, content=b"not a zip", headers=headers)
+            else:
+                response = client.request(method, url, params=query, json=_fill(body, values), headers=headers)
+            result["status"] = response.status_code
+            if response.status_code >= 500:
+                result["error"] = response.text[:200]
+            results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="分片模式下调用全部接口，检查分片路由")
+    parser.add_argument("--shards", type=int, default=2, help="分片数（至少 2）")
+    args = parser.parse_args()
+
+    results = check(max(2, args.shards))
+    failures = [result for result in results if "error" in result]
+    print(json.dumps({"calls": len(results), "failures": failures}, ensure_ascii=False, indent=2))
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
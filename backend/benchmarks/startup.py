@@ -0,0 +1,110 @@
+"""
+启动耗时分析 - 导入耗时分解和启动预算检查
+
+用法（在 backend 目录下）:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --top 30 --budget-ms 1500
+
+在独立的子进程中测量（避免本进程已导入的模块影响结果）：
+- 导入耗时：python -X importtime 导入 app.main，按顶层包汇总，并列出自身耗时最多的模块
+- 启动耗时：导入 app.main 并执行 startup 事件，分别测量首次启动（新数据库，需要建表）
+  和再次启动（表结构指纹一致，跳过 create_all）
+
+再次启动的总耗时（导入 + startup）超过 --budget-ms 时以非零状态码退出，可用于 CI。
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# 默认启动预算（毫秒），可用环境变量覆盖
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+# 子进程中执行：测量导入和 startup 事件耗时，输出 JSON
+MEASURE_SCRIPT = """
+import asyncio, json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+asyncio.run(app.router.startup())
+ready = time.perf_counter()
+asyncio.run(app.router.shutdown())
+print(json.dumps({
+    "import_ms": round((imported - started) * 1000, 1),
+    "startup_ms": round((ready - imported) * 1000, 1),
+    "total_ms": round((ready - started) * 1000, 1),
+}))
+"""
+
+def _env(database_url: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = database_url
+    env["PYTHONPATH"] = str(BACKEND_DIR)
+    return env
+
+def import_breakdown(database_url: str, top: int) -> Dict[str, object]:
+    """解析 -X importtime 的输出（单位微秒）"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, env=_env(database_url), capture_output=True, text=True, check=True,
+    )
+    modules: List[Dict[str, object]] = []
+    by_package: Dict[str, int] = defaultdict(int)
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        modules.append({"module": name, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+        by_package[name.split(".")[0]] += int(self_us)
+
+    modules.sort(key=lambda m: m["self_ms"], reverse=True)
+    packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "total_ms": round(sum(by_package.values()) / 1000, 1),
+        "packages": {name: round(us / 1000, 1) for name, us in packages[:top]},
+        "modules": modules[:top],
+    }
+
+def measure_startup(database_url: str) -> Dict[str, float]:
+    completed = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT],
+        cwd=BACKEND_DIR, env=_env(database_url), capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=20, help="列出的包和模块数")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help="再次启动的耗时预算")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{Path(tmp) / 'startup.db'}"
+        first_boot = measure_startup(database_url)
+        warm_boot = measure_startup(database_url)
+        breakdown = import_breakdown(database_url, args.top)
+
+    within_budget = warm_boot["total_ms"] <= args.budget_ms
+    report = {
+        "first_boot": first_boot,
+        "warm_boot": warm_boot,
+        "budget_ms": args.budget_ms,
+        "within_budget": within_budget,
+        "imports": breakdown,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if not within_budget:
+        print(f"启动耗时 {warm_boot['total_ms']}ms 超出预算 {args.budget_ms}ms", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
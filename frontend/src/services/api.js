@@ -7,6 +7,8 @@
  * - /api/draw (draw.py)
  * - /api/settings (settings.py)
  * - /api/stats (stats.py)
+ * - /api/events (events.py)
+ * - /api/batch (batch.py)
  */
 
 // API 基础配置
@@ -33,23 +35,50 @@ function clearAuthToken() {
   localStorage.removeItem('auth_token')
 }
 
+// 网络错误时的最大重试次数（只用于带幂等键的写请求）和重试间隔
+const IDEMPOTENT_RETRIES = 2
+const RETRY_DELAY_MS = 500
+
+// 生成幂等键：每次用户操作生成一个，apiRequest 重试时复用同一个键，后端直接返回第一次的结果
+function createIdempotencyKey() {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID()
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+}
+
+// 发送请求；fetch 因网络错误失败时（请求可能已到达后端）最多重试 retries 次
+async function fetchWithRetry(url, config, retries) {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await fetch(url, config)
+    } catch (error) {
+      if (attempt >= retries) throw error
+      console.warn(`请求失败，第 ${attempt + 1} 次重试:`, url)
+      await new Promise(resolve => setTimeout(resolve, RETRY_DELAY_MS * (attempt + 1)))
+    }
+  }
+}
+
 // 基础 API 请求函数
+// options.retries: 网络错误时的重试次数，只应用于幂等的请求（GET 或带 Idempotency-Key 的写请求）
 async function apiRequest(endpoint, options = {}) {
   // endpoint 需以 /api/ 开头
   const url = `${API_BASE_URL}${endpoint}`
   const token = getAuthToken()
+  const { retries = 0, ...fetchOptions } = options
   
   const config = {
+    ...fetchOptions,
     headers: {
       'Content-Type': 'application/json',
       ...(token && { Authorization: `Bearer ${token}` }),
-      ...options.headers,
+      ...fetchOptions.headers,
     },
-    ...options,
   }
 
   try {
-    const response = await fetch(url, config)
+    const response = await fetchWithRetry(url, config, retries)
     let data
     try {
       data = await response.clone().json()
@@ -151,10 +180,12 @@ export const cardAPI = {
     }),
   }),
   
-  // 批量创建卡片 - POST /api/cards/batch
-  createCards: (cardsData) => apiRequest(`/api/cards/batch`, {
+  // 批量创建卡片 - POST /api/cards/batch（每次调用为一次操作，网络错误重试时复用同一个幂等键）
+  createCards: (cardsData, idempotencyKey = createIdempotencyKey()) => apiRequest(`/api/cards/batch`, {
     method: 'POST',
+    headers: { 'Idempotency-Key': idempotencyKey },
     body: JSON.stringify(cardsData),
+    retries: IDEMPOTENT_RETRIES,
   }),
   
   // 更新卡片 - PUT /api/cards/{card_id}
@@ -175,10 +206,12 @@ export const cardAPI = {
 
 // 抽题相关 API - 对应 backend/app/routers/draw.py
 export const drawAPI = {
-  // 抽取卡片 - POST /api/draw
-  drawCards: (userId, drawData) => apiRequest(`/api/draw/?user_id=${userId}`, {
+  // 抽取卡片 - POST /api/draw（每次调用为一次操作，网络错误重试时复用同一个幂等键）
+  drawCards: (userId, drawData, idempotencyKey = createIdempotencyKey()) => apiRequest(`/api/draw/?user_id=${userId}`, {
     method: 'POST',
+    headers: { 'Idempotency-Key': idempotencyKey },
     body: JSON.stringify(drawData),
+    retries: IDEMPOTENT_RETRIES,
   }),
   
   // 获取抽题统计 - GET /api/draw/statistics/{user_id}
@@ -188,11 +221,12 @@ export const drawAPI = {
   getUserSessions: (userId, skip = 0, limit = 50) => 
     apiRequest(`/api/draw/sessions/${userId}?skip=${skip}&limit=${limit}`),
   
-  // 获取会话详情 - GET /api/draw/sessions/detail/{session_id}
-  getSessionDetail: (sessionId) => apiRequest(`/api/draw/sessions/detail/${sessionId}`),
+  // 获取会话详情 - GET /api/draw/sessions/detail/{session_id}?user_id={user_id}
+  getSessionDetail: (sessionId, userId) =>
+    apiRequest(`/api/draw/sessions/detail/${sessionId}?user_id=${userId}`),
   
-  // 删除会话 - DELETE /api/draw/sessions/{session_id}
-  deleteSession: (sessionId) => apiRequest(`/api/draw/sessions/${sessionId}`, {
+  // 删除会话 - DELETE /api/draw/sessions/{session_id}?user_id={user_id}
+  deleteSession: (sessionId, userId) => apiRequest(`/api/draw/sessions/${sessionId}?user_id=${userId}`, {
     method: 'DELETE',
   }),
   
@@ -249,6 +283,38 @@ export const statsAPI = {
   getDashboardData: (userId) => apiRequest(`/api/stats/dashboard/${userId}`),
 }
 
+// 实时事件 - 对应 backend/app/routers/events.py
+export const eventsAPI = {
+  // 订阅用户数据变更事件 - GET /api/events/{user_id}（Server-Sent Events）
+  // handlers: { cards_changed, session_created, progress_changed, resync }，返回取消订阅函数
+  subscribe: (userId, handlers = {}) => {
+    const source = new EventSource(`${API_BASE_URL}/api/events/${userId}`)
+    Object.entries(handlers).forEach(([type, handler]) => {
+      source.addEventListener(type, (event) => handler(JSON.parse(event.data).data))
+    })
+    return () => source.close()
+  },
+}
+
+// 批量请求 - 对应 backend/app/routers/batch.py
+export const batchAPI = {
+  // 一次往返执行多个子请求 - POST /api/batch
+  // requests: [{ id, method, path, body }]，parallel 为 true 时相邻的 GET 并发执行
+  // 返回 { id: 响应体 }；失败的子请求对应一个带 status 和 data 的 Error
+  run: (requests, parallel = true) => apiRequest('/api/batch', {
+    method: 'POST',
+    body: JSON.stringify({ requests, parallel }),
+  }).then(({ responses }) => Object.fromEntries(responses.map(({ id, status, body }) => {
+    if (status >= 400) {
+      const error = new Error(`HTTP error! status: ${status}`)
+      error.status = status
+      error.data = body
+      return [id, error]
+    }
+    return [id, body]
+  }))),
+}
+
 // 为了向后兼容，保留原有的练习API别名
 export const practiceAPI = {
   // 抽取卡片（别名）
@@ -273,6 +339,8 @@ export default {
   draw: drawAPI,
   settings: settingsAPI,
   stats: statsAPI,
+  events: eventsAPI,
+  batch: batchAPI,
   practice: practiceAPI, // 向后兼容
 }
 